@@ -0,0 +1,541 @@
+"""Graph algorithms over a GraphIndex.
+
+Functions work on node/edge positions of a GraphIndex (see graph_index.py) and are
+iterative (no recursion limits on deep networks). Optional `edge_mask` arguments
+are boolean arrays over edge positions, False for edges that must not be followed.
+"""
+
+from __future__ import annotations
+
+import heapq
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+from gww_gis_tools.trace_gis.graph_index import OFFSET_DTYPE, POSITION_DTYPE
+
+if TYPE_CHECKING:
+    from gww_gis_tools.trace_gis.graph_index import GraphIndex
+
+
+def strongly_connected_components(
+    index: GraphIndex,
+    roots: np.ndarray | None = None,
+    edge_mask: np.ndarray | None = None,
+) -> tuple[np.ndarray, int]:
+    """Label strongly connected components (iterative Tarjan, linear time).
+
+    Only nodes reachable from roots (default: all nodes) are labelled, others get -1.
+    Labels are in reverse topological order: every component reachable from
+    component c has a label lower than c, so sinks come first.
+
+    Returns (component label per node position, number of components).
+    """
+    n_nodes = index.n_nodes
+    offsets = memoryview(index.offsets)
+    targets = memoryview(index.targets)
+    allowed = memoryview(edge_mask.view(np.uint8)) if edge_mask is not None else None
+
+    order_array = np.full(n_nodes, -1, dtype=np.int64)
+    low_array = np.zeros(n_nodes, dtype=np.int64)
+    component_array = np.full(n_nodes, -1, dtype=POSITION_DTYPE)
+    order, low, component = memoryview(order_array), memoryview(low_array), memoryview(component_array)
+    on_stack = bytearray(n_nodes)
+    stack = []
+    counter = 0
+    n_components = 0
+
+    roots = range(n_nodes) if roots is None else np.asarray(roots).tolist()
+    for root in roots:
+        if order[root] != -1:
+            continue
+
+        order[root] = low[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack[root] = True
+        work = [(root, offsets[root])]
+
+        while work:
+            node, edge = work[-1]
+            end = offsets[node + 1]
+            child = -1
+            while edge < end:
+                if allowed is None or allowed[edge]:
+                    target = targets[edge]
+                    if order[target] == -1:
+                        child = target
+                        break
+                    if on_stack[target] and order[target] < low[node]:
+                        low[node] = order[target]
+                edge += 1
+
+            if child >= 0:
+                work[-1] = (node, edge + 1)
+                order[child] = low[child] = counter
+                counter += 1
+                stack.append(child)
+                on_stack[child] = True
+                work.append((child, offsets[child]))
+                continue
+
+            work.pop()
+            if work:
+                parent = work[-1][0]
+                if low[node] < low[parent]:
+                    low[parent] = low[node]
+
+            if low[node] == order[node]:
+                while True:
+                    member = stack.pop()
+                    on_stack[member] = False
+                    component[member] = n_components
+                    if member == node:
+                        break
+                n_components += 1
+
+    return component_array, n_components
+
+
+def condensation(
+    index: GraphIndex,
+    components: np.ndarray,
+    n_components: int,
+    edge_mask: np.ndarray | None = None,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Return CSR (offsets, targets) of edges between components (no duplicates)."""
+    sources = components[index.edge_sources]
+    targets = components[index.targets]
+    keep = (sources >= 0) & (targets >= 0) & (sources != targets)
+    if edge_mask is not None:
+        keep &= edge_mask
+
+    pairs = np.unique(sources[keep].astype(np.int64) * n_components + targets[keep])
+    offsets = np.zeros(n_components + 1, dtype=OFFSET_DTYPE)
+    np.cumsum(np.bincount(pairs // n_components, minlength=n_components), out=offsets[1:])
+    return offsets, (pairs % n_components).astype(POSITION_DTYPE)
+
+
+def reachability_summary(
+    index: GraphIndex,
+    roots: np.ndarray | None = None,
+    edge_mask: np.ndarray | None = None,
+    is_end: np.ndarray | None = None,
+) -> tuple[np.ndarray, np.ndarray, ReachableEnds]:
+    """Count reachable nodes and find end of path nodes for every node at once.
+
+    Strongly connected components are condensed and counts propagated from sinks
+    upwards. Node counts are exact: where paths split, the reachable components
+    are counted once each. `is_end` marks extra end of path nodes (e.g. stop
+    nodes), in addition to nodes without (allowed) edges.
+
+    Returns (component per node, node count per component, end of path node
+    positions per component (see ReachableEnds)). Nodes not reachable from roots
+    have component -1.
+    """
+    components, n_components = strongly_connected_components(index, roots, edge_mask)
+    cond_offsets, cond_targets = condensation(index, components, n_components, edge_mask)
+    sizes = np.bincount(components[components >= 0], minlength=n_components).tolist()
+
+    allowed_degree = index.degree if edge_mask is None else np.bincount(
+        index.edge_sources[edge_mask], minlength=index.n_nodes,
+    )
+    ends = (components >= 0) & (allowed_degree == 0)
+    if is_end is not None:
+        ends |= (components >= 0) & is_end
+
+    own_ends: dict[int, list] = {}
+    for node, comp in zip(np.flatnonzero(ends).tolist(), components[ends].tolist()):
+        own_ends.setdefault(comp, []).append(node)
+
+    counts = accumulate_components(cond_offsets, cond_targets, sizes)
+    return components, counts.astype(np.int64), ReachableEnds(cond_offsets, cond_targets, own_ends)
+
+
+class ReachableEnds:
+    """End of path node positions reachable from each component, found on request.
+
+    A set per component would take memory in proportion to node count times depth
+    (every split up a tree joins the sets of its branches), so ends are only
+    collected for the components asked for, by a search over the condensation.
+
+    Args:
+    ----
+    - cond_offsets, cond_targets: A condensation (see condensation).
+    - own_ends: Component to end of path node positions in it.
+
+    Attributes:
+    ----------
+    - shared: Component each component takes its ends from. Components on a chain
+        without end nodes of their own share the ends of the first component below
+        them that splits or has end nodes.
+
+    Methods:
+    -------
+    - ends[comp]: Frozenset of end of path node positions reachable from comp.
+    """
+
+    def __init__(self, cond_offsets: np.ndarray, cond_targets: np.ndarray, own_ends: dict[int, list]) -> None:
+        """Initialize ReachableEnds."""
+        self._offsets = cond_offsets.tolist()
+        self._successors = memoryview(cond_targets)
+        self._own_ends = own_ends
+
+        # labels are in reverse topological order: successors are always done first
+        shared = list(range(len(self._offsets) - 1))
+        for comp in shared:
+            start = self._offsets[comp]
+            if self._offsets[comp + 1] - start == 1 and comp not in own_ends:
+                shared[comp] = shared[self._successors[start]]
+        self.shared = shared
+
+    def __getitem__(self, comp: int) -> frozenset:
+        """Return end of path node positions reachable from comp."""
+        offsets, successors, shared = self._offsets, self._successors, self.shared
+        comp = shared[comp]
+        seen = {comp}
+        queue = [comp]
+        ends = []
+        while queue:
+            c = queue.pop()
+            ends.extend(self._own_ends.get(c, ()))
+            for s in successors[offsets[c]:offsets[c + 1]].tolist():
+                s = shared[s]  # noqa: PLW2901
+                if s not in seen:
+                    seen.add(s)
+                    queue.append(s)
+        return frozenset(ends)
+
+
+def accumulate_components(
+    cond_offsets: np.ndarray,
+    cond_targets: np.ndarray,
+    values: np.ndarray | list,
+    how: str = 'sum',
+) -> np.ndarray:
+    """Aggregate values over every component reachable from each component.
+
+    cond_offsets/cond_targets are a condensation (see condensation) with labels in
+    reverse topological order. how is 'sum', 'max' or 'min'. Sums are exact: where
+    paths rejoin, each reachable component is counted once.
+
+    One pass over the condensation: a component adds up its successors where what
+    they reach cannot overlap (a single successor, or subtrees). Only a split whose
+    paths rejoin below it searches what it reaches, stopping at subtrees.
+
+    Returns aggregate per component (own value included).
+    """
+    n_components = len(cond_offsets) - 1
+    offsets = cond_offsets.tolist()
+    successors = memoryview(cond_targets)
+    values = np.asarray(values).tolist()
+    totals = list(values)
+
+    if how in ('max', 'min'):
+        op = max if how == 'max' else min
+        for comp in range(n_components):
+            succ = successors[offsets[comp]:offsets[comp + 1]].tolist()
+            if succ:
+                totals[comp] = op(values[comp], *(totals[s] for s in succ))
+        return np.array(totals)
+    if how != 'sum':
+        msg = f"how must be 'sum', 'max' or 'min', not {how!r}"
+        raise ValueError(msg)
+
+    in_degree = np.bincount(cond_targets, minlength=n_components).tolist()
+    seen = [-1] * n_components
+    # a component is a tree if every component below it has a single parent, so
+    # nothing downstream of it can be reached along another path
+    tree = [False] * n_components
+
+    for comp in range(n_components):
+        succ = successors[offsets[comp]:offsets[comp + 1]].tolist()
+        if not succ:
+            tree[comp] = True
+            continue
+
+        if len(succ) == 1:
+            # what a single successor reaches cannot be reached any other way from comp
+            s = succ[0]
+            totals[comp] = values[comp] + totals[s]
+            tree[comp] = tree[s] and in_degree[s] == 1
+            continue
+
+        if all(tree[s] and in_degree[s] == 1 for s in succ):
+            totals[comp] = values[comp] + sum(totals[s] for s in succ)
+            tree[comp] = True
+            continue
+
+        # paths rejoin downstream: count each component once, stopping at trees
+        total = values[comp]
+        queue = succ
+        for s in succ:
+            seen[s] = comp
+        while queue:
+            s = queue.pop()
+            if tree[s]:
+                total += totals[s]
+                continue
+            total += values[s]
+            for t in successors[offsets[s]:offsets[s + 1]].tolist():
+                if seen[t] != comp:
+                    seen[t] = comp
+                    queue.append(t)
+        totals[comp] = total
+
+    return np.array(totals)
+
+
+def shortest_paths(
+    index: GraphIndex,
+    sources: np.ndarray,
+    edge_weights: np.ndarray,
+    is_target: np.ndarray | None = None,
+    edge_mask: np.ndarray | None = None,
+) -> tuple[np.ndarray, np.ndarray, int]:
+    """Shortest weighted paths from sources (Dijkstra with a binary heap).
+
+    With is_target, stops at the first (nearest) target node reached.
+    Weights must not be negative.
+
+    Returns (distance per node (inf where not reached), edge used to reach each node
+    (-1 for sources and nodes not reached), nearest target reached or -1).
+    """
+    if len(edge_weights) and edge_weights.min() < 0:
+        msg = 'edge weights must not be negative'
+        raise ValueError(msg)
+
+    offsets = memoryview(index.offsets)
+    targets = memoryview(index.targets)
+    weights = memoryview(np.ascontiguousarray(edge_weights, dtype=np.float64))
+    target = memoryview(is_target.view(np.uint8)) if is_target is not None else None
+    allowed = memoryview(edge_mask.view(np.uint8)) if edge_mask is not None else None
+
+    distance_array = np.full(index.n_nodes, np.inf)
+    edge_array = np.full(index.n_nodes, -1, dtype=np.int64)
+    distance, via_edge = memoryview(distance_array), memoryview(edge_array)
+    done = bytearray(index.n_nodes)
+
+    heap = []
+    for source in np.asarray(sources).tolist():
+        distance[source] = 0.0
+        heap.append((0.0, source))
+    heapq.heapify(heap)
+
+    while heap:
+        d, node = heapq.heappop(heap)
+        if done[node]:
+            continue
+        done[node] = True
+        if target is not None and target[node]:
+            return distance_array, edge_array, node
+
+        for edge in range(offsets[node], offsets[node + 1]):
+            if allowed is not None and not allowed[edge]:
+                continue
+            next_node = targets[edge]
+            next_d = d + weights[edge]
+            if next_d < distance[next_node]:
+                distance[next_node] = next_d
+                via_edge[next_node] = edge
+                heapq.heappush(heap, (next_d, next_node))
+
+    return distance_array, edge_array, -1
+
+
+def longest_paths(
+    index: GraphIndex,
+    edge_weights: np.ndarray,
+    roots: np.ndarray | None = None,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Longest weighted path from every node to a sink, in one pass.
+
+    Loops are condensed first (strongly connected components): nodes on a loop share
+    the loop's longest path out, travel around the loop is not counted. Components
+    are visited sinks first, so each is final before anything upstream of it.
+
+    Returns (component per node (-1 where not reachable from roots), longest path
+    length per component, edge leaving each component on its longest path (-1 for
+    sinks)).
+    """
+    components, n_components = strongly_connected_components(index, roots)
+    reached = np.flatnonzero(components >= 0)
+    order = reached[np.argsort(components[reached], kind='stable')].tolist()
+
+    offsets = memoryview(index.offsets)
+    targets = memoryview(index.targets)
+    weights = memoryview(np.ascontiguousarray(edge_weights, dtype=np.float64))
+    component = memoryview(components)
+    length_array = np.zeros(n_components)
+    exit_array = np.full(n_components, -1, dtype=np.int64)
+    length, exit_edge = memoryview(length_array), memoryview(exit_array)
+
+    for node in order:
+        comp = component[node]
+        for edge in range(offsets[node], offsets[node + 1]):
+            next_comp = component[targets[edge]]
+            if next_comp == comp:
+                continue
+            candidate = weights[edge] + length[next_comp]
+            if exit_edge[comp] < 0 or candidate > length[comp]:
+                length[comp] = candidate
+                exit_edge[comp] = edge
+
+    return components, length_array, exit_array
+
+
+def edge_path(index: GraphIndex, via_edge: np.ndarray, end: int) -> tuple[list, list]:
+    """Follow via_edge (edge used to reach each node) back from end.
+
+    Returns (node positions, edge positions) from the source to end.
+    """
+    nodes, edges = [end], []
+    edge = int(via_edge[end])
+    while edge >= 0:
+        edges.append(edge)
+        nodes.append(int(index.edge_sources[edge]))
+        edge = int(via_edge[nodes[-1]])
+    return nodes[::-1], edges[::-1]
+
+
+def breadth_first_tree(
+    index: GraphIndex,
+    source: int,
+    edge_mask: np.ndarray | None = None,
+    target: int = -1,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Breadth-first search from source, recording the edge used to reach each node.
+
+    Stops as soon as target is reached (paths found have the fewest edges).
+
+    Returns (edge used to reach each node (-1 for source and nodes not reached),
+    node positions reached, in order of distance from source).
+    """
+    offsets = memoryview(index.offsets)
+    targets = memoryview(index.targets)
+    allowed = memoryview(edge_mask.view(np.uint8)) if edge_mask is not None else None
+
+    edge_array = np.full(index.n_nodes, -1, dtype=np.int64)
+    via_edge = memoryview(edge_array)
+    seen = bytearray(index.n_nodes)
+    seen[source] = True
+    reached = [source]
+
+    position = 0
+    while position < len(reached) and source != target:
+        node = reached[position]
+        position += 1
+        for edge in range(offsets[node], offsets[node + 1]):
+            if allowed is not None and not allowed[edge]:
+                continue
+            next_node = targets[edge]
+            if not seen[next_node]:
+                seen[next_node] = True
+                via_edge[next_node] = edge
+                reached.append(next_node)
+                if next_node == target:
+                    return edge_array, np.array(reached, dtype=POSITION_DTYPE)
+
+    return edge_array, np.array(reached, dtype=POSITION_DTYPE)
+
+
+def propagate_labels(index: GraphIndex, labels: np.ndarray) -> np.ndarray:
+    """Spread labels from labelled nodes (label >= 0) to unlabelled nodes (-1).
+
+    Breadth-first from all labelled nodes at once, so each node takes the label of
+    the nearest labelled node (fewest edges) that reaches it. Nodes not reached
+    stay -1.
+
+    Returns labels per node (a copy).
+    """
+    offsets = memoryview(index.offsets)
+    targets = memoryview(index.targets)
+    label_array = np.array(labels, dtype=np.int64)
+    label = memoryview(label_array)
+
+    queue = np.flatnonzero(label_array >= 0).tolist()
+    position = 0
+    while position < len(queue):
+        node = queue[position]
+        position += 1
+        for next_node in targets[offsets[node]:offsets[node + 1]].tolist():
+            if label[next_node] < 0:
+                label[next_node] = label[node]
+                queue.append(next_node)
+
+    return label_array
+
+
+def frontier_levels(
+    index: GraphIndex,
+    sources: np.ndarray,
+    is_stop: np.ndarray | None = None,
+    edge_mask: np.ndarray | None = None,
+    max_depth: int | None = None,
+    max_pipes: int | None = None,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Breadth-first search from sources, expanding a whole frontier (level) at a time.
+
+    Level k holds the nodes first reached through k edges (level 0: sources), each
+    level expanded with array gathers over the index instead of a queue of nodes.
+    Stop nodes (is_stop) and nodes without allowed edges (edge_mask) are reached
+    but not expanded.
+
+    Stops before expanding level max_depth, or once max_pipes distinct pipes have
+    been traversed (the last level expanded only up to that pipe, in edge order).
+
+    Returns (node positions reached, in level order; level bounds, nodes of level
+    k being reached[node_bounds[k]:node_bounds[k + 1]]; edge positions traversed;
+    edge bounds per level expanded, likewise; end node positions (stop nodes and
+    nodes without allowed edges)).
+    """
+    seen = np.zeros(index.n_nodes, dtype=bool)
+    pipe_seen = np.zeros(index.n_pipes, dtype=bool)
+    frontier = np.unique(np.asarray(sources, dtype=np.intp))
+    seen[frontier] = True
+    levels, edges, ends = [frontier], [], []
+    n_pipes = 0
+
+    while len(frontier):
+        out = index.out_edges(frontier)
+        if edge_mask is not None:
+            out = out[edge_mask[out]]
+        stopped = is_stop[frontier] if is_stop is not None else np.zeros(len(frontier), dtype=bool)
+        ends.append(frontier[stopped | ~np.isin(frontier, index.edge_sources[out])])
+        if stopped.any():
+            out = out[~is_stop[index.edge_sources[out]]]
+        if (max_depth is not None and len(edges) >= max_depth) or (max_pipes is not None and n_pipes >= max_pipes):
+            break
+
+        pipes = index.edge_pipes[out]
+        is_new = ~pipe_seen[pipes]
+        is_new[is_new] = _first_occurrences(pipes[is_new])
+        if max_pipes is not None and n_pipes + np.count_nonzero(is_new) > max_pipes:
+            # cut the level at the edge bringing the last pipe allowed
+            cut = int(np.searchsorted(np.cumsum(is_new), max_pipes - n_pipes)) + 1
+            out, pipes, is_new = out[:cut], pipes[:cut], is_new[:cut]
+        pipe_seen[pipes] = True
+        n_pipes += int(np.count_nonzero(is_new))
+        edges.append(out)
+
+        next_nodes = index.targets[out]
+        frontier = np.unique(next_nodes[~seen[next_nodes]])
+        seen[frontier] = True
+        levels.append(frontier)
+
+    if not len(levels[-1]):
+        levels.pop()
+    return (
+        np.concatenate(levels or [np.empty(0, dtype=np.intp)]).astype(POSITION_DTYPE),
+        np.cumsum([0, *map(len, levels)]),
+        np.concatenate(edges or [np.empty(0, dtype=np.intp)]),
+        np.cumsum([0, *map(len, edges)]),
+        np.sort(np.concatenate(ends or [np.empty(0, dtype=np.intp)])).astype(POSITION_DTYPE),
+    )
+
+
+def _first_occurrences(values: np.ndarray) -> np.ndarray:
+    """Return a mask of the first occurrence of each value."""
+    is_first = np.zeros(len(values), dtype=bool)
+    is_first[np.unique(values, return_index=True)[1]] = True
+    return is_first
@@ -0,0 +1,293 @@
+"""Partition a Graph into outfall catchments, saved and loaded one catchment at a time.
+
+    write_catchments(g, 'network_catchments')
+    g_lazy = LazyGraph('network_catchments')
+    tr = Trace(g_lazy).trace('180058_CWW')  # loads only the catchments the trace enters
+
+Each node belongs to the catchment of its nearest outfall (node without pipes
+flowing out, or a loop nothing flows out of). Pipes joining two catchments (e.g.
+where flow splits) are kept in a small cross-catchment link table, loaded when
+both of their catchments are.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import json
+from collections import defaultdict
+from collections.abc import Iterable
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from gww_gis_tools.trace_gis.algorithms import (
+    condensation,
+    propagate_labels,
+    strongly_connected_components,
+)
+from gww_gis_tools.trace_gis.graph_index import AdjacencyView, GraphIndex, IdTable
+from gww_gis_tools.trace_gis.trace_sewer import DIRECTION, Graph
+
+with contextlib.suppress(ImportError):
+    from typing import Self
+
+MANIFEST = 'catchments.json'
+LINK_COLUMNS = ['PIPE_ID', 'START_NODE', 'END_NODE', 'START_CATCHMENT', 'END_CATCHMENT']
+
+
+def partition(graph: Graph) -> pd.Series:
+    """Return the outfall catchment of every node (index NODE_ID, values outfall node id).
+
+    A loop that nothing flows out of is an outfall too, named after one of its nodes.
+    """
+    index, codes, outfalls = _partition(graph)
+    return pd.Series(
+        np.array(outfalls, dtype=object)[codes],
+        index=index.node_ids.to_index().rename('NODE_ID'),
+        name='catchment',
+    )
+
+
+def cross_links(graph: Graph) -> pd.DataFrame:
+    """Return pipes joining two catchments (PIPE_ID, START_NODE, END_NODE and catchments)."""
+    index, codes, outfalls = _partition(graph)
+    links = _cross_links(index, codes)
+    outfall_labels = np.array(outfalls, dtype=object)
+    links['START_CATCHMENT'] = outfall_labels[links['START_CATCHMENT'].to_numpy()]
+    links['END_CATCHMENT'] = outfall_labels[links['END_CATCHMENT'].to_numpy()]
+    return links
+
+
+def write_catchments(graph: Graph, directory: str | Path) -> pd.DataFrame:
+    """Write every catchment to its own file in directory, for LazyGraph.
+
+    Also writes a manifest with the node to catchment lookup and the
+    cross-catchment link table. Returns a table of catchments (outfall,
+    node_count, pipe_count, file).
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    index, codes, outfalls = _partition(graph)
+    sources, targets = index.edge_sources, index.targets  # flow direction
+
+    edge_codes = codes[sources]
+    internal = edge_codes == codes[targets]
+    order = np.flatnonzero(internal)[np.argsort(edge_codes[internal], kind='stable')]
+    bounds = np.searchsorted(edge_codes[order], np.arange(len(outfalls) + 1))
+    node_counts = np.bincount(codes, minlength=len(outfalls)).tolist()
+
+    rows = []
+    for code, outfall in enumerate(outfalls):
+        edges = order[bounds[code]:bounds[code + 1]]
+        pipes = index.pipe_labels(index.edge_pipes[edges])
+        filename = f'catchment_{code}.json'
+        with (directory / filename).open('w') as f:
+            json.dump({
+                'START_NODE': index.node_labels(sources[edges]),
+                'END_NODE': index.node_labels(targets[edges]),
+                'PIPE_ID': pipes,
+                'QGIS_FID': [graph.qgis_fids.get(pipe) for pipe in pipes],
+            }, f)
+        rows.append((outfall, node_counts[code], len(pipes), filename))
+
+    catchments = pd.DataFrame(rows, columns=['outfall', 'node_count', 'pipe_count', 'file'])
+    links = _cross_links(index, codes)
+    with (directory / MANIFEST).open('w') as f:
+        json.dump({
+            'direction': graph.direction.value,
+            'catchments': catchments.to_dict(orient='list'),
+            'nodes': {'NODE_ID': index.node_labels(slice(None)), 'catchment': codes.tolist()},
+            'links': links.to_dict(orient='list'),
+        }, f)
+    return catchments
+
+
+def _partition(graph: Graph) -> tuple[GraphIndex, np.ndarray, list]:
+    """Return (downstream index, catchment code per node, outfall id per catchment)."""
+    index = graph.index_for(DIRECTION.D)
+    components, n_components = strongly_connected_components(index)
+    cond_offsets, _ = condensation(index, components, n_components)
+    is_sink = np.diff(cond_offsets) == 0
+
+    # one catchment per sink component, named after its first node
+    seeds = np.flatnonzero(is_sink[components])
+    sink_components, first = np.unique(components[seeds], return_index=True)
+    labels = np.full(n_components, -1, dtype=np.int64)
+    labels[sink_components] = np.arange(len(sink_components))
+    codes = propagate_labels(graph.index_for(DIRECTION.U), labels[components])
+    return index, codes, index.node_labels(seeds[first])
+
+
+def _cross_links(index: GraphIndex, codes: np.ndarray) -> pd.DataFrame:
+    """Return pipes of (downstream) index joining two catchments, catchments as codes."""
+    sources, targets = index.edge_sources, index.targets
+    edges = np.flatnonzero(codes[sources] != codes[targets])
+    return pd.DataFrame(
+        dict(zip(LINK_COLUMNS, [
+            index.pipe_labels(index.edge_pipes[edges]),
+            index.node_labels(sources[edges]),
+            index.node_labels(targets[edges]),
+            codes[sources[edges]].tolist(),
+            codes[targets[edges]].tolist(),
+        ])),
+        columns=LINK_COLUMNS,
+    )
+
+
+class LazyGraph(Graph):
+    """A Graph over catchments written by write_catchments, loaded as traces need them.
+
+    Tracing from a node loads its catchment and every catchment the trace can enter
+    through the cross-catchment links (in the trace direction), nothing else.
+    Read-only: correct it with a GraphOverlay, or copy it with to_graph().
+    Never bidirectional (reverse_nodes/reverse_pipes are empty): trace the other
+    way with Trace(g, direction=...), or use g.to_graph() of the loaded catchments.
+
+    Args:
+    ----
+    - directory: Directory written by write_catchments.
+    - direction: The direction of the graph (default: as written).
+
+    Attributes:
+    ----------
+    - catchments: Table of catchments (outfall, node_count, pipe_count, file).
+    - links: Cross-catchment link table (catchments as row numbers of catchments).
+    - loaded: Catchments loaded so far (row numbers of catchments).
+
+    Methods:
+    -------
+    - catchment_of(nodes): Catchment of each node, without loading anything.
+    - load(catchments): Loads catchments (row numbers).
+    - require(nodes, direction): Loads what a trace from nodes can reach.
+    - to_graph(): A new in-memory Graph of the loaded catchments.
+    """
+
+    def __init__(self, directory: str | Path, direction: DIRECTION | None = None) -> None:
+        """Initialise from the manifest, without loading any catchment."""
+        self.directory = Path(directory)
+        with (self.directory / MANIFEST).open() as f:
+            manifest = json.load(f)
+
+        self.direction = direction or DIRECTION(manifest['direction'])
+        self.catchments = pd.DataFrame(manifest['catchments'])
+        self.links = pd.DataFrame(manifest['links'], columns=LINK_COLUMNS)
+        node_codes, self._node_ids = IdTable.factorize(manifest['nodes']['NODE_ID'])
+        self._node_catchments = np.empty(len(self._node_ids), dtype=np.int64)
+        self._node_catchments[node_codes] = manifest['nodes']['catchment']
+
+        self.loaded: set[int] = set()
+        self._edges: list[pd.DataFrame] = []
+        self.qgis_fids: dict[int | str, int] = {}
+        self.qgis_parcel_fids = {}
+        self.node_attrs = self.pipe_attrs = self.parcels = None
+        self.version = 0
+        self.metrics = None
+        self._notifying = False
+        self._index: GraphIndex | None = None
+
+    def __repr__(self) -> str:
+        """Return a string representation of the graph."""
+        return f'LazyGraph({str(self.directory)!r}, loaded={len(self.loaded)}/{len(self.catchments.index)})'
+
+    @property
+    def index(self) -> GraphIndex:
+        """Index of the loaded catchments and the links between them."""
+        if self._index is None:
+            loaded = self.links['START_CATCHMENT'].isin(self.loaded) & self.links['END_CATCHMENT'].isin(self.loaded)
+            edges = pd.concat([*self._edges, self.links[loaded]], ignore_index=True)
+            sources, targets = edges['START_NODE'], edges['END_NODE']
+            if self.direction == DIRECTION.U:
+                sources, targets = targets, sources
+            self._index = GraphIndex.from_edges(sources, targets, edges['PIPE_ID'].to_numpy(dtype=object))
+        return self._index
+
+    @property
+    def nodes(self) -> AdjacencyView:
+        """Read-only view of adjacent nodes (as Graph.nodes)."""
+        return AdjacencyView(self.index, 'nodes')
+
+    @property
+    def pipes(self) -> AdjacencyView:
+        """Read-only view of adjacent pipes (as Graph.pipes)."""
+        return AdjacencyView(self.index, 'pipes')
+
+    @property
+    def bidirectional(self) -> bool:
+        """Lazy graphs hold one direction only."""
+        return False
+
+    @property
+    def reverse_nodes(self) -> defaultdict:
+        """Empty: lazy graphs hold one direction only (as Graph without bidirectional)."""
+        return defaultdict(list)
+
+    @property
+    def reverse_pipes(self) -> defaultdict:
+        """Empty: lazy graphs hold one direction only (as Graph without bidirectional)."""
+        return defaultdict(list)
+
+    @property
+    def is_compact(self) -> bool:
+        """Lazy graphs hold no adjacency dictionaries."""
+        return True
+
+    def compact(self) -> Self:
+        """Lazy graphs are always compact. Returns graph object."""
+        return self
+
+    def catchment_of(self, nodes: Iterable) -> np.ndarray:
+        """Return catchment (row number of catchments) of each node, -1 if unknown."""
+        positions = self._node_ids.positions(nodes)
+        return np.where(positions >= 0, self._node_catchments[positions], -1)
+
+    def require(self, nodes: Iterable | None, direction: DIRECTION) -> None:
+        """Load the catchments of nodes (None: all) and every catchment a trace can enter."""
+        if nodes is None:
+            self.load(range(len(self.catchments.index)))
+            return
+
+        start, end = self.links['START_CATCHMENT'].tolist(), self.links['END_CATCHMENT'].tolist()
+        if direction == DIRECTION.U:
+            start, end = end, start
+        entered: dict[int, set] = {}
+        for a, b in zip(start, end):
+            entered.setdefault(a, set()).add(b)
+
+        queue = [c for c in set(self.catchment_of(nodes).tolist()) if c >= 0]
+        needed = set(queue)
+        while queue:
+            for c in entered.get(queue.pop(), ()):
+                if c not in needed:
+                    needed.add(c)
+                    queue.append(c)
+        self.load(needed)
+
+    def load(self, catchments: Iterable[int]) -> Self:
+        """Load catchments (row numbers of catchments) not loaded yet. Returns graph object."""
+        new = sorted(set(catchments) - self.loaded)
+        for code in new:
+            with (self.directory / self.catchments['file'][code]).open() as f:
+                edges = pd.DataFrame(json.load(f))
+            self.qgis_fids.update(
+                (pipe, fid) for pipe, fid in zip(edges['PIPE_ID'], edges['QGIS_FID']) if fid is not None
+            )
+            self._edges.append(edges[['START_NODE', 'END_NODE', 'PIPE_ID']])
+            self.loaded.add(code)
+        if new:
+            self._index = None
+            self.version += 1
+        return self
+
+    def add_edge(self, *args, **kwargs) -> Self:  # noqa: ANN002, ANN003, ARG002
+        """Lazy graphs are read-only."""
+        msg = 'LazyGraph is read-only: use GraphOverlay(g) or g.to_graph()'
+        raise NotImplementedError(msg)
+
+    remove_edge = reverse_edge = _add_index = add_edge
+
+    def to_graph(self) -> Graph:
+        """Return a new in-memory (compact) Graph of the loaded catchments."""
+        g = Graph(self.direction)._add_index(self.index, compact=True)  # noqa: SLF001
+        g.qgis_fids = dict(self.qgis_fids)
+        return g
@@ -0,0 +1,169 @@
+"""Declarative conditions on node and pipe attributes.
+
+A Condition is evaluated once over a whole attribute column (vectorized), giving a
+boolean mask that traces consult instead of calling a Python predicate per node.
+
+    Condition.parse("NODE_REF startswith 'SPS'") | Condition('NODE_TYPE', '==', 'ERS')
+    Condition.parse('PIPE_DIA >= 300')
+"""
+
+from __future__ import annotations
+
+import ast
+import contextlib
+import operator
+import re
+from types import MappingProxyType
+
+import numpy as np
+import pandas as pd
+
+with contextlib.suppress(ImportError):
+    from typing import Any, Self
+
+COMPARISONS = MappingProxyType({
+    '==': operator.eq,
+    '!=': operator.ne,
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+})
+STRING_METHODS = ('startswith', 'endswith', 'contains')
+COMBINATIONS = ('and', 'or', 'not')
+
+_EXPRESSION = re.compile(
+    r'^\s*(?P<column>\w+)\s+'
+    r'(?P<op>==|!=|<=|>=|<|>|startswith|endswith|contains|not in|in|isna|notna)'
+    r'(?:\s+(?P<value>.+?))?\s*$',
+)
+
+
+class Condition:
+    """A test on one attribute column, or a combination of conditions.
+
+    Args:
+    ----
+    - column: Attribute column name (e.g. 'NODE_REF', 'PIPE_DIA').
+    - op: One of ==, !=, <, <=, >, >=, startswith, endswith, contains, in,
+        not in, isna, notna.
+    - value: Value to compare against (a collection for in/not in).
+
+    Combine with `&`, `|` and `~`. Rows with missing values do not match
+    (except for isna).
+
+    Methods:
+    -------
+    - parse(expression): Builds a Condition from e.g. "NODE_REF startswith 'SPS'".
+    - evaluate(frame): Returns a boolean array, one value per row of frame.
+    - columns: The attribute columns the condition refers to.
+    """
+
+    def __init__(self, column: str | None, op: str, value: Any = None) -> None:  # noqa: ANN401
+        """Initialise Condition."""
+        if op not in (*COMPARISONS, *STRING_METHODS, *COMBINATIONS, 'in', 'not in', 'isna', 'notna'):
+            msg = f'Unknown condition operator: {op!r}'
+            raise ValueError(msg)
+        self.column = column
+        self.op = op
+        self.value = value
+
+    @classmethod
+    def parse(cls, expression: str) -> Self:
+        """Build a Condition from '<column> <op> <python literal>'."""
+        match = _EXPRESSION.match(expression)
+        if match is None:
+            msg = f'Cannot parse condition: {expression!r}'
+            raise ValueError(msg)
+
+        value = match['value']
+        if match['op'] in ('isna', 'notna'):
+            if value is not None:
+                msg = f'{match["op"]} takes no value: {expression!r}'
+                raise ValueError(msg)
+        else:
+            try:
+                value = ast.literal_eval(value or '')
+            except (ValueError, SyntaxError) as e:
+                msg = f'Cannot parse condition value: {expression!r}'
+                raise ValueError(msg) from e
+        return cls(match['column'], match['op'], value)
+
+    @property
+    def columns(self) -> set[str]:
+        """Attribute columns the condition refers to."""
+        if self.op in COMBINATIONS:
+            return set().union(*(c.columns for c in self.value))
+        return {self.column}
+
+    def evaluate(self, frame: pd.DataFrame) -> np.ndarray:
+        """Evaluate the condition over every row of frame (vectorized)."""
+        if self.op == 'and':
+            return np.logical_and.reduce([c.evaluate(frame) for c in self.value])
+        if self.op == 'or':
+            return np.logical_or.reduce([c.evaluate(frame) for c in self.value])
+        if self.op == 'not':
+            return ~self.value[0].evaluate(frame)
+
+        if self.column not in frame.columns:
+            msg = f'Unknown attribute column: {self.column!r}'
+            raise KeyError(msg)
+        column = frame[self.column]
+
+        if self.op == 'isna':
+            result = column.isna()
+        elif self.op == 'notna':
+            result = column.notna()
+        elif self.op in ('in', 'not in'):
+            result = column.isin(list(self.value)) & column.notna()
+            if self.op == 'not in':
+                result = ~result & column.notna()
+        elif self.op in STRING_METHODS:
+            method = getattr(column.astype('string').str, self.op)
+            result = method(self.value, regex=False) if self.op == 'contains' else method(self.value)
+        else:
+            result = COMPARISONS[self.op](column, self.value)
+        return pd.Series(result).fillna(False).to_numpy(dtype=bool)  # noqa: FBT003
+
+    def __and__(self, other: Condition) -> Condition:
+        """Both conditions."""
+        return Condition(None, 'and', (self, other))
+
+    def __or__(self, other: Condition) -> Condition:
+        """Either condition."""
+        return Condition(None, 'or', (self, other))
+
+    def __invert__(self) -> Condition:
+        """Negated condition."""
+        return Condition(None, 'not', (self,))
+
+    def __eq__(self, other: object) -> bool:
+        """Conditions are equal if they test the same thing."""
+        if not isinstance(other, Condition):
+            return NotImplemented
+        return (self.column, self.op, self.value) == (other.column, other.op, other.value)
+
+    def __hash__(self) -> int:
+        """Hash conditions by what they test."""
+        value = self.value
+        if isinstance(value, (set, frozenset)):
+            value = frozenset(value)
+        elif isinstance(value, list):
+            value = tuple(value)
+        return hash((self.column, self.op, value))
+
+    def __repr__(self) -> str:
+        """Return string representation of Condition."""
+        if self.op == 'not':
+            return f'~({self.value[0]!r})'
+        if self.op in ('and', 'or'):
+            joiner = ' & ' if self.op == 'and' else ' | '
+            return '(' + joiner.join(repr(c) for c in self.value) + ')'
+        if self.op in ('isna', 'notna'):
+            return f'Condition({self.column} {self.op})'
+        return f'Condition({self.column} {self.op} {self.value!r})'
+
+
+def as_condition(condition: Condition | str) -> Condition:
+    """Return condition, parsing it first if it is a string expression."""
+    return Condition.parse(condition) if isinstance(condition, str) else condition
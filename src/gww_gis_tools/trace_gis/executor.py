@@ -0,0 +1,200 @@
+"""Run many traces across a process pool, every worker sharing one read-only graph.
+
+    jobs = [TraceJob(outfall, stop_node=assessed_nodes) for outfall in outfalls]
+    with TraceExecutor(g, max_workers=8) as executor:
+        for tr in executor.map(jobs, chunksize=32):
+            ...
+
+The graph is written once to a binary snapshot (see snapshot.py), which each
+worker memory-maps: its arrays are shared through the page cache, not pickled per
+task. Workers send back position arrays only, rebuilt into compact TraceResults
+(ids looked up on access) over the calling process's graph index.
+
+Stop conditions of jobs must be picklable: conditions, collections of node or
+pipe ids, or module-level functions (not lambdas).
+"""
+
+from __future__ import annotations
+
+import concurrent.futures
+import contextlib
+import tempfile
+from collections import namedtuple
+from collections.abc import Iterable, Iterator
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+from gww_gis_tools.trace_gis.graph_index import ExtendedIdTable
+from gww_gis_tools.trace_gis.snapshot import is_snapshot, read_snapshot, write_snapshot
+from gww_gis_tools.trace_gis.trace_sewer import Graph, Trace, TraceResult
+
+with contextlib.suppress(ImportError):
+    from typing import Self
+
+if TYPE_CHECKING:
+    import multiprocessing.context
+
+    import pandas as pd
+
+    from gww_gis_tools.trace_gis.graph_index import IdTable
+
+# a trace to run: start node(s), and the arguments of Trace for it
+TraceJob = namedtuple(  # noqa: PYI024
+    'TraceJob',
+    ['first_node', 'stop_node', 'stop_pipes', 'pipe_filter', 'direction', 'tag_sources'],
+    defaults=(None, (), None, None, False),
+)
+
+_graph: Graph | None = None  # the graph of a worker process
+
+
+class TraceExecutor:
+    """Runs TraceJobs in worker processes sharing a memory-mapped graph snapshot.
+
+    Args:
+    ----
+    - graph: The graph to trace (not changed while the executor runs).
+    - max_workers: Number of worker processes (default: number of CPUs).
+    - snapshot: Snapshot directory of graph to share (e.g. the one it was opened
+        from), or where to write one. Default: a temporary directory, removed on
+        shutdown. An existing snapshot must hold the same index as graph
+        (ValueError otherwise), as results are labelled with graph's ids.
+    - mp_context: Optional multiprocessing context (e.g. spawn).
+
+    Node and pipe attributes (for conditions) are sent once to each worker.
+
+    Methods:
+    -------
+    - map(jobs, chunksize): Results of jobs, in order, as they are ready.
+    - as_completed(jobs): (job, result) pairs, in order of completion.
+    - shutdown(): Stops the workers (also on leaving a with block).
+    """
+
+    def __init__(
+        self,
+        graph: Graph,
+        max_workers: int | None = None,
+        snapshot: str | Path | None = None,
+        mp_context: multiprocessing.context.BaseContext | None = None,
+    ) -> None:
+        """Write the snapshot (if needed) and start the process pool."""
+        self.graph = graph
+        self.version = graph.version
+        self._temporary = None
+        if snapshot is None:
+            self._temporary = tempfile.TemporaryDirectory(prefix='trace_executor_')
+            snapshot = Path(self._temporary.name) / 'graph'
+        if is_snapshot(snapshot):
+            _check_snapshot(graph, snapshot)
+        else:
+            write_snapshot(graph, snapshot)
+        self.snapshot = Path(snapshot)
+        self._pool = concurrent.futures.ProcessPoolExecutor(
+            max_workers=max_workers,
+            mp_context=mp_context,
+            initializer=_init_worker,
+            initargs=(str(self.snapshot), graph.node_attrs, graph.pipe_attrs),
+        )
+
+    def __enter__(self) -> Self:
+        """Return the executor."""
+        return self
+
+    def __exit__(self, *args: object) -> None:
+        """Shut the executor down."""
+        self.shutdown()
+
+    def map(self, jobs: Iterable[TraceJob | str | int], chunksize: int = 1) -> Iterator[TraceResult]:
+        """Yield the result of each job (a TraceJob, or start node(s)), in order.
+
+        Jobs are sent to the workers chunksize at a time: use larger chunks for
+        many small traces.
+        """
+        jobs = [self._job(job) for job in jobs]
+        for job, raw in zip(jobs, self._pool.map(_run_trace, jobs, chunksize=chunksize)):
+            yield self._result(job, raw)
+
+    def as_completed(self, jobs: Iterable[TraceJob | str | int]) -> Iterator[tuple[TraceJob, TraceResult]]:
+        """Yield (job, result) for each job as soon as its trace is done."""
+        futures = {}
+        for job in jobs:
+            job = self._job(job)  # noqa: PLW2901
+            futures[self._pool.submit(_run_trace, job)] = job
+        for future in concurrent.futures.as_completed(futures):
+            job = futures[future]
+            yield job, self._result(job, future.result())
+
+    def shutdown(self) -> None:
+        """Stop the worker processes and remove a temporary snapshot."""
+        self._pool.shutdown()
+        if self._temporary is not None:
+            self._temporary.cleanup()
+            self._temporary = None
+
+    def _job(self, job: TraceJob | str | int) -> TraceJob:
+        """Return job as a TraceJob (checking the graph has not changed)."""
+        if self.graph.version != self.version:
+            msg = 'Graph changed since the executor started: start a new TraceExecutor'
+            raise RuntimeError(msg)
+        return job if isinstance(job, TraceJob) else TraceJob(job)
+
+    def _result(self, job: TraceJob, raw: tuple) -> TraceResult:
+        """Return a compact result over the graph index from what a worker sent back."""
+        trace_summary, positions, extra_nodes, node_sources, pipe_sources = raw
+        index = self.graph.index_for(job.direction or self.graph.direction)
+        result = TraceResult.from_positions(trace_summary, index, *positions, extra_nodes=extra_nodes)
+        result.node_sources, result.pipe_sources = node_sources, pipe_sources
+        result.parcel_index = self.graph.parcels
+        return result
+
+
+def _check_snapshot(graph: Graph, snapshot: str | Path) -> None:
+    """Raise ValueError unless snapshot holds the same index (ids and edges) as graph."""
+    index, snapshot_graph = graph.index, read_snapshot(snapshot)
+    snapshot_index = snapshot_graph.index
+    same = (
+        snapshot_graph.direction == graph.direction
+        and (snapshot_index.n_nodes, snapshot_index.n_pipes, snapshot_index.n_edges)
+        == (index.n_nodes, index.n_pipes, index.n_edges)
+        and all(
+            np.array_equal(getattr(snapshot_index, name), getattr(index, name))
+            for name in ('offsets', 'targets', 'edge_pipes')
+        )
+        and _same_ids(snapshot_index.node_ids, index.node_ids)
+        and _same_ids(snapshot_index.pipe_ids, index.pipe_ids)
+    )
+    if not same:
+        msg = f'Snapshot {str(snapshot)!r} does not match the graph: write it again, or leave snapshot unset'
+        raise ValueError(msg)
+
+
+def _same_ids(a: IdTable, b: IdTable) -> bool:
+    """Return True if id tables hold the same ids in the same positions."""
+    if len(a) != len(b):
+        return False
+    if isinstance(a, ExtendedIdTable) or isinstance(b, ExtendedIdTable) or not (a.is_sorted_array and b.is_sorted_array):
+        return a.to_index().equals(b.to_index())
+    return bool(np.array_equal(a.values, b.values))
+
+
+def _init_worker(snapshot: str, node_attrs: pd.DataFrame | None, pipe_attrs: pd.DataFrame | None) -> None:
+    """Open the shared snapshot in a worker process."""
+    global _graph  # noqa: PLW0603
+    _graph = read_snapshot(snapshot)
+    _graph.node_attrs, _graph.pipe_attrs = node_attrs, pipe_attrs
+
+
+def _run_trace(job: TraceJob) -> tuple:
+    """Trace job in a worker, returning what is needed to rebuild the result."""
+    tracer = Trace(
+        _graph,
+        stop_node=job.stop_node,
+        stop_pipes=job.stop_pipes,
+        direction=job.direction,
+        pipe_filter=job.pipe_filter,
+        cache_size=0,
+    )
+    tr = tracer.trace(job.first_node, tag_sources=job.tag_sources, compact=True)
+    return tr.trace_summary, tr._positions, tr._extra_nodes, tr.node_sources, tr.pipe_sources  # noqa: SLF001
@@ -0,0 +1,215 @@
+"""Export trace results as tables: columnar files and GeoDataFrame subsets.
+
+    results = {outfall: tracer.trace(outfall) for outfall in outfalls}
+    write_traces(results, 'catchments.csv')  # or .parquet (needs pyarrow)
+    pipes_by_trace = join_traces(pipes_gdf, results)  # a row per pipe and trace, for QGIS
+    subset(pipes_gdf, results['38264_CWW'])  # pipes of one trace
+
+The trace table has a row per trace and pipe or node visited (trace, kind, id,
+source, end_of_path). Compact results of the same graph are labelled together, so
+thousands of traces export in one pass over their position arrays.
+"""
+
+from __future__ import annotations
+
+from collections.abc import Iterable, Mapping
+from pathlib import Path
+from typing import TYPE_CHECKING, Union
+
+import numpy as np
+import pandas as pd
+
+from gww_gis_tools.trace_gis.trace_sewer import TraceResult
+
+if TYPE_CHECKING:
+    from gww_gis_tools.trace_gis.graph_index import GraphIndex
+
+TABLE_COLUMNS = ['trace', 'kind', 'id', 'source', 'end_of_path']
+ID_COLUMNS = {'pipe': 'PIPE_ID', 'node': 'NODE_ID'}
+
+Results = Union[TraceResult, Mapping[object, TraceResult], Iterable[TraceResult]]
+
+
+def trace_table(results: Results) -> pd.DataFrame:
+    """Return pipes and nodes visited by results, a row per trace and pipe or node.
+
+    Args:
+    ----
+    - results: A TraceResult, a mapping of trace name to TraceResult, or an
+        iterable of TraceResults (named by position).
+
+    Columns are trace (name), kind ('pipe' or 'node'), id, source (the start node
+    that reached the pipe or node, for traces from several start nodes with
+    tag_sources, else None) and end_of_path (True for end of path nodes).
+    """
+    compact: dict[int, tuple[GraphIndex, list]] = {}
+    frames = []
+    for name, tr in _named(results):
+        if tr.is_compact:
+            compact.setdefault(id(tr._index), (tr._index, []))[1].append((name, tr))  # noqa: SLF001
+        else:
+            frames.append(_table([name], [tr], *_id_arrays(tr)))
+    for index, named in compact.values():
+        frames.append(_compact_table(index, named))
+
+    if not frames:
+        return pd.DataFrame({c: pd.Series(dtype=object) for c in TABLE_COLUMNS}).astype({'end_of_path': bool})
+    return pd.concat(frames, ignore_index=True)
+
+
+def write_traces(results: Results, filename: str | Path) -> pd.DataFrame:
+    """Write the trace table of results to a .csv or .parquet file. Returns the table."""
+    filename = Path(filename)
+    table = trace_table(results)
+    if filename.suffix == '.csv':
+        table.to_csv(filename, index=False)
+    elif filename.suffix == '.parquet':
+        table.to_parquet(filename, index=False)
+    else:
+        msg = f'Unsupported trace table file type: {filename.suffix!r} (.csv or .parquet)'
+        raise ValueError(msg)
+    return table
+
+
+def read_traces(filename: str | Path) -> dict[object, TraceResult]:
+    """Read results written by write_traces, as {trace name: TraceResult}.
+
+    Ids are read back as the file type keeps them (a .csv file keeps no types).
+    """
+    filename = Path(filename)
+    if filename.suffix == '.parquet':
+        table = pd.read_parquet(filename)
+    else:
+        table = pd.read_csv(filename, dtype={'kind': str, 'end_of_path': bool})
+    return {name: _result(group) for name, group in table.groupby('trace', sort=False)}
+
+
+def subset(
+    gdf: pd.DataFrame,
+    result: TraceResult,
+    kind: str = 'pipe',
+    id_column: str | None = None,
+) -> pd.DataFrame:
+    """Return rows of gdf (e.g. a pipes or nodes GeoDataFrame) visited by result.
+
+    Args:
+    ----
+    - gdf: Pipes or nodes (Geo)DataFrame.
+    - result: The trace result.
+    - kind: 'pipe' or 'node', what gdf holds.
+    - id_column: Column of ids in gdf (default 'PIPE_ID' or 'NODE_ID').
+    """
+    id_column = id_column or ID_COLUMNS[kind]
+    pipes, nodes, _ = result.id_lists()
+    return gdf[gdf[id_column].isin(pd.Index(pipes if kind == 'pipe' else nodes))]
+
+
+def join_traces(
+    gdf: pd.DataFrame,
+    results: Results | pd.DataFrame,
+    kind: str = 'pipe',
+    id_column: str | None = None,
+) -> pd.DataFrame:
+    """Return rows of gdf visited by each of results, with trace, source and end_of_path.
+
+    A row of gdf is repeated for each trace visiting it, e.g. a pipes layer of
+    catchments for QGIS. Results may also be a trace table (see trace_table).
+    """
+    id_column = id_column or ID_COLUMNS[kind]
+    table = results if isinstance(results, pd.DataFrame) else trace_table(results)
+    table = table[table['kind'] == kind].drop(columns='kind').rename(columns={'id': id_column})
+    return gdf.merge(table, on=id_column, how='inner')
+
+
+def _named(results: Results) -> Iterable[tuple[object, TraceResult]]:
+    """Return (name, result) pairs of results."""
+    if isinstance(results, TraceResult):
+        return [(0, results)]
+    if isinstance(results, Mapping):
+        return results.items()
+    return enumerate(results)
+
+
+def _id_arrays(tr: TraceResult) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Return pipe ids, node ids and end of path flags (of nodes) of a result."""
+    pipes, nodes, end_of_path_nodes = tr.id_lists()
+    is_end = pd.Index(nodes, dtype=object).isin(end_of_path_nodes)
+    return np.array(pipes, dtype=object), np.array(nodes, dtype=object), is_end
+
+
+def _compact_table(index: GraphIndex, named: list[tuple[object, TraceResult]]) -> pd.DataFrame:
+    """Return the trace table of compact results over index, labelled in one go."""
+    results = [tr for _, tr in named]
+    pipes, nodes, ends = (
+        [tr._positions[k] for tr in results] for k in range(3)  # noqa: SLF001
+    )
+    is_end = np.concatenate(
+        [np.isin(n, e, assume_unique=True) for n, e in zip(nodes, ends)] or [np.zeros(0, dtype=bool)],
+    )
+    pipe_ids = np.array(index.pipe_labels(np.concatenate(pipes)), dtype=object)
+    node_ids = np.array(index.node_labels(np.concatenate(nodes)), dtype=object)
+    table = _table([name for name, _ in named], results, pipe_ids, node_ids, is_end, pipes, nodes)
+
+    # start nodes not in the graph (visited, and end of path)
+    extra = [(name, tr) for name, tr in named if tr._extra_nodes]  # noqa: SLF001
+    if extra:
+        rows = [(name, 'node', node, node, True) for name, tr in extra for node in tr._extra_nodes]  # noqa: SLF001
+        table = pd.concat([table, pd.DataFrame(rows, columns=TABLE_COLUMNS)], ignore_index=True)
+    return table
+
+
+def _table(
+    names: list,
+    results: list[TraceResult],
+    pipe_ids: np.ndarray,
+    node_ids: np.ndarray,
+    is_end: np.ndarray,
+    pipes: list | None = None,
+    nodes: list | None = None,
+) -> pd.DataFrame:
+    """Return the trace table of results, given their ids concatenated in order.
+
+    pipes and nodes (arrays per result) give the number of ids of each result,
+    if there are several results.
+    """
+    pipe_counts = [len(a) for a in pipes] if pipes is not None else [len(pipe_ids)]
+    node_counts = [len(a) for a in nodes] if nodes is not None else [len(node_ids)]
+    trace_names = np.empty(len(names), dtype=object)
+    trace_names[:] = names
+
+    return pd.DataFrame({
+        'trace': np.concatenate([np.repeat(trace_names, pipe_counts), np.repeat(trace_names, node_counts)]),
+        'kind': np.repeat(['pipe', 'node'], [len(pipe_ids), len(node_ids)]).astype(object),
+        'id': np.concatenate([pipe_ids, node_ids]),
+        'source': np.concatenate([
+            _sources(results, 'pipe_sources', pipe_ids, pipe_counts),
+            _sources(results, 'node_sources', node_ids, node_counts),
+        ]),
+        'end_of_path': np.concatenate([np.zeros(len(pipe_ids), dtype=bool), is_end]),
+    }, columns=TABLE_COLUMNS)
+
+
+def _sources(results: list[TraceResult], attribute: str, ids: np.ndarray, counts: list[int]) -> np.ndarray:
+    """Return the source of each id (None where results are not tagged)."""
+    sources = np.full(len(ids), None, dtype=object)
+    bounds = np.cumsum([0, *counts])
+    for tr, lo, hi in zip(results, bounds[:-1].tolist(), bounds[1:].tolist()):
+        tags = getattr(tr, attribute)
+        if tags:
+            sources[lo:hi] = [tags.get(i) for i in ids[lo:hi].tolist()]
+    return sources
+
+
+def _result(table: pd.DataFrame) -> TraceResult:
+    """Return a TraceResult from the rows of one trace in a trace table."""
+    is_pipe = (table['kind'] == 'pipe').to_numpy()
+    pipes, nodes = table[is_pipe], table[~is_pipe]
+    tagged = table['source'].notna().any()
+    return TraceResult(
+        trace_summary={},
+        pipes=set(pipes['id'].tolist()),
+        nodes=set(nodes['id'].tolist()),
+        end_of_path_nodes=set(nodes['id'][nodes['end_of_path']].tolist()),
+        node_sources=dict(zip(nodes['id'].tolist(), nodes['source'].tolist())) if tagged else None,
+        pipe_sources=dict(zip(pipes['id'].tolist(), pipes['source'].tolist())) if tagged else None,
+    )
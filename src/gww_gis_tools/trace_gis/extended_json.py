@@ -0,0 +1,327 @@
+"""Fast loader for Graph files written by Graph.to_file (ExtendedEncoder JSON).
+
+    g = read_graph_json('622d700622e88e2f.json')  # as Graph.from_file, index built
+
+The whole file is read into memory (this is not a streaming reader) and tokenised
+in one vectorised pass over its bytes (NumPy). The node/pipe adjacency lists are
+interned straight into the graph index, without building a Python dict or list
+per node. Small members (direction, fids, parcels) are parsed with json. Files
+with numeric ids or escaped strings in their adjacency are read with json
+(without the object hooks) instead.
+
+On a 500k-pipe file this loads about 1.5 times faster than Graph.from_file, and
+about 3 times faster counting the index that from_file leaves to be built on
+first use. With compact=False it is no faster than from_file: the dictionaries
+are built from the index.
+"""
+
+from __future__ import annotations
+
+import json
+from pathlib import Path
+
+import numpy as np
+
+from gww_gis_tools.trace_gis.graph_index import (
+    OFFSET_DTYPE,
+    POSITION_DTYPE,
+    GraphIndex,
+    IdTable,
+    ParcelIndex,
+)
+from gww_gis_tools.trace_gis.snapshot import QgisFids
+from gww_gis_tools.trace_gis.trace_sewer import DIRECTION, Graph
+
+_QUOTE, _BACKSLASH = ord('"'), ord('\\')
+_COLON, _COMMA = ord(':'), ord(',')
+
+
+def _byte_table(chars: bytes, value: int = 1, dtype: type = bool) -> np.ndarray:
+    """Return a lookup table over byte values, value at chars."""
+    table = np.zeros(256, dtype=dtype)
+    table[list(chars)] = value
+    return table
+
+
+_IS_STRUCTURE = _byte_table(b'{}[]:,')
+_IS_LAYOUT = _byte_table(b'{}[]:," \t\r\n')
+_IS_DIGIT = _byte_table(b'0123456789')
+_DEPTH_CHANGE = _byte_table(b'{[', 1, np.int8) - _byte_table(b'}]', 1, np.int8)
+
+# strings are padded to the longest: beyond this many times their bytes (plus the
+# allowance), e.g. with one very long string, the member is read with json instead
+_MAX_PADDING = 4
+_PADDING_ALLOWANCE = 1 << 24
+
+
+def read_graph_json(filename: str | Path, compact: bool = True) -> Graph:  # noqa: FBT001, FBT002
+    """Read a Graph file written by Graph.to_file (or its older format), index built.
+
+    Gives the same graph as Graph.from_file (compact unless compact=False, which
+    takes about as long as from_file).
+    """
+    raw = Path(filename).read_bytes()
+    tokens = _Tokens(raw)
+    index = fids = None
+    empty_keys: tuple[list, list] = ([], [])
+    if tokens.escaped:
+        # escaped quotes make pairing quotes unreliable: parse it all with json
+        members = json.loads(raw)
+        value = members.get
+    else:
+        members = spans = tokens.members(0, len(raw), depth=1)
+
+        def value(key: str) -> object:
+            return tokens.value(*spans[key]) if key in spans else None
+
+        if '_nodes' in spans:
+            parsed = _adjacency_index(tokens, spans['_nodes'], spans['_pipes'])
+            if parsed is not None:
+                index, empty = parsed
+                empty_keys = (empty, empty)
+        if index is not None and '_qgis_fids' in spans:
+            fids = _qgis_fids(tokens, spans['_qgis_fids'], index)
+
+    if value('__extended_json_type__') != 'Graph':
+        msg = f'Not a Graph file: {str(filename)!r}'
+        raise ValueError(msg)
+    g = Graph(DIRECTION(value('_direction')['_direction']), bidirectional=bool(value('_bidirectional')))
+
+    if index is None:
+        nodes, pipes = _unwrap(value('_nodes')), _unwrap(value('_pipes'))
+        index = GraphIndex.from_adjacency(nodes, pipes)
+        empty_keys = ([k for k, v in nodes.items() if not v], [k for k, v in pipes.items() if not v])
+    g._add_index(index, compact=compact)  # noqa: SLF001
+    if not compact:
+        # keys listing nothing are not in the index's adjacency: keep them, as from_file does
+        for adjacency, keys in zip((g.nodes, g.pipes), empty_keys):
+            for key in keys:
+                adjacency.setdefault(key, [])
+
+    g.qgis_fids = fids if fids is not None else value('_qgis_fids') or {}
+    if '_parcels' in members:
+        parcels = value('_parcels')
+        g.parcels = ParcelIndex.from_pairs(parcels['_pipes'], parcels['_parcels'])
+    return g
+
+
+def _unwrap(adjacency: dict) -> dict:
+    """Return the dict held by an encoded defaultdict (or adjacency as is)."""
+    if adjacency.get('__extended_json_type__') == 'defaultdict':
+        return adjacency['__dict__']
+    return adjacency
+
+
+def _adjacency_index(tokens: _Tokens, nodes_span: tuple, pipes_span: tuple) -> tuple[GraphIndex, list] | None:
+    """Build the index from the nodes/pipes members, or None if not all ids are plain strings.
+
+    Also returns the keys whose lists are empty (nodes in the index without edges).
+    """
+    nodes, pipes = tokens.adjacency(*nodes_span), tokens.adjacency(*pipes_span)
+    if nodes is None or pipes is None:
+        return None
+    keys, targets, key_of_target = nodes
+    pipe_keys, edge_pipes, key_of_pipe = pipes
+    if not (np.array_equal(keys, pipe_keys) and np.array_equal(key_of_target, key_of_pipe)):
+        return None  # lists not aligned key by key: leave it to from_adjacency
+
+    node_ids, node_codes = _unique(np.concatenate([keys, targets]))
+    key_codes, target_codes = node_codes[:len(keys)], node_codes[len(keys):]
+    pipe_ids, pipe_codes = _unique(edge_pipes)
+    source_codes = key_codes[key_of_target]
+    order = np.argsort(source_codes, kind='stable')
+
+    offsets = np.zeros(len(node_ids) + 1, dtype=OFFSET_DTYPE)
+    np.cumsum(np.bincount(source_codes, minlength=len(node_ids)), out=offsets[1:])
+    index = GraphIndex(
+        node_ids=IdTable(node_ids),
+        pipe_ids=IdTable(pipe_ids),
+        offsets=offsets,
+        targets=target_codes[order].astype(POSITION_DTYPE),
+        edge_pipes=pipe_codes[order].astype(POSITION_DTYPE),
+    )
+    is_empty = np.bincount(key_of_target, minlength=len(keys)) == 0
+    return index, keys[is_empty].astype(str).tolist()
+
+
+def _unique(strings: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Return (sorted unique strings, inverse), as np.unique(strings, return_inverse=True).
+
+    Bytes are sorted as big-endian words, much faster than comparing strings.
+    """
+    if strings.dtype.kind != 'S' or not len(strings):
+        return np.unique(strings, return_inverse=True)
+    width = strings.dtype.itemsize
+    padded = np.zeros((len(strings), -(-width // 8) * 8), dtype=np.uint8)
+    padded[:, :width] = strings.view(np.uint8).reshape(-1, width)
+    words = padded.view('>u8')
+    order = np.lexsort(words.T[::-1])
+    words = words[order]
+    is_first = np.ones(len(strings), dtype=bool)
+    is_first[1:] = (words[1:] != words[:-1]).any(axis=1)
+    inverse = np.empty(len(strings), dtype=np.intp)
+    inverse[order] = np.cumsum(is_first) - 1
+    return strings[order[is_first]], inverse
+
+
+def _qgis_fids(tokens: _Tokens, span: tuple, index: GraphIndex) -> QgisFids | None:
+    """Return fids of the _qgis_fids member without building a dict, None if it needs one.
+
+    It does if a fid is 0 (meaning none in QgisFids) or a pipe is not in the index.
+    """
+    parsed = tokens.integers(*span)
+    if parsed is None:
+        return None
+    keys, values = parsed
+    pipe_ids = index.pipe_ids.values
+    if keys.dtype.kind != pipe_ids.dtype.kind or not values.all():
+        return None
+    positions = np.minimum(np.searchsorted(pipe_ids, keys), len(pipe_ids) - 1)
+    if len(keys) and not (pipe_ids[positions] == keys).all():
+        return None
+    fids = np.zeros(index.n_pipes, dtype=np.int64)
+    fids[positions] = values
+    return QgisFids(index.pipe_ids, fids)
+
+
+class _Tokens:
+    """Strings and structural characters of a JSON document, located by NumPy."""
+
+    def __init__(self, raw: bytes) -> None:
+        """Tokenise raw (bytes of a JSON document), unless it has escapes."""
+        self.raw = raw
+        self.data = np.frombuffer(raw, dtype=np.uint8)
+        self.escaped = _BACKSLASH in raw
+        if self.escaped:
+            return
+        quotes = np.flatnonzero(self.data == _QUOTE)
+        self.quotes = quotes
+        self.string_starts, self.string_ends = quotes[0::2], quotes[1::2]
+
+        positions = np.flatnonzero(_IS_STRUCTURE[self.data])
+        positions = positions[np.searchsorted(quotes, positions) % 2 == 0]  # outside strings
+        chars = self.data[positions]
+        self.positions, self.chars = positions, chars
+        self.depth = np.cumsum(_DEPTH_CHANGE[chars], dtype=np.int64)
+
+    def value(self, lo: int, hi: int) -> object:
+        """Return the JSON value in raw[lo:hi], parsed by json."""
+        return json.loads(self.raw[lo:hi])
+
+    def members(
+        self, lo: int, hi: int, depth: int, names: tuple[str, ...] | None = None,
+    ) -> dict[str, tuple[int, int]]:
+        """Return {key: (value start, value end)} of the object at depth within raw[lo:hi].
+
+        Only keys in names if given (only those keys are decoded).
+        """
+        key_index, value_starts, value_ends = self._spans(lo, hi, depth)
+        if names is not None:
+            lengths = self.string_ends[key_index] - self.string_starts[key_index] - 1
+            candidates = np.isin(lengths, [len(name.encode()) for name in names])
+            key_index, value_starts, value_ends = key_index[candidates], value_starts[candidates], value_ends[candidates]
+        members = {}
+        for k, start, end in zip(key_index.tolist(), value_starts.tolist(), value_ends.tolist()):
+            key = self.raw[self.string_starts[k] + 1:self.string_ends[k]].decode()
+            if names is None or key in names:
+                members[key] = (start, end)
+        return members
+
+    def _spans(self, lo: int, hi: int, depth: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Return (key string number, value start, value end) of the object at depth within raw[lo:hi]."""
+        colons = np.flatnonzero(
+            (self.chars == _COLON) & (self.depth == depth) & (self.positions > lo) & (self.positions < hi),
+        )
+        # a value ends at the next comma at its depth, or where its object closes
+        ends = np.flatnonzero(((self.chars == _COMMA) & (self.depth == depth)) | (self.depth == depth - 1))
+        value_ends = self.positions[ends[np.searchsorted(ends, colons)]]
+        # each colon follows its key string
+        key_index = np.searchsorted(self.string_ends, self.positions[colons]) - 1
+        return key_index, self.positions[colons] + 1, value_ends
+
+    def integers(self, lo: int, hi: int) -> tuple[np.ndarray, np.ndarray] | None:
+        """Return (keys, values) of an object of non-negative integers, None if it is not one."""
+        lo = int(np.searchsorted(self.positions, lo))  # the member's opening brace
+        key_index, starts, ends = self._spans(int(self.positions[lo]), hi, int(self.depth[lo]))
+        chars = self._chars(starts - 1, ends)
+        if chars is None:
+            return None
+        is_digit = _IS_DIGIT[chars]
+        if not (is_digit | (chars == ord(' ')) | (chars == 0)).all():
+            return None
+        values = np.zeros(len(starts), dtype=np.int64)
+        for column in range(chars.shape[1]):
+            digits = is_digit[:, column]
+            values[digits] = values[digits] * 10 + (chars[digits, column] - ord('0'))
+        keys = self._strings(self.string_starts[key_index], self.string_ends[key_index])
+        return None if keys is None else (keys, values)
+
+    def adjacency(self, lo: int, hi: int) -> tuple[np.ndarray, np.ndarray, np.ndarray] | None:
+        """Return (keys, list items, key number of each item) of an adjacency member.
+
+        The member is an object of lists of strings, or an encoded defaultdict of
+        one. Returns None if any id is not a plain string.
+        """
+        lo = int(np.searchsorted(self.positions, lo))  # the member's opening brace
+        depth = int(self.depth[lo])
+        inner = self.members(int(self.positions[lo]), hi, depth=depth, names=('__dict__',))
+        if '__dict__' in inner:
+            lo = int(np.searchsorted(self.positions, inner['__dict__'][0]))
+            depth, hi = int(self.depth[lo]), inner['__dict__'][1]
+        start = int(self.positions[lo])
+
+        # anything but strings, structure and whitespace (e.g. numeric ids): no fast path
+        span = self.data[start:hi]
+        quote = np.zeros(len(span), dtype=np.uint8)
+        quote[self.quotes[(self.quotes >= start) & (self.quotes < hi)] - start] = 1
+        outside = np.bitwise_xor.accumulate(quote) == 0
+        if not _IS_LAYOUT[span[outside]].all():
+            return None
+
+        first, last = np.searchsorted(self.string_starts, [start, hi])
+        starts, ends = self.string_starts[first:last], self.string_ends[first:last]
+        string_depth = self.depth[np.searchsorted(self.positions, starts) - 1]
+        is_key = string_depth == depth
+        if not np.all(is_key | (string_depth == depth + 1)):
+            return None
+        key_number = np.cumsum(is_key)[~is_key] - 1
+        keys = self._strings(starts[is_key], ends[is_key])
+        items = self._strings(starts[~is_key], ends[~is_key])
+        if keys is None or items is None:
+            return None
+        return keys, items, key_number
+
+    def _strings(self, starts: np.ndarray, ends: np.ndarray) -> np.ndarray | None:
+        """Return the strings between quotes at starts and ends (bytes, or str if not ASCII).
+
+        None if they are too uneven in length to pad (see _chars).
+        """
+        chars = self._chars(starts, ends)
+        if chars is None:
+            return None
+        strings = chars.view(f'S{max(chars.shape[1], 1)}').ravel()
+        if (chars >= 0x80).any():  # noqa: PLR2004
+            return np.char.decode(strings, 'utf-8')
+        return strings
+
+    def _chars(self, starts: np.ndarray, ends: np.ndarray) -> np.ndarray | None:
+        """Return bytes between starts and ends (exclusive) as rows, padded with zeros.
+
+        Rows of each length are copied together from windows over the data, without
+        an index per byte. None if padding them to the longest row would take more
+        than _MAX_PADDING times their bytes.
+        """
+        lengths = ends - starts - 1
+        width = int(lengths.max()) if len(lengths) else 0
+        if len(lengths) * width > _MAX_PADDING * int(lengths.sum()) + _PADDING_ALLOWANCE:
+            return None
+        chars = np.zeros((len(lengths), width), dtype=np.uint8)
+        order = np.argsort(lengths, kind='stable')
+        sorted_lengths = lengths[order]
+        distinct = np.unique(sorted_lengths[sorted_lengths > 0])
+        bounds = np.searchsorted(sorted_lengths, np.append(distinct, width + 1))
+        for length, lo, hi in zip(distinct.tolist(), bounds[:-1].tolist(), bounds[1:].tolist()):
+            rows = order[lo:hi]
+            windows = np.lib.stride_tricks.sliding_window_view(self.data, length)
+            chars[rows, :length] = windows[starts[rows] + 1]
+        return chars
@@ -0,0 +1,649 @@
+"""Graph Index."""
+
+from __future__ import annotations
+
+import contextlib
+import gc
+from collections.abc import Iterator, Mapping
+from contextlib import contextmanager
+from functools import cached_property
+from itertools import chain
+from typing import Any
+
+import numpy as np
+import pandas as pd
+from pandas.errors import InvalidIndexError
+
+POSITION_DTYPE = np.int32
+OFFSET_DTYPE = np.int64
+INT64_MIN, INT64_MAX = np.iinfo(np.int64).min, np.iinfo(np.int64).max
+
+
+class IdTable:
+    """Interned ids: lookups between ids and contiguous positions.
+
+    Integer and text ids are held in a sorted NumPy array (text as ASCII bytes where
+    possible), a fraction of the size of Python objects, with lookups by binary
+    search. Mixed ids fall back to a (hashed) pandas Index.
+    """
+
+    def __init__(self, values: np.ndarray | pd.Index) -> None:
+        """Initialise from sorted unique values (ndarray) or unique values (Index)."""
+        self.values = values
+
+    def __repr__(self) -> str:
+        """Return a string representation of the table."""
+        return f'IdTable({len(self)=}, dtype={self.values.dtype})'
+
+    @classmethod
+    def factorize(cls, ids: Any) -> tuple[np.ndarray, IdTable]:  # noqa: ANN401
+        """Intern ids. Returns (position of each id, table)."""
+        ids = pd.Series(ids, dtype=object) if not isinstance(ids, pd.Series) else ids
+        kind = pd.api.types.infer_dtype(ids, skipna=False)
+
+        if kind in ('integer', 'string'):
+            if kind == 'integer':
+                values = ids.to_numpy(dtype=np.int64)
+            else:
+                try:
+                    values = ids.to_numpy(dtype=object).astype(np.bytes_)
+                except UnicodeEncodeError:
+                    values = ids.to_numpy(dtype=str)
+            uniques, codes = np.unique(values, return_inverse=True)
+            return codes.astype(POSITION_DTYPE), cls(uniques)
+
+        codes, uniques = pd.factorize(ids, use_na_sentinel=False)
+        return codes.astype(POSITION_DTYPE), cls(pd.Index(uniques, dtype=object))
+
+    @property
+    def is_sorted_array(self) -> bool:
+        """True if ids are held in a sorted NumPy array (False for Index fallback)."""
+        return isinstance(self.values, np.ndarray)
+
+    @property
+    def nbytes(self) -> int:
+        """Memory held by the ids."""
+        if self.is_sorted_array:
+            return self.values.nbytes
+        return int(self.values.memory_usage(deep=True))
+
+    def __len__(self) -> int:
+        """Return number of ids."""
+        return len(self.values)
+
+    def __iter__(self) -> Iterator:
+        """Iterate over ids (as Python objects)."""
+        return iter(self.labels(slice(None)))
+
+    def __getitem__(self, position: int) -> Any:  # noqa: ANN401
+        """Return id at position."""
+        value = self.values[position]
+        if isinstance(value, np.bytes_):
+            return value.decode()
+        return value.item() if isinstance(value, np.generic) else value
+
+    def labels(self, positions: Any) -> list:  # noqa: ANN401
+        """Return ids at positions (array, list or slice)."""
+        if not isinstance(positions, slice):
+            positions = np.asarray(positions, dtype=np.intp)
+        values = self.values[positions]
+        if values.dtype.kind == 'S':
+            values = values.astype(str)
+        return values.tolist()
+
+    def to_index(self) -> pd.Index:
+        """Return ids as a pandas Index (position order)."""
+        return pd.Index(self.labels(slice(None)))
+
+    def _encode(self, keys: list) -> tuple[np.ndarray, np.ndarray]:
+        """Return (mask of keys comparable with the table, those keys as an array)."""
+        kind = self.values.dtype.kind
+        key_kind = pd.api.types.infer_dtype(keys, skipna=False)
+        if (kind, key_kind) in (('i', 'integer'), ('U', 'string')):
+            comparable = np.array(keys, dtype=np.int64 if kind == 'i' else str)
+            return np.ones(len(keys), dtype=bool), comparable
+        if (kind, key_kind) == ('S', 'string'):
+            with contextlib.suppress(UnicodeEncodeError):
+                return np.ones(len(keys), dtype=bool), np.array(keys, dtype=object).astype(np.bytes_)
+
+        if kind == 'i':
+            mask = [
+                isinstance(k, (int, np.integer)) and not isinstance(k, bool) and INT64_MIN <= k <= INT64_MAX
+                for k in keys
+            ]
+        else:
+            mask = [isinstance(k, str) and (kind == 'U' or k.isascii()) for k in keys]
+        mask = np.array(mask, dtype=bool)
+        comparable = [k for k, m in zip(keys, mask) if m]
+        # dtype kind only: a fixed width would truncate longer keys into false matches
+        return mask, np.array(comparable, dtype=np.int64 if kind == 'i' else kind)
+
+    def position(self, key: Any) -> int:  # noqa: ANN401
+        """Return position of key, or -1 if it is not in the table."""
+        if not self.is_sorted_array:
+            return self._position_fallback(key)
+        mask, comparable = self._encode([key])
+        if not mask[0] or not len(self.values):
+            return -1
+        position = int(np.searchsorted(self.values, comparable[0]))
+        if position < len(self.values) and self.values[position] == comparable[0]:
+            return position
+        return -1
+
+    def positions(self, keys: Any) -> np.ndarray:  # noqa: ANN401
+        """Return positions of keys (-1 where not in the table)."""
+        keys = keys.tolist() if isinstance(keys, (np.ndarray, pd.Index, pd.Series)) else list(keys)
+        if not self.is_sorted_array:
+            try:
+                return self.values.get_indexer(pd.Index(keys, dtype=object))
+            except TypeError:
+                return np.array([self._position_fallback(k) for k in keys], dtype=np.intp)
+
+        positions = np.full(len(keys), -1, dtype=np.intp)
+        mask, comparable = self._encode(keys)
+        if len(comparable) and len(self.values):
+            found = np.searchsorted(self.values, comparable)
+            found[found == len(self.values)] = 0
+            found[self.values[found] != comparable] = -1
+            positions[mask] = found
+        return positions
+
+    def _position_fallback(self, key: Any) -> int:  # noqa: ANN401
+        """Return position of key in Index fallback, or -1 (for unhashable keys)."""
+        return _index_position(self.values, key)
+
+    def extend(self, ids: Any) -> IdTable:  # noqa: ANN401
+        """Return table with ids not already in the table appended (self if none)."""
+        ids = list(dict.fromkeys(ids))
+        new = [i for i, p in zip(ids, self.positions(ids).tolist()) if p < 0]
+        if not new:
+            return self
+        if isinstance(self, ExtendedIdTable):
+            return ExtendedIdTable(self.base, self.extra.append(pd.Index(new, dtype=object)))
+        return ExtendedIdTable(self, pd.Index(new, dtype=object))
+
+
+class ExtendedIdTable(IdTable):
+    """An IdTable with extra ids appended after it (positions of base ids unchanged).
+
+    Lets an edited index share the (large) id table of the index it was derived
+    from, instead of interning every id again.
+    """
+
+    def __init__(self, base: IdTable, extra: pd.Index) -> None:
+        """Initialise from base table and extra ids (not in base)."""
+        self.base = base
+        self.extra = pd.Index(extra, dtype=object)
+        self.values = base.values
+
+    def __repr__(self) -> str:
+        """Return a string representation of the table."""
+        return f'ExtendedIdTable({len(self.base)=}, {len(self.extra)=})'
+
+    @property
+    def nbytes(self) -> int:
+        """Memory held by the ids (including the shared base)."""
+        return self.base.nbytes + int(self.extra.memory_usage(deep=True))
+
+    def __len__(self) -> int:
+        """Return number of ids."""
+        return len(self.base) + len(self.extra)
+
+    def __getitem__(self, position: int) -> Any:  # noqa: ANN401
+        """Return id at position."""
+        n_base = len(self.base)
+        return self.base[position] if position < n_base else self.extra[position - n_base]
+
+    def labels(self, positions: Any) -> list:  # noqa: ANN401
+        """Return ids at positions (array, list or slice)."""
+        if isinstance(positions, slice):
+            positions = np.arange(len(self))[positions]
+        positions = np.asarray(positions, dtype=np.intp)
+        n_base = len(self.base)
+        is_extra = positions >= n_base
+        if not is_extra.any():
+            return self.base.labels(positions)
+
+        labels = np.empty(len(positions), dtype=object)
+        labels[~is_extra] = self.base.labels(positions[~is_extra])
+        labels[is_extra] = self.extra[positions[is_extra] - n_base]
+        return labels.tolist()
+
+    def position(self, key: Any) -> int:  # noqa: ANN401
+        """Return position of key, or -1 if it is not in the table."""
+        position = self.base.position(key)
+        if position < 0:
+            position = _index_position(self.extra, key)
+            if position >= 0:
+                position += len(self.base)
+        return position
+
+    def positions(self, keys: Any) -> np.ndarray:  # noqa: ANN401
+        """Return positions of keys (-1 where not in the table)."""
+        keys = keys.tolist() if isinstance(keys, (np.ndarray, pd.Index, pd.Series)) else list(keys)
+        positions = self.base.positions(keys)
+        missing = np.flatnonzero(positions < 0)
+        if len(missing) and len(self.extra):
+            found = np.array([_index_position(self.extra, keys[i]) for i in missing.tolist()], dtype=np.intp)
+            positions[missing] = np.where(found >= 0, found + len(self.base), -1)
+        return positions
+
+
+def _index_position(index: pd.Index, key: Any) -> int:  # noqa: ANN401
+    """Return position of key in a (unique) pandas Index, or -1."""
+    try:
+        position = index.get_loc(key)
+    except (KeyError, TypeError, InvalidIndexError):
+        return -1
+    return position if isinstance(position, (int, np.integer)) else -1
+
+
+class GraphIndex:
+    """Array-backed (CSR) adjacency with node and pipe ids interned to integers.
+
+    Node `i` is adjacent to `targets[offsets[i]:offsets[i + 1]]`, reached through
+    the pipes `edge_pipes[offsets[i]:offsets[i + 1]]`. Positions in `targets` are
+    node positions, positions in `edge_pipes` are pipe positions.
+
+    Attributes:
+    ----------
+    - node_ids: IdTable of node ids (position <-> node id).
+    - pipe_ids: IdTable of pipe ids (position <-> pipe id).
+    - offsets: start of each node's adjacency in `targets` (n_nodes + 1).
+    - targets: adjacent node positions, grouped by source node.
+    - edge_pipes: pipe position of each entry in `targets`.
+
+    Methods:
+    -------
+    - from_edges(sources, targets, pipes): Builds an index from edge columns.
+    - from_adjacency(nodes, pipes): Builds an index from Graph dictionaries.
+    - patched(removed_pipes, sources, targets, pipes): Copy with edges removed/added.
+    - to_adjacency(): Returns Graph dictionaries built from the index.
+    - node_position(node_id) / node_positions(node_ids): Id -> position lookups.
+    - neighbours(position): Adjacent node positions and their edge positions.
+    - out_edges(positions): Edge positions of all given nodes (vectorised).
+    - reverse: The same edges in the opposite direction (computed once).
+
+    """
+
+    def __init__(
+        self,
+        node_ids: IdTable,
+        pipe_ids: IdTable,
+        offsets: np.ndarray,
+        targets: np.ndarray,
+        edge_pipes: np.ndarray,
+    ) -> None:
+        """Initialise GraphIndex from prepared CSR arrays."""
+        self.node_ids = node_ids
+        self.pipe_ids = pipe_ids
+        self.offsets = offsets
+        self.targets = targets
+        self.edge_pipes = edge_pipes
+
+    def __repr__(self) -> str:
+        """Return a string representation of the index."""
+        return f'GraphIndex({self.n_nodes=}, {self.n_edges=}, {self.nbytes=})'
+
+    @classmethod
+    def from_edges(
+        cls,
+        sources: Any,  # noqa: ANN401
+        targets: Any,  # noqa: ANN401
+        pipes: Any,  # noqa: ANN401
+        nodes: Any = (),  # noqa: ANN401
+    ) -> GraphIndex:
+        """Build index from edge columns (in traversal direction).
+
+        Adjacency order per node follows the order of the edges, so an index built
+        from a Graph's dictionaries lists neighbours exactly as the lists do.
+        `nodes` are optional extra node ids to intern (e.g. nodes with no edges).
+        """
+        columns = [pd.Series(sources), pd.Series(targets)]
+        n_extra, n_edges = len(nodes), len(columns[0])
+        if len(columns[1]) != n_edges or len(pipes) != n_edges:
+            msg = 'sources, targets and pipes must be the same length'
+            raise ValueError(msg)
+        if n_extra:
+            columns.insert(0, pd.Series(nodes, dtype=object))
+
+        node_codes, node_ids = IdTable.factorize(pd.concat(columns, ignore_index=True))
+        pipe_codes, pipe_ids = IdTable.factorize(pd.Series(pipes))
+
+        source_codes = node_codes[n_extra:n_extra + n_edges]
+        target_codes = node_codes[n_extra + n_edges:]
+        order = np.argsort(source_codes, kind='stable')
+
+        offsets = np.zeros(len(node_ids) + 1, dtype=OFFSET_DTYPE)
+        np.cumsum(np.bincount(source_codes, minlength=len(node_ids)), out=offsets[1:])
+
+        return cls(
+            node_ids=node_ids,
+            pipe_ids=pipe_ids,
+            offsets=offsets,
+            targets=target_codes[order],
+            edge_pipes=pipe_codes[order],
+        )
+
+    @classmethod
+    def from_adjacency(cls, nodes: Mapping, pipes: Mapping) -> GraphIndex:
+        """Build index from a Graph's `nodes` and `pipes` dictionaries."""
+        keys = list(nodes)
+        lengths = [len(nodes[k]) for k in keys]
+        targets = list(chain.from_iterable(nodes[k] for k in keys))
+        edge_pipes = list(chain.from_iterable(pipes.get(k, ()) for k in keys))
+        if len(edge_pipes) != len(targets):
+            msg = 'nodes and pipes adjacency lists are not aligned'
+            raise ValueError(msg)
+
+        sources = np.empty(len(keys), dtype=object)
+        sources[:] = keys
+        return cls.from_edges(np.repeat(sources, lengths), targets, edge_pipes, nodes=keys)
+
+    def patched(
+        self,
+        removed_pipes: Any = (),  # noqa: ANN401
+        sources: Any = (),  # noqa: ANN401
+        targets: Any = (),  # noqa: ANN401
+        pipes: Any = (),  # noqa: ANN401
+    ) -> GraphIndex:
+        """Return a copy with edges of removed_pipes dropped and edges added.
+
+        Added edges (in traversal direction) follow existing adjacency of their
+        source node. Id tables are shared, extended with any new ids. Only the CSR
+        arrays are rebuilt, in one vectorised pass.
+        """
+        node_ids = self.node_ids.extend(chain(sources, targets))
+        pipe_ids = self.pipe_ids.extend(pipes)
+
+        removed = pipe_ids.positions(removed_pipes)
+        keep = ~np.isin(self.edge_pipes, removed[removed >= 0])
+        kept_sources = self.edge_sources[keep]
+
+        new_sources = node_ids.positions(sources).astype(POSITION_DTYPE)
+        order = np.argsort(new_sources, kind='stable')
+        new_sources = new_sources[order]
+        new_targets = node_ids.positions(targets).astype(POSITION_DTYPE)[order]
+        new_pipes = pipe_ids.positions(pipes).astype(POSITION_DTYPE)[order]
+
+        at = np.searchsorted(kept_sources, new_sources, side='right')
+        counts = np.bincount(kept_sources, minlength=len(node_ids))
+        counts += np.bincount(new_sources, minlength=len(node_ids))
+        offsets = np.zeros(len(node_ids) + 1, dtype=OFFSET_DTYPE)
+        np.cumsum(counts, out=offsets[1:])
+
+        return GraphIndex(
+            node_ids=node_ids,
+            pipe_ids=pipe_ids,
+            offsets=offsets,
+            targets=np.insert(self.targets[keep], at, new_targets),
+            edge_pipes=np.insert(self.edge_pipes[keep], at, new_pipes),
+        )
+
+    def to_adjacency(self) -> tuple[dict, dict]:
+        """Return Graph-style `nodes` and `pipes` dictionaries (one step per node)."""
+        targets = self.node_ids.labels(self.targets)
+        edge_pipes = self.pipe_ids.labels(self.edge_pipes)
+        has_edges = np.flatnonzero(self.degree)
+        ranges = list(zip(
+            self.node_ids.labels(has_edges),
+            self.offsets[has_edges].tolist(),
+            self.offsets[has_edges + 1].tolist(),
+        ))
+
+        with gc_paused():
+            nodes = {node: targets[lo:hi] for node, lo, hi in ranges}
+            pipes = {node: edge_pipes[lo:hi] for node, lo, hi in ranges}
+        return nodes, pipes
+
+    @property
+    def n_nodes(self) -> int:
+        """Number of interned nodes."""
+        return len(self.node_ids)
+
+    @property
+    def n_pipes(self) -> int:
+        """Number of interned pipes."""
+        return len(self.pipe_ids)
+
+    @property
+    def n_edges(self) -> int:
+        """Number of edges (adjacency entries)."""
+        return len(self.targets)
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate memory held by the adjacency arrays and id tables."""
+        arrays = (self.offsets, self.targets, self.edge_pipes)
+        return sum(a.nbytes for a in arrays) + self.node_ids.nbytes + self.pipe_ids.nbytes
+
+    @cached_property
+    def degree(self) -> np.ndarray:
+        """Number of adjacent nodes per node position."""
+        return np.diff(self.offsets).astype(POSITION_DTYPE)
+
+    @cached_property
+    def edge_sources(self) -> np.ndarray:
+        """Source node position of each edge."""
+        return np.repeat(
+            np.arange(self.n_nodes, dtype=POSITION_DTYPE),
+            self.degree,
+        )
+
+    @cached_property
+    def reverse(self) -> GraphIndex:
+        """Index with every edge reversed (sharing id tables with this index)."""
+        order = np.argsort(self.targets, kind='stable')
+        offsets = np.zeros(self.n_nodes + 1, dtype=OFFSET_DTYPE)
+        np.cumsum(np.bincount(self.targets, minlength=self.n_nodes), out=offsets[1:])
+
+        reverse = GraphIndex(
+            node_ids=self.node_ids,
+            pipe_ids=self.pipe_ids,
+            offsets=offsets,
+            targets=self.edge_sources[order],
+            edge_pipes=self.edge_pipes[order],
+        )
+        reverse.__dict__['reverse'] = self
+        return reverse
+
+    def node_position(self, node_id: Any) -> int:  # noqa: ANN401
+        """Return position of node_id, or -1 if the node is not in the index."""
+        return self.node_ids.position(node_id)
+
+    def node_positions(self, node_ids: Any) -> np.ndarray:  # noqa: ANN401
+        """Return positions of node_ids (-1 where not in the index)."""
+        return self.node_ids.positions(node_ids)
+
+    def pipe_positions(self, pipe_ids: Any) -> np.ndarray:  # noqa: ANN401
+        """Return positions of pipe_ids (-1 where not in the index)."""
+        return self.pipe_ids.positions(pipe_ids)
+
+    def node_labels(self, positions: Any) -> list:  # noqa: ANN401
+        """Return node ids at positions."""
+        return self.node_ids.labels(positions)
+
+    def pipe_labels(self, positions: Any) -> list:  # noqa: ANN401
+        """Return pipe ids at positions."""
+        return self.pipe_ids.labels(positions)
+
+    def neighbours(self, position: int) -> tuple[np.ndarray, np.ndarray]:
+        """Return adjacent node positions and the matching edge positions."""
+        lo, hi = self.offsets[position], self.offsets[position + 1]
+        return self.targets[lo:hi], np.arange(lo, hi)
+
+    def out_edges(self, positions: np.ndarray) -> np.ndarray:
+        """Return edge positions of every node in positions (vectorised)."""
+        positions = np.asarray(positions, dtype=np.intp)
+        starts = self.offsets[positions]
+        counts = self.offsets[positions + 1] - starts
+        return expand_ranges(starts, counts)
+
+
+class ParcelIndex:
+    """Array-backed (CSR) lookup of the parcels connected to each pipe.
+
+    Pipe `i` serves parcels `parcels[offsets[i]:offsets[i + 1]]` (parcel positions).
+    Built in bulk from the branches layer, which links each property service
+    (SERV_ID) to a pipe (PIPE_ID) and a parcel (PRCL_GID).
+
+    Attributes:
+    ----------
+    - pipe_ids: IdTable of pipe ids with at least one parcel.
+    - parcel_ids: IdTable of parcel ids (position <-> parcel id).
+    - offsets: start of each pipe's parcels in `parcels` (n_pipes + 1).
+    - parcels: parcel positions, grouped by pipe.
+
+    Methods:
+    -------
+    - from_pairs(pipes, parcels): Builds an index from (pipe id, parcel id) columns.
+    - to_pairs(): Returns the (pipe id, parcel id) columns.
+    - parcel_positions(pipe_positions, index): Parcels served by pipes of index.
+    - pipe_counts(): Number of parcels served by each pipe.
+    """
+
+    def __init__(
+        self,
+        pipe_ids: IdTable,
+        parcel_ids: IdTable,
+        offsets: np.ndarray,
+        parcels: np.ndarray,
+    ) -> None:
+        """Initialise ParcelIndex from prepared CSR arrays."""
+        self.pipe_ids = pipe_ids
+        self.parcel_ids = parcel_ids
+        self.offsets = offsets
+        self.parcels = parcels
+        self._aligned: tuple | None = None  # (pipe id table, positions in pipe_ids)
+
+    def __repr__(self) -> str:
+        """Return a string representation of the index."""
+        return f'ParcelIndex({len(self.pipe_ids)=}, {len(self.parcel_ids)=}, {self.nbytes=})'
+
+    @classmethod
+    def from_pairs(cls, pipes: Any, parcels: Any) -> ParcelIndex:  # noqa: ANN401
+        """Build index from pipe id and parcel id columns (duplicate pairs dropped)."""
+        pairs = pd.DataFrame({'pipe': pd.Series(pipes, dtype=object), 'parcel': pd.Series(parcels, dtype=object)})
+        pairs = pairs.dropna().drop_duplicates()
+        pipe_codes, pipe_ids = IdTable.factorize(pairs['pipe'])
+        parcel_codes, parcel_ids = IdTable.factorize(pairs['parcel'])
+        order = np.lexsort((parcel_codes, pipe_codes))
+
+        offsets = np.zeros(len(pipe_ids) + 1, dtype=OFFSET_DTYPE)
+        np.cumsum(np.bincount(pipe_codes, minlength=len(pipe_ids)), out=offsets[1:])
+        return cls(pipe_ids, parcel_ids, offsets, parcel_codes[order])
+
+    def to_pairs(self) -> tuple[list, list]:
+        """Return (pipe ids, parcel ids), one entry per pipe-parcel pair."""
+        pipes = np.repeat(np.arange(len(self.pipe_ids)), np.diff(self.offsets))
+        return self.pipe_ids.labels(pipes), self.parcel_ids.labels(self.parcels)
+
+    @property
+    def nbytes(self) -> int:
+        """Memory held by the ids and CSR arrays."""
+        return self.pipe_ids.nbytes + self.parcel_ids.nbytes + self.offsets.nbytes + self.parcels.nbytes
+
+    def pipe_counts(self) -> pd.Series:
+        """Return number of parcels served by each pipe (index PIPE_ID)."""
+        return pd.Series(np.diff(self.offsets), index=self.pipe_ids.to_index().rename('PIPE_ID'), name='parcel_count')
+
+    def pipe_positions(self, pipe_positions: np.ndarray, index: GraphIndex) -> np.ndarray:
+        """Map pipe positions of index to positions in this index (-1 if no parcels)."""
+        if self._aligned is None or self._aligned[0] is not index.pipe_ids:
+            self._aligned = (index.pipe_ids, self.pipe_ids.positions(index.pipe_ids.labels(slice(None))))
+        return self._aligned[1][np.asarray(pipe_positions, dtype=np.intp)]
+
+    def parcel_positions(self, pipe_positions: np.ndarray, index: GraphIndex | None = None) -> np.ndarray:
+        """Return sorted, unique parcel positions served by pipes (vectorised).
+
+        pipe_positions are positions in index (default: positions in this index).
+        """
+        if index is not None:
+            pipe_positions = self.pipe_positions(pipe_positions, index)
+        pipe_positions = np.asarray(pipe_positions, dtype=np.intp)
+        pipe_positions = pipe_positions[pipe_positions >= 0]
+        starts = self.offsets[pipe_positions]
+        return np.unique(self.parcels[expand_ranges(starts, self.offsets[pipe_positions + 1] - starts)])
+
+
+@contextmanager
+def gc_paused() -> Iterator[None]:
+    """Pause garbage collection while allocating many (acyclic) containers."""
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def expand_ranges(starts: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    """Concatenate ranges `starts[k]:starts[k] + counts[k]` without a Python loop."""
+    total = int(counts.sum())
+    if not total:
+        return np.empty(0, dtype=np.intp)
+    ends = np.cumsum(counts)
+    return np.arange(total) + np.repeat(starts - (ends - counts), counts)
+
+
+class AdjacencyView(Mapping):
+    """Read-only, dict-compatible view of one side of a GraphIndex.
+
+    Stands in for the `defaultdict(list)` of a Graph: keys are nodes with at least
+    one adjacent node, values are lists of node ids ('nodes') or pipe ids ('pipes').
+    Unknown nodes map to an empty list, without being inserted.
+    """
+
+    def __init__(self, index: GraphIndex, values: str = 'nodes') -> None:
+        """Initialise view over index, listing 'nodes' or 'pipes'."""
+        if values not in ('nodes', 'pipes'):
+            msg = f"values must be 'nodes' or 'pipes', not {values!r}"
+            raise ValueError(msg)
+        self.index = index
+        self.values_type = values
+
+    def __repr__(self) -> str:
+        """Return a string representation of the view."""
+        return f'AdjacencyView({self.values_type}, {len(self)=})'
+
+    def __getitem__(self, node_id: Any) -> list:  # noqa: ANN401
+        """Return adjacent node (or pipe) ids of node_id."""
+        position = self.index.node_position(node_id)
+        if position < 0:
+            return []
+        lo, hi = self.index.offsets[position], self.index.offsets[position + 1]
+        if self.values_type == 'nodes':
+            return self.index.node_labels(self.index.targets[lo:hi])
+        return self.index.pipe_labels(self.index.edge_pipes[lo:hi])
+
+    def __contains__(self, node_id: object) -> bool:
+        """Return True if node_id has adjacent nodes."""
+        position = self.index.node_position(node_id)
+        return position >= 0 and bool(self.index.degree[position])
+
+    def __iter__(self) -> Iterator:
+        """Iterate over node ids with adjacent nodes."""
+        return iter(self.index.node_labels(np.flatnonzero(self.index.degree)))
+
+    def __len__(self) -> int:
+        """Return number of nodes with adjacent nodes."""
+        return int(np.count_nonzero(self.index.degree))
+
+    def get(self, node_id: Any, default: Any = None) -> Any:  # noqa: ANN401
+        """Return adjacent ids of node_id, or default if it has none."""
+        return self[node_id] if node_id in self else default
+
+    def items(self) -> list[tuple]:
+        """Return (node id, adjacent ids) pairs, labelling every edge at once."""
+        index = self.index
+        nodes = np.flatnonzero(index.degree)
+        if self.values_type == 'nodes':
+            values = index.node_labels(index.targets)
+        else:
+            values = index.pipe_labels(index.edge_pipes)
+        offsets = index.offsets.tolist()
+        return [
+            (node_id, values[offsets[node]:offsets[node + 1]])
+            for node_id, node in zip(index.node_labels(nodes), nodes.tolist())
+        ]
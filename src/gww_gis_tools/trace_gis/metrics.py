@@ -0,0 +1,148 @@
+"""Network metrics for direction correction, kept up to date as a Graph is edited.
+
+    metrics = g.attach_metrics(pipes_gdf.START_NODE.unique())
+    metrics.as_dict()  # unique outfalls, average path length, ...
+    g.reverse_edge('21813_CWW')
+    metrics.as_dict()  # only traces upstream of the reversed pipe were redone
+
+Metrics follow the downstream traces from each start node (as in trace_usage.ipynb):
+the end of path nodes of a downstream trace are the outfalls it reaches, and its
+path length is the number of nodes visited less one.
+"""
+
+from __future__ import annotations
+
+import contextlib
+from collections import Counter
+from collections.abc import Iterable
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+from gww_gis_tools.trace_gis.trace_sewer import DIRECTION, Trace
+
+with contextlib.suppress(ImportError):
+    from typing import Self
+
+if TYPE_CHECKING:
+    from gww_gis_tools.trace_gis.trace_sewer import Graph
+
+
+class NetworkMetrics:
+    """Aggregates over downstream traces from every start node, updated incrementally.
+
+    When a pipe is added, removed or reversed, only start nodes upstream of the
+    changed pipe (before or after the change) are traced again.
+
+    Args:
+    ----
+    - graph: The graph (either direction). Edits made through the graph
+        (add_edge, remove_edge, reverse_edge) update the metrics once attached.
+    - start_nodes: Nodes to trace from (default: every node with a pipe flowing out).
+
+    Attributes:
+    ----------
+    - node_counts: Nodes visited by the downstream trace from each start node.
+    - end_of_path_nodes: Outfalls reached from each start node.
+    - retraced: Number of start nodes traced by the last update.
+
+    Methods:
+    -------
+    - unique_outfalls / outfall_encounters / average_path_length: The metrics.
+    - outfalls(): Outfalls with the number of start nodes reaching each.
+    - as_dict(): All metrics.
+    - recompute(): Retraces every start node.
+    - before_change(start_nodes) / after_change(start_nodes): Called around edits
+        of pipes flowing out of start_nodes.
+    """
+
+    def __init__(self, graph: Graph, start_nodes: Iterable | None = None) -> None:
+        """Initialise and compute metrics for every start node."""
+        self.graph = graph
+        if start_nodes is None:
+            out_degree = graph.out_degree
+            self.start_nodes = graph.index.node_labels(np.flatnonzero(out_degree))
+        else:
+            self.start_nodes = list(dict.fromkeys(start_nodes))
+        self._is_start = set(self.start_nodes)
+        self.node_counts: dict = {}
+        self.end_of_path_nodes: dict = {}
+        self.retraced = 0
+        self._path_length_sum = 0
+        self._outfall_counts: Counter = Counter()
+        self._pending: set = set()
+        self.recompute()
+
+    def __repr__(self) -> str:
+        """Return a string representation of the metrics."""
+        return f'NetworkMetrics({self.as_dict()})'
+
+    @property
+    def unique_outfalls(self) -> int:
+        """Number of distinct outfalls reached from the start nodes."""
+        return len(self._outfall_counts)
+
+    @property
+    def outfall_encounters(self) -> int:
+        """Number of (start node, outfall) pairs."""
+        return sum(self._outfall_counts.values())
+
+    @property
+    def average_path_length(self) -> float:
+        """Mean number of nodes visited less one, over the start nodes."""
+        return self._path_length_sum / len(self.start_nodes) if self.start_nodes else 0.0
+
+    def outfalls(self) -> Counter:
+        """Return outfalls with the number of start nodes that reach each."""
+        return Counter(self._outfall_counts)
+
+    def as_dict(self) -> dict:
+        """Return all metrics."""
+        return {
+            'start_nodes': len(self.start_nodes),
+            'outfall_encounters': self.outfall_encounters,
+            'unique_outfalls': self.unique_outfalls,
+            'average_path_length': self.average_path_length,
+        }
+
+    def recompute(self) -> Self:
+        """Retrace every start node. Returns metrics object."""
+        self.node_counts.clear()
+        self.end_of_path_nodes.clear()
+        self._path_length_sum = 0
+        self._outfall_counts.clear()
+        self._retrace(self.start_nodes)
+        return self
+
+    def before_change(self, start_nodes: Iterable) -> None:
+        """Note start nodes upstream of start_nodes, before their pipes change."""
+        self._pending |= self._upstream(start_nodes)
+
+    def after_change(self, start_nodes: Iterable) -> None:
+        """Retrace start nodes upstream of start_nodes, before or after the change."""
+        affected = self._pending | self._upstream(start_nodes)
+        self._pending = set()
+        for node in affected:
+            self._path_length_sum -= self.node_counts.pop(node) - 1
+            self._outfall_counts.subtract(self.end_of_path_nodes.pop(node))
+        self._outfall_counts = +self._outfall_counts  # drop outfalls no longer reached
+        self._retrace([node for node in self.start_nodes if node in affected])
+
+    def _upstream(self, nodes: Iterable) -> set:
+        """Return start nodes whose downstream trace reaches any of nodes."""
+        tr = Trace(self.graph, direction=DIRECTION.U, cache_size=0).trace(list(nodes))
+        return tr.nodes & self._is_start
+
+    def _retrace(self, start_nodes: list) -> None:
+        """Trace downstream from start_nodes and add them to the aggregates."""
+        self.retraced = len(start_nodes)
+        if not start_nodes:
+            return
+        summary = Trace(self.graph, direction=DIRECTION.D, cache_size=0).trace_many(start_nodes)
+        for node, node_count, ends in zip(
+            summary.index, summary['node_count'].tolist(), summary['end_of_path_nodes'],
+        ):
+            self.node_counts[node] = node_count
+            self.end_of_path_nodes[node] = ends = frozenset(ends)
+            self._path_length_sum += node_count - 1
+            self._outfall_counts.update(ends)
@@ -0,0 +1,282 @@
+"""Copy-on-write corrections on top of a Graph.
+
+    g_corrected = GraphOverlay(g).add_edge('41000_WW', '180060_CWW', 'dummy1').reverse_edge('21813_CWW')
+    tr = Trace(g_corrected).trace('180058_CWW')
+
+The base graph is never modified: an overlay records only added, removed and
+reversed pipes, and derives its index from the base index (sharing its id tables).
+Many candidate overlays can be scored against one large base graph.
+"""
+
+from __future__ import annotations
+
+import contextlib
+from collections import ChainMap, defaultdict
+
+import pandas as pd
+
+from gww_gis_tools.trace_gis.graph_index import AdjacencyView, GraphIndex, ParcelIndex
+from gww_gis_tools.trace_gis.trace_sewer import DIRECTION, Graph
+
+with contextlib.suppress(ImportError):
+    from typing import Self
+
+
+class GraphOverlay(Graph):
+    """A Graph made of a base Graph plus recorded corrections (base left unchanged).
+
+    Works wherever a Graph does (e.g. Trace), read-only apart from the corrections.
+    An overlay of a bidirectional graph is bidirectional: reverse_nodes and
+    reverse_pipes are views over the corrected index.
+
+    Args:
+    ----
+    - base: The graph to correct.
+
+    Attributes:
+    ----------
+    - base: The underlying graph.
+    - added: Pipes added by the overlay, {pipe_id: (start_node, end_node)}.
+    - removed: Base pipes removed by the overlay.
+    - reversed: Base pipes reversed by the overlay.
+
+    Methods:
+    -------
+    - add_edge(start_node, end_node, pipe_id): Records an added pipe.
+    - remove_edge(pipe_id) / reverse_edge(pipe_id): Records a removed/reversed pipe.
+    - corrections(): DataFrame of recorded corrections.
+    - to_graph(): A new (independent) Graph with the corrections applied.
+    """
+
+    def __init__(self, base: Graph) -> None:
+        """Initialise an overlay without corrections."""
+        self.base = base
+        self.direction = base.direction
+        self.bidirectional = base.bidirectional
+        self.added: dict[str | int, tuple] = {}
+        self.removed: set = set()
+        self.reversed: set = set()
+        self.qgis_fids = ChainMap({}, base.qgis_fids)
+        self.qgis_parcel_fids = ChainMap({}, base.qgis_parcel_fids)
+        self._node_attrs: pd.DataFrame | None = None
+        self._pipe_attrs: pd.DataFrame | None = None
+        self._parcels: ParcelIndex | None = None
+        self.metrics = None
+        self._notifying = False
+        self._edits = 0
+        self._index: GraphIndex | None = None
+        self._index_key: tuple | None = None
+
+    def __repr__(self) -> str:
+        """Return a string representation of the overlay."""
+        return (
+            f'GraphOverlay({self.base!r}, added={len(self.added)}, '
+            f'removed={len(self.removed)}, reversed={len(self.reversed)})'
+        )
+
+    @property
+    def version(self) -> int:
+        """Increases with every change to the base graph or the overlay."""
+        return self.base.version + self._edits
+
+    @version.setter
+    def version(self, version: int) -> None:
+        self._edits = version - self.base.version
+
+    @property
+    def index(self) -> GraphIndex:
+        """Base index with the corrections applied (rebuilt after edits)."""
+        base_index = self.base.index
+        key = (base_index, self.version)
+        if self._index is None or self._index_key != key:
+            self._index = self._build_index(base_index)
+            self._index_key = key
+        return self._index
+
+    @property
+    def nodes(self) -> AdjacencyView:
+        """Read-only view of adjacent nodes (as Graph.nodes)."""
+        return AdjacencyView(self.index, 'nodes')
+
+    @property
+    def pipes(self) -> AdjacencyView:
+        """Read-only view of adjacent pipes (as Graph.pipes)."""
+        return AdjacencyView(self.index, 'pipes')
+
+    @property
+    def reverse_nodes(self) -> AdjacencyView | defaultdict:
+        """Read-only view of adjacent nodes in the opposite direction (bidirectional only)."""
+        return AdjacencyView(self.index.reverse, 'nodes') if self.bidirectional else defaultdict(list)
+
+    @property
+    def reverse_pipes(self) -> AdjacencyView | defaultdict:
+        """Read-only view of adjacent pipes in the opposite direction (bidirectional only)."""
+        return AdjacencyView(self.index.reverse, 'pipes') if self.bidirectional else defaultdict(list)
+
+    @property
+    def is_compact(self) -> bool:
+        """Overlays hold no adjacency dictionaries."""
+        return True
+
+    def compact(self) -> Self:
+        """Overlays are always compact. Returns overlay object."""
+        return self
+
+    @property
+    def node_attrs(self) -> pd.DataFrame | None:
+        """Node attributes of the overlay if set, otherwise of the base graph."""
+        return self._node_attrs if self._node_attrs is not None else self.base.node_attrs
+
+    @node_attrs.setter
+    def node_attrs(self, node_attrs: pd.DataFrame | None) -> None:
+        self._node_attrs = node_attrs
+
+    @property
+    def pipe_attrs(self) -> pd.DataFrame | None:
+        """Pipe attributes of the overlay if set, otherwise of the base graph."""
+        return self._pipe_attrs if self._pipe_attrs is not None else self.base.pipe_attrs
+
+    @pipe_attrs.setter
+    def pipe_attrs(self, pipe_attrs: pd.DataFrame | None) -> None:
+        self._pipe_attrs = pipe_attrs
+
+    @property
+    def parcels(self) -> ParcelIndex | None:
+        """Parcel index of the overlay if set, otherwise of the base graph."""
+        return self._parcels if self._parcels is not None else self.base.parcels
+
+    @parcels.setter
+    def parcels(self, parcels: ParcelIndex | None) -> None:
+        self._parcels = parcels
+
+    def add_edge(
+        self,
+        start_node: str | int,
+        end_node: str | int,
+        pipe_id: str | int,
+        qgis_fid: int | None = None,
+    ) -> Self:
+        """Record an added pipe. Returns overlay object.
+
+        An added pipe replaces any base pipe (or earlier added pipe) of the same id.
+        """
+        starts = [start_node] + [start for start, _ in self._edges(pipe_id, missing_ok=True)]
+        with self._changing(starts):
+            self.added[pipe_id] = (start_node, end_node)
+            if qgis_fid:
+                self.qgis_fids.maps[0][pipe_id] = qgis_fid
+            self._edits += 1
+        return self
+
+    def remove_edge(self, pipe_id: str | int) -> Self:
+        """Record a removed pipe. Returns overlay object."""
+        with self._changing([start for start, _ in self._edges(pipe_id)]):
+            if pipe_id in self.added:
+                del self.added[pipe_id]
+                self.qgis_fids.maps[0].pop(pipe_id, None)
+                # a base pipe the added pipe replaced must not come back
+                if self._in_base(pipe_id):
+                    self.removed.add(pipe_id)
+                    self.reversed.discard(pipe_id)
+            else:
+                self.removed.add(pipe_id)
+                self.reversed.discard(pipe_id)
+            self._edits += 1
+        return self
+
+    def reverse_edge(self, pipe_id: str | int) -> Self:
+        """Record a reversed pipe (reversing twice restores it). Returns overlay object."""
+        with self._changing({node for edge in self._edges(pipe_id) for node in edge}):
+            if pipe_id in self.added:
+                start_node, end_node = self.added[pipe_id]
+                self.added[pipe_id] = (end_node, start_node)
+            else:
+                self.reversed ^= {pipe_id}
+            self._edits += 1
+        return self
+
+    def add_qgis_parcel_ids(self, branches_info: dict[int | str, int]) -> Self:
+        """Add parcel fids to pipes in the overlay (copying base lists). Returns overlay object."""
+        local = self.qgis_parcel_fids.maps[0]
+        for pipe_id, parcel_fid in branches_info.items():
+            if pipe_id not in local:
+                local[pipe_id] = list(self.base.qgis_parcel_fids.get(pipe_id, ()))
+            local[pipe_id].append(parcel_fid)
+        return self
+
+    def _in_base(self, pipe_id: str | int) -> bool:
+        """Return True if the base graph has pipe_id."""
+        try:
+            self.base.pipe_edges(pipe_id)
+        except KeyError:
+            return False
+        return True
+
+    def _edges(self, pipe_id: str | int, missing_ok: bool = False) -> list[tuple]:  # noqa: FBT001, FBT002
+        """Return current (start node, end node) edges of pipe_id (KeyError if none)."""
+        if pipe_id in self.added:
+            return [self.added[pipe_id]]
+        if pipe_id in self.removed:
+            if missing_ok:
+                return []
+            raise KeyError(pipe_id)
+        try:
+            edges = self.base.pipe_edges(pipe_id)
+        except KeyError:
+            if missing_ok:
+                return []
+            raise
+        if pipe_id in self.reversed:
+            return [(end, start) for start, end in edges]
+        return edges
+
+    def _add_index(self, index: GraphIndex, compact: bool = False) -> Self:  # noqa: ARG002, FBT001, FBT002
+        """Record every edge of a bulk-built index as an added pipe. Returns overlay."""
+        sources = index.node_labels(index.edge_sources)
+        targets = index.node_labels(index.targets)
+        for source, target, pipe_id in zip(sources, targets, index.pipe_labels(index.edge_pipes)):
+            if self.direction == DIRECTION.U:
+                self.add_edge(target, source, pipe_id)
+            else:
+                self.add_edge(source, target, pipe_id)
+        return self
+
+    def corrections(self) -> pd.DataFrame:
+        """Return recorded corrections: PIPE_ID, action, START_NODE, END_NODE (as corrected)."""
+        rows = [(pipe_id, 'add', start, end) for pipe_id, (start, end) in self.added.items()]
+        rows += [(pipe_id, 'remove', None, None) for pipe_id in self.removed]
+        rows += [
+            (pipe_id, 'reverse', end, start)
+            for pipe_id in self.reversed
+            for start, end in self.base.pipe_edges(pipe_id)
+        ]
+        return pd.DataFrame(rows, columns=['PIPE_ID', 'action', 'START_NODE', 'END_NODE'])
+
+    def to_graph(self) -> Graph:
+        """Return a new Graph with the corrections applied (compact, sharing nothing mutable)."""
+        g = Graph(self.direction, self.bidirectional)._add_index(self.index, compact=True)
+        g.qgis_fids = dict(self.qgis_fids)
+        g.qgis_parcel_fids = defaultdict(list, {pipe_id: list(fids) for pipe_id, fids in self.qgis_parcel_fids.items()})
+        g.node_attrs, g.pipe_attrs, g.parcels = self.node_attrs, self.pipe_attrs, self.parcels
+        return g
+
+    def _build_index(self, base_index: GraphIndex) -> GraphIndex:
+        """Return base_index with removed/reversed pipes dropped and added edges appended."""
+        if not (self.added or self.removed or self.reversed):
+            return base_index
+
+        edges = list(self.added.items())
+        edges += [
+            (pipe_id, (end, start))
+            for pipe_id in self.reversed
+            for start, end in self.base.pipe_edges(pipe_id)
+        ]
+        pipes = [pipe_id for pipe_id, _ in edges]
+        starts = [start for _, (start, _) in edges]
+        ends = [end for _, (_, end) in edges]
+        if self.direction == DIRECTION.U:
+            starts, ends = ends, starts
+
+        # added pipes replace any base pipe of the same id
+        removed = self.removed | self.reversed | self.added.keys()
+        return base_index.patched(list(removed), sources=starts, targets=ends, pipes=pipes)
@@ -0,0 +1,467 @@
+"""Serve traces of a graph held in memory over local HTTP (TCP or a Unix socket).
+
+    python -m gww_gis_tools.trace_gis.service network.graph --port 8765 --reload 2
+
+    client = TraceClient('http://127.0.0.1:8765')  # or TraceClient(unix_socket=...)
+    client.trace('180058_CWW', stop_node=assessed_nodes).pipes
+    client.reaches('180058_CWW', '41000_WW')
+    client.catchment('180058_CWW')['outfall']
+
+The service loads a graph file or snapshot once, so interactive queries skip the
+seconds it takes to read and index the network. Requests are JSON (POST /trace,
+/reaches, /catchment, GET /health); traces run in worker threads, so many
+connections are answered concurrently and the server stays responsive during long
+traces. With reload, the graph is loaded again when its file changes; queries
+already running finish on the graph they started with.
+
+Snapshots are read into memory (not memory-mapped), so a snapshot can be
+rewritten in place while the service runs.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import concurrent.futures
+import contextlib
+import http.client
+import json
+import logging
+import socket
+import threading
+from collections import OrderedDict
+from collections.abc import Iterable
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+from urllib.parse import urlsplit
+
+import numpy as np
+import pandas as pd
+
+from gww_gis_tools.trace_gis.catchments import partition
+from gww_gis_tools.trace_gis.extended_json import read_graph_json
+from gww_gis_tools.trace_gis.snapshot import META, is_snapshot, read_snapshot
+from gww_gis_tools.trace_gis.trace_sewer import (
+    DIRECTION,
+    ExtendedDecoder,
+    ExtendedEncoder,
+    Graph,
+    Trace,
+    TraceResult,
+)
+
+with contextlib.suppress(ImportError):
+    from typing import Self
+
+if TYPE_CHECKING:
+    from collections.abc import Sequence
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_URL = 'http://127.0.0.1:8765'
+TRACER_ARGS = ('stop_node', 'stop_pipes', 'pipe_filter', 'direction')
+TRACE_CACHE_SIZE = 128  # results per tracer: only serialised, so safe to share
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 500: 'Internal Server Error'}
+
+
+class TraceService:
+    """Holds a graph in memory and answers trace queries sent over local HTTP.
+
+    Args:
+    ----
+    - path: Graph JSON file or snapshot directory to serve.
+    - reload_interval: Seconds between checks of path for changes (None: never
+        reload).
+    - max_workers: Number of threads running queries (default as for
+        ThreadPoolExecutor).
+    - tracer_cache_size: Number of tracers (compiled stop conditions) kept, per
+        loaded graph.
+
+    Attributes:
+    ----------
+    - graph: The graph being served.
+    - version: Number of times the graph has been loaded.
+
+    Methods:
+    -------
+    - start(host, port, unix_socket): Starts serving (and watching path, with
+        reload_interval), returning the asyncio server.
+    - serve_forever(host, port, unix_socket): Starts serving until cancelled.
+    - reload(): Loads the graph again from path.
+    - handle(method, target, body): Answers one request, as (status, response).
+    """
+
+    def __init__(
+        self,
+        path: str | Path,
+        reload_interval: float | None = None,
+        max_workers: int | None = None,
+        tracer_cache_size: int = 32,
+    ) -> None:
+        """Load the graph."""
+        self.path = Path(path)
+        self.reload_interval = reload_interval
+        self.tracer_cache_size = tracer_cache_size
+        self.version = 0
+        self._threads = concurrent.futures.ThreadPoolExecutor(max_workers, thread_name_prefix='trace_service')
+        self._watcher: asyncio.Task | None = None
+        self.reload()
+
+    def reload(self) -> None:
+        """Load the graph from path, replacing the one served (queries running keep theirs)."""
+        stamp = _stamp(self.path)
+        graph = load_graph(self.path)
+        # swapped in one assignment: a query sees the old or the new state, never a mix
+        self._state = _GraphState(graph)
+        self._stamp = stamp
+        self.version += 1
+        logger.info('Loaded %s (version %d): %r', self.path, self.version, graph)
+
+    @property
+    def graph(self) -> Graph:
+        """The graph being served."""
+        return self._state.graph
+
+    async def start(
+        self,
+        host: str = '127.0.0.1',
+        port: int = 8765,
+        unix_socket: str | Path | None = None,
+    ) -> asyncio.AbstractServer:
+        """Start serving on host and port, or on unix_socket, and watching path."""
+        if unix_socket is not None:
+            server = await asyncio.start_unix_server(self._connection, path=str(unix_socket))
+        else:
+            server = await asyncio.start_server(self._connection, host, port)
+        if self.reload_interval and self._watcher is None:
+            self._watcher = asyncio.get_running_loop().create_task(self._watch())
+        return server
+
+    async def serve_forever(
+        self,
+        host: str = '127.0.0.1',
+        port: int = 8765,
+        unix_socket: str | Path | None = None,
+    ) -> None:
+        """Serve until cancelled."""
+        server = await self.start(host, port, unix_socket)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            if self._watcher is not None:
+                self._watcher.cancel()
+                self._watcher = None
+            self._threads.shutdown(wait=False)
+
+    def handle(self, method: str, target: str, body: bytes) -> tuple[int, Any]:
+        """Answer a request: return the status and the object to send back as JSON."""
+        route = urlsplit(target).path.rstrip('/')
+        handlers = {
+            '/health': ('GET', self._health),
+            '/trace': ('POST', self._trace),
+            '/reaches': ('POST', self._reaches),
+            '/catchment': ('POST', self._catchment),
+        }
+        if route not in handlers:
+            return 404, {'error': f'Unknown path: {route!r}'}
+        expected, handler = handlers[route]
+        if method != expected:
+            return 405, {'error': f'{route} expects {expected}'}
+        try:
+            query = json.loads(body or b'{}')
+            if not isinstance(query, dict):
+                msg = 'Query must be a JSON object'
+                raise TypeError(msg)  # noqa: TRY301
+            return 200, handler(self._state, query)
+        except (KeyError, ValueError, TypeError) as e:
+            return 400, {'error': f'{type(e).__name__}: {e}'}
+        except Exception as e:
+            logger.exception('Query to %s failed', route)
+            return 500, {'error': f'{type(e).__name__}: {e}'}
+
+    def _health(self, state: _GraphState, query: dict) -> dict:  # noqa: ARG002
+        index = state.graph.index
+        return {
+            'path': str(self.path),
+            'version': self.version,
+            'direction': state.graph.direction.value,
+            'nodes': index.n_nodes,
+            'pipes': index.n_pipes,
+        }
+
+    def _trace(self, state: _GraphState, query: dict) -> TraceResult:
+        tracer, lock = state.tracer(query, self.tracer_cache_size)
+        with lock:
+            return tracer.trace(
+                query['first_node'],
+                trace_name=query.get('trace_name', ''),
+                tag_sources=bool(query.get('tag_sources', False)),
+                compact=True,
+            )
+
+    def _reaches(self, state: _GraphState, query: dict) -> bool:
+        tracer, lock = state.tracer(query, self.tracer_cache_size)
+        with lock:
+            return tracer.reaches(query['first_node'], query['last_node'])
+
+    def _catchment(self, state: _GraphState, query: dict) -> dict:
+        return state.catchment(query['node'])
+
+    async def _connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Answer requests on a connection (kept open between requests) until it closes."""
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b'\r\n\r\n')
+                except asyncio.IncompleteReadError:
+                    return  # closed between requests
+                request_line, *header_lines = head.decode('latin-1').split('\r\n')
+                method, target, _ = request_line.split(' ', 2)
+                headers = {
+                    name.strip().lower(): value.strip()
+                    for name, _, value in (line.partition(':') for line in header_lines if line)
+                }
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+
+                status, response = await loop.run_in_executor(self._threads, self.handle, method, target, body)
+                payload = json.dumps(response, cls=ExtendedEncoder).encode()
+                close = headers.get('connection', '').lower() == 'close'
+                writer.write(
+                    f'HTTP/1.1 {status} {REASONS[status]}\r\n'
+                    'Content-Type: application/json\r\n'
+                    f'Content-Length: {len(payload)}\r\n'
+                    f'Connection: {"close" if close else "keep-alive"}\r\n\r\n'.encode('latin-1') + payload,
+                )
+                await writer.drain()
+                if close:
+                    return
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError):
+            return  # client went away, or not HTTP
+        finally:
+            writer.close()
+            with contextlib.suppress(ConnectionError):
+                await writer.wait_closed()
+
+    async def _watch(self) -> None:
+        """Reload the graph whenever path changes (checked every reload_interval seconds)."""
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.reload_interval)
+            try:
+                if _stamp(self.path) == self._stamp:
+                    continue
+                await loop.run_in_executor(self._threads, self.reload)
+            except Exception:  # noqa: BLE001
+                # e.g. caught mid-write: keep serving the old graph, try again next time
+                logger.warning('Reloading %s failed', self.path, exc_info=True)
+
+
+class _GraphState:
+    """A loaded graph, with tracers and the catchment lookup built for it on demand."""
+
+    def __init__(self, graph: Graph) -> None:
+        self.graph = graph
+        self._tracers: OrderedDict[str, tuple[Trace, threading.Lock]] = OrderedDict()
+        self._catchments: tuple | None = None
+        self._lock = threading.Lock()
+
+    def tracer(self, query: dict, cache_size: int) -> tuple[Trace, threading.Lock]:
+        """Return a tracer for the stop arguments of query, and a lock to trace with."""
+        args = {name: query.get(name) for name in TRACER_ARGS}
+        key = json.dumps(args, sort_keys=True)
+        with self._lock:
+            if key in self._tracers:
+                self._tracers.move_to_end(key)
+                return self._tracers[key]
+
+        tracer = Trace(
+            self.graph,
+            stop_node=_collection(args['stop_node']),
+            stop_pipes=_collection(args['stop_pipes']) or [],
+            direction=DIRECTION(args['direction']) if args['direction'] else None,
+            pipe_filter=args['pipe_filter'],
+            cache_size=TRACE_CACHE_SIZE,
+        )
+        with self._lock:
+            entry = self._tracers.setdefault(key, (tracer, threading.Lock()))
+            while len(self._tracers) > cache_size:
+                self._tracers.popitem(last=False)
+        return entry
+
+    def catchment(self, node: str | int) -> dict:
+        """Return the outfall catchment of node, and the nodes in it."""
+        with self._lock:
+            if self._catchments is None:
+                catchments = partition(self.graph)
+                codes, outfalls = pd.factorize(catchments.to_numpy())
+                order = np.argsort(codes, kind='stable')
+                bounds = np.searchsorted(codes[order], np.arange(len(outfalls) + 1))
+                self._catchments = (catchments, codes, outfalls, catchments.index.to_numpy()[order], bounds)
+        catchments, codes, outfalls, nodes, bounds = self._catchments
+
+        position = catchments.index.get_indexer([node])[0]
+        if position < 0:
+            msg = f'Node not in graph: {node!r}'
+            raise KeyError(msg)
+        code = codes[position]
+        members = nodes[bounds[code]:bounds[code + 1]].tolist()
+        return {'node': node, 'outfall': outfalls[code], 'node_count': len(members), 'nodes': members}
+
+
+class TraceClient:
+    """Sends queries to a running TraceService.
+
+    Args:
+    ----
+    - url: Address of the service (default http://127.0.0.1:8765).
+    - unix_socket: Unix socket of the service, instead of url.
+    - timeout: Seconds to wait for an answer.
+
+    The connection is kept open between queries (and reopened if the service
+    restarted).
+
+    Methods:
+    -------
+    - trace(first_node, **args): Trace result (arguments as for Trace and
+        Trace.trace: stop_node, stop_pipes, pipe_filter, direction, trace_name,
+        tag_sources).
+    - reaches(first_node, last_node, **args): Whether a trace visits last_node.
+    - catchment(node): Outfall catchment of node (outfall, node_count, nodes).
+    - health(): Graph served (path, version, direction, nodes, pipes).
+    """
+
+    def __init__(
+        self,
+        url: str = DEFAULT_URL,
+        unix_socket: str | Path | None = None,
+        timeout: float | None = 60,
+    ) -> None:
+        """Initialise the client (connects on the first query)."""
+        if unix_socket is not None:
+            self._connection = _UnixHTTPConnection(str(unix_socket), timeout=timeout)
+        else:
+            parts = urlsplit(url)
+            self._connection = http.client.HTTPConnection(parts.hostname, parts.port, timeout=timeout)
+
+    def __enter__(self) -> Self:
+        """Return the client."""
+        return self
+
+    def __exit__(self, *args: object) -> None:
+        """Close the connection."""
+        self.close()
+
+    def trace(self, first_node: str | int | Iterable, **args: Any) -> TraceResult:  # noqa: ANN401
+        """Return the trace from first_node (or from each of several start nodes)."""
+        return self._query('POST', '/trace', {'first_node': _jsonable(first_node), **_tracer_args(args)})
+
+    def reaches(self, first_node: str | int, last_node: str | int, **args: Any) -> bool:  # noqa: ANN401
+        """Return True if a trace from first_node visits last_node."""
+        return self._query(
+            'POST', '/reaches', {'first_node': first_node, 'last_node': last_node, **_tracer_args(args)},
+        )
+
+    def catchment(self, node: str | int) -> dict:
+        """Return the outfall catchment of node: outfall, node_count and nodes."""
+        return self._query('POST', '/catchment', {'node': node})
+
+    def health(self) -> dict:
+        """Return what the service is serving."""
+        return self._query('GET', '/health')
+
+    def close(self) -> None:
+        """Close the connection."""
+        self._connection.close()
+
+    def _query(self, method: str, route: str, query: dict | None = None) -> Any:  # noqa: ANN401
+        """Send a query (sent again once if a kept-open connection was closed)."""
+        body = json.dumps(query).encode() if query is not None else None
+        headers = {'Content-Type': 'application/json'}
+        for attempt in range(2):
+            try:
+                self._connection.request(method, route, body, headers)
+                response = self._connection.getresponse()
+                payload = response.read()
+                break
+            except (ConnectionError, http.client.BadStatusLine):
+                self._connection.close()
+                if attempt:
+                    raise
+
+        answer = json.loads(payload, cls=ExtendedDecoder)
+        if response.status == 400:  # noqa: PLR2004
+            raise ValueError(answer['error'])
+        if response.status != 200:  # noqa: PLR2004
+            msg = f'Trace service error ({response.status}): {answer["error"]}'
+            raise RuntimeError(msg)
+        return answer
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTPConnection over a Unix socket."""
+
+    def __init__(self, path: str, timeout: float | None = None) -> None:
+        super().__init__('localhost', timeout=timeout)
+        self.unix_socket = path
+
+    def connect(self) -> None:
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.unix_socket)
+
+
+def load_graph(path: str | Path) -> Graph:
+    """Read a snapshot directory (into memory) or graph JSON file as a compact graph."""
+    if is_snapshot(path):
+        return read_snapshot(path, mmap=False)
+    return read_graph_json(path)
+
+
+def _stamp(path: Path) -> tuple[int, int]:
+    """Return (modified time, size) of path (of the metadata of a snapshot, written last)."""
+    stat = (path / META if path.is_dir() else path).stat()
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _collection(value: Any) -> Any:  # noqa: ANN401
+    """Return a list sent as JSON as a set of ids (conditions, as text, unchanged)."""
+    return frozenset(value) if isinstance(value, list) else value
+
+
+def _jsonable(value: Any) -> Any:  # noqa: ANN401
+    """Return sets and tuples of ids as lists."""
+    return list(value) if isinstance(value, (set, frozenset, tuple)) else value
+
+
+def _tracer_args(args: dict) -> dict:
+    """Return keyword arguments of a client query as JSON values.
+
+    Conditions are sent as text (functions cannot be sent).
+    """
+    args = {name: _jsonable(value) for name, value in args.items()}
+    if isinstance(args.get('direction'), DIRECTION):
+        args['direction'] = args['direction'].value
+    return args
+
+
+def main(argv: Sequence[str] | None = None) -> None:
+    """Run the service from the command line."""
+    parser = argparse.ArgumentParser(description='Serve traces of a graph file or snapshot over local HTTP.')
+    parser.add_argument('path', help='graph JSON file or snapshot directory')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--unix-socket', help='serve on this Unix socket instead of host and port')
+    parser.add_argument('--reload', type=float, metavar='SECONDS', help='reload the graph when path changes')
+    parser.add_argument('--workers', type=int, help='number of query threads')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    service = TraceService(args.path, reload_interval=args.reload, max_workers=args.workers)
+    with contextlib.suppress(KeyboardInterrupt):
+        asyncio.run(service.serve_forever(args.host, args.port, args.unix_socket))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,178 @@
+"""Binary graph snapshots: a directory of NumPy arrays, opened memory-mapped.
+
+    g.to_snapshot('network.graph')
+    g = Graph.from_file('network.graph')  # opens in milliseconds, arrays read on demand
+
+A snapshot holds the graph index (id tables and CSR arrays), QGIS fids and parcel
+index as .npy files, with a meta.json describing them. Arrays are memory-mapped
+read-only, so processes opening the same snapshot share one copy in the page
+cache. Ids of mixed types (integers and text) are kept in meta.json instead.
+"""
+
+from __future__ import annotations
+
+import json
+from collections.abc import Iterator, MutableMapping
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+import pandas as pd
+
+from gww_gis_tools.trace_gis.graph_index import ExtendedIdTable, GraphIndex, IdTable, ParcelIndex
+from gww_gis_tools.trace_gis.trace_sewer import DIRECTION, Graph
+
+META = 'meta.json'
+FORMAT = 'gww_gis_tools.graph_snapshot'
+FORMAT_VERSION = 1
+
+
+def is_snapshot(path: str | Path) -> bool:
+    """Return True if path is a snapshot directory."""
+    path = Path(path)
+    return path.is_dir() and (path / META).is_file()
+
+
+def write_snapshot(graph: Graph, directory: str | Path) -> None:
+    """Write graph to a snapshot directory (created if missing, files overwritten)."""
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    index = graph.index
+
+    for name in ('offsets', 'targets', 'edge_pipes'):
+        np.save(directory / f'{name}.npy', getattr(index, name))
+    fids = np.zeros(index.n_pipes, dtype=np.int64)  # 0: no fid, as in from_gdf
+    qgis_fids = graph.qgis_fids
+    if isinstance(qgis_fids, QgisFids) and qgis_fids._dict is None and qgis_fids.pipe_ids is index.pipe_ids:  # noqa: SLF001
+        fids = qgis_fids.fids
+    elif graph.qgis_fids:
+        positions = index.pipe_positions(list(graph.qgis_fids))
+        found = positions >= 0
+        fids[positions[found]] = np.array(list(graph.qgis_fids.values()), dtype=np.int64)[found]
+    np.save(directory / 'qgis_fids.npy', fids)
+
+    meta = {
+        'format': FORMAT,
+        'format_version': FORMAT_VERSION,
+        'direction': graph.direction.value,
+        'bidirectional': graph.bidirectional,
+        'node_ids': _write_ids(directory, 'node_ids', index.node_ids),
+        'pipe_ids': _write_ids(directory, 'pipe_ids', index.pipe_ids),
+        'parcels': None,
+    }
+    if graph.parcels is not None:
+        np.save(directory / 'parcel_offsets.npy', graph.parcels.offsets)
+        np.save(directory / 'parcels.npy', graph.parcels.parcels)
+        meta['parcels'] = {
+            'pipe_ids': _write_ids(directory, 'parcel_pipe_ids', graph.parcels.pipe_ids),
+            'parcel_ids': _write_ids(directory, 'parcel_ids', graph.parcels.parcel_ids),
+        }
+
+    with (directory / META).open('w') as f:
+        json.dump(meta, f)
+
+
+def read_snapshot(directory: str | Path, mmap: bool = True) -> Graph:  # noqa: FBT001, FBT002
+    """Open a snapshot as a compact Graph (arrays memory-mapped read-only unless mmap=False)."""
+    directory = Path(directory)
+    with (directory / META).open() as f:
+        meta = json.load(f)
+    if meta.get('format') != FORMAT or meta.get('format_version', 0) > FORMAT_VERSION:
+        msg = f'Not a supported graph snapshot: {str(directory)!r}'
+        raise ValueError(msg)
+
+    mmap_mode = 'r' if mmap else None
+    arrays = {
+        name: np.load(directory / f'{name}.npy', mmap_mode=mmap_mode)
+        for name in ('offsets', 'targets', 'edge_pipes', 'qgis_fids')
+    }
+    index = GraphIndex(
+        node_ids=_read_ids(directory, meta['node_ids'], mmap_mode),
+        pipe_ids=_read_ids(directory, meta['pipe_ids'], mmap_mode),
+        offsets=arrays['offsets'],
+        targets=arrays['targets'],
+        edge_pipes=arrays['edge_pipes'],
+    )
+
+    g = Graph(DIRECTION(meta['direction']), bidirectional=meta['bidirectional'])
+    g._add_index(index, compact=True)  # noqa: SLF001
+    g.qgis_fids = QgisFids(index.pipe_ids, arrays['qgis_fids'])  # pyright: ignore[reportAttributeAccessIssue]
+    if meta['parcels'] is not None:
+        g.parcels = ParcelIndex(
+            pipe_ids=_read_ids(directory, meta['parcels']['pipe_ids'], mmap_mode),
+            parcel_ids=_read_ids(directory, meta['parcels']['parcel_ids'], mmap_mode),
+            offsets=np.load(directory / 'parcel_offsets.npy', mmap_mode=mmap_mode),
+            parcels=np.load(directory / 'parcels.npy', mmap_mode=mmap_mode),
+        )
+    return g
+
+
+class QgisFids(MutableMapping):
+    """Dict-compatible QGIS fids of pipes, read from a (memory-mapped) array.
+
+    Pipe `i` of pipe_ids has fid `fids[i]` (0 for none). Converted to a plain
+    dictionary on the first change, so opening a snapshot builds no dictionary.
+    """
+
+    def __init__(self, pipe_ids: IdTable, fids: np.ndarray) -> None:
+        """Initialise from a pipe id table and the fid of each pipe."""
+        self.pipe_ids = pipe_ids
+        self.fids = fids
+        self._dict: dict | None = None
+
+    def __repr__(self) -> str:
+        """Return a string representation of the fids."""
+        return f'QgisFids({len(self)=})'
+
+    def __getitem__(self, pipe_id: Any) -> int:  # noqa: ANN401
+        """Return fid of pipe_id."""
+        if self._dict is not None:
+            return self._dict[pipe_id]
+        position = self.pipe_ids.position(pipe_id)
+        if position < 0 or not self.fids[position]:
+            raise KeyError(pipe_id)
+        return int(self.fids[position])
+
+    def __setitem__(self, pipe_id: Any, fid: int) -> None:  # noqa: ANN401
+        """Set fid of pipe_id."""
+        self._materialise()[pipe_id] = fid
+
+    def __delitem__(self, pipe_id: Any) -> None:  # noqa: ANN401
+        """Remove fid of pipe_id."""
+        del self._materialise()[pipe_id]
+
+    def __iter__(self) -> Iterator:
+        """Iterate over pipe ids with a fid."""
+        if self._dict is not None:
+            return iter(self._dict)
+        return iter(self.pipe_ids.labels(np.flatnonzero(self.fids)))
+
+    def __len__(self) -> int:
+        """Return number of pipes with a fid."""
+        return len(self._dict) if self._dict is not None else int(np.count_nonzero(self.fids))
+
+    def _materialise(self) -> dict:
+        """Return fids as a (writable) dictionary, built once."""
+        if self._dict is None:
+            has_fid = np.flatnonzero(self.fids)
+            self._dict = dict(zip(self.pipe_ids.labels(has_fid), self.fids[has_fid].tolist()))
+        return self._dict
+
+
+def _write_ids(directory: Path, name: str, table: IdTable) -> dict:
+    """Write an id table, returning its meta.json entry."""
+    if isinstance(table, ExtendedIdTable):
+        return {'base': _write_ids(directory, name, table.base), 'extra': table.extra.tolist()}
+    if table.is_sorted_array:
+        np.save(directory / f'{name}.npy', table.values)
+        return {'file': f'{name}.npy'}
+    return {'values': table.values.tolist()}
+
+
+def _read_ids(directory: Path, entry: dict, mmap_mode: str | None) -> IdTable:
+    """Read an id table from its meta.json entry."""
+    if 'base' in entry:
+        return ExtendedIdTable(_read_ids(directory, entry['base'], mmap_mode), pd.Index(entry['extra'], dtype=object))
+    if 'file' in entry:
+        return IdTable(np.load(directory / entry['file'], mmap_mode=mmap_mode))
+    return IdTable(pd.Index(entry['values'], dtype=object))
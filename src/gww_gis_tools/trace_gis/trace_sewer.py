@@ -6,11 +6,34 @@ import builtins
 import contextlib
 import inspect
 import json
-from collections import defaultdict
+import operator
+from collections import OrderedDict, defaultdict, namedtuple
+from collections.abc import Iterable, Iterator, Mapping, Set
 from enum import Enum
 from pathlib import Path
 from typing import TYPE_CHECKING, Callable
 
+import numpy as np
+import pandas as pd
+
+from gww_gis_tools.trace_gis.algorithms import (
+    breadth_first_tree,
+    edge_path,
+    frontier_levels,
+    longest_paths,
+    reachability_summary,
+    shortest_paths,
+    strongly_connected_components,
+)
+from gww_gis_tools.trace_gis.conditions import Condition, as_condition
+from gww_gis_tools.trace_gis.graph_index import (
+    POSITION_DTYPE,
+    AdjacencyView,
+    GraphIndex,
+    ParcelIndex,
+    expand_ranges,
+)
+
 with contextlib.suppress(ImportError):
     from typing import Any, Self
 
@@ -18,6 +41,9 @@ if TYPE_CHECKING:
     with contextlib.suppress(ImportError):
         import geopandas as gpd  # pyright: ignore[reportMissingImports]
 
+    from gww_gis_tools.trace_gis.algorithms import ReachableEnds
+    from gww_gis_tools.trace_gis.metrics import NetworkMetrics
+
 
 class DIRECTION(Enum):
     """Specify direction on initialisation."""
@@ -33,50 +59,555 @@ class Graph:
     ----
     - direction: The direction of the graph
         (either 'U' for undirected or 'D' for directed).
+    - bidirectional: Also store adjacency in the opposite direction.
 
     Attributes:
     ----------
     - direction: The direction of the graph.
     - nodes: A dictionary of nodes and their adjacent nodes.
     - pipes: A dictionary of nodes and the pipes associated with them.
+    - index: Interned, array-backed (CSR) copy of nodes/pipes used for tracing.
+    - reverse_nodes/reverse_pipes: As nodes/pipes, opposite direction (bidirectional only).
+    - in_degree/out_degree: Pipes flowing into/out of each node, aligned to index.
+    - node_attrs/pipe_attrs: Optional attribute columns, indexed by node/pipe id.
+    - parcels: Optional ParcelIndex of parcels served by each pipe (see add_parcels).
+    - metrics: Attached NetworkMetrics, if any (see metrics.py).
+    - version: Counter bumped by every mutator (add_edge, remove_edge, from_gdf,
+        add_*_attributes), so cached traces of an older version are never reused.
 
     Methods:
     -------
     - _validate_direction(direction): Validates the input direction.
+    - compact(): Replaces nodes/pipes dictionaries with read-only views over index.
     - from_gdf(links: geopandas.GeoDataFrame | pandas.DataFrame):
-        Converts a (Geo)DataFrame to a graph by adding edges.
+        Converts a (Geo)DataFrame to a graph by adding edges (in bulk).
     - from_dicts(links: list[dict]):
         Converts a list of dictionaries to a graph by adding edges.
     - add_edge(start_node, end_node, pipe_id):
         Adds an edge to the graph based on the direction.
+    - remove_edge(pipe_id) / reverse_edge(pipe_id): Removes or reverses a pipe.
+    - pipe_edges(pipe_id): (start node, end node) of a pipe.
+    - attach_metrics(start_nodes): Network metrics updated incrementally by edits.
+    - to_file(filename) / to_snapshot(directory) / from_file(filename):
+        JSON file, or binary snapshot opened memory-mapped.
+    - index_for(direction): Index for tracing in either direction.
+    - require(nodes, direction): Loads what a trace needs (lazily loaded graphs only).
+    - degree(node) / degree_table(node_ids): In/out pipe counts and node class.
+    - pipe_end_table(links, nodes): Node attributes at both ends of each pipe, with
+        flags for checking pipe directions (flows_downhill, cover level matches).
+    - scc() / find_cycles(): Strongly connected components and the loops they form.
+    - edge_weights(weight): Pipe weights (e.g. GEOM_LENGTH) aligned to index edges.
+    - shortest_path(node, weight) / longest_flow_path(node, weight):
+        Nearest outfall, or longest flow path to an outfall, from node.
+    - distance_to_outfall(weight, how): Shortest or longest distance for every node.
+    - add_node_attributes(nodes) / add_pipe_attributes(links):
+        Keeps attribute columns (e.g. NODE_REF, PIPE_DIA) for conditions.
+    - add_parcels(branches): Indexes parcels served by each pipe, for
+        TraceResult.parcels().
+    - node_mask(condition) / pipe_mask(condition): Evaluates a condition to a mask.
+    - select_nodes(condition) / select_pipes(condition): Ids meeting a condition.
 
     """
 
-    def __init__(self, direction: DIRECTION) -> None:
+    def __init__(self, direction: DIRECTION, bidirectional: bool = False) -> None:  # noqa: FBT001, FBT002
         """Specify direction on initialisation."""
         self.direction = direction
+        self.bidirectional = bidirectional
 
         self.nodes: defaultdict[str | int, list] = defaultdict(list)
         self.pipes: defaultdict[str | int, list] = defaultdict(list)
         self.qgis_fids: dict[int | str, int] = {} # pipes only
         self.qgis_parcel_fids: defaultdict[str | int, list] = defaultdict(list)
+        self.reverse_nodes: defaultdict[str | int, list] = defaultdict(list) # bidirectional only
+        self.reverse_pipes: defaultdict[str | int, list] = defaultdict(list) # bidirectional only
+        self.node_attrs: pd.DataFrame | None = None
+        self.pipe_attrs: pd.DataFrame | None = None
+        self.parcels: ParcelIndex | None = None # see add_parcels
+        self.version = 0 # bumped by mutators
+        self.metrics: NetworkMetrics | None = None # see attach_metrics
+        self._index: GraphIndex | None = None
+        self._pending_removed: list = [] # edits since index was built
+        self._pending_added: list = []
+        self._notifying = False
 
     def __repr__(self) -> str:
         """Return a string representation of the graph."""
         return f'Graph({self.direction}, {len(self.nodes)=})'
 
-    def from_gdf(self, links: gpd.GeoDataFrame, start_id: str = 'START_NODE', end_id: str = 'END_NODE', asset_id: str = '') -> Self:
-        """Use a (Geo)DataFrame to add each row as an edge. Returns graph object."""
-        if asset_id:
-            edges = zip(links[start_id], links[end_id], links[asset_id])
+    @property
+    def index(self) -> GraphIndex:
+        """Interned CSR adjacency, built on first use and patched (or rebuilt) after edits."""
+        if self._index is not None and (self._pending_removed or self._pending_added):
+            self._patch_index()
+        if self._index is None:
+            self._index = GraphIndex.from_adjacency(self.nodes, self.pipes)
+        return self._index
+
+    def _patch_index(self) -> None:
+        """Apply edits made since the index was built (rebuild later if there are many)."""
+        index, removed, added = self._index, self._pending_removed, self._pending_added
+        self._pending_removed, self._pending_added = [], []
+        if len(removed) + len(added) > max(1000, index.n_edges // 20):
+            self._index = None
+            return
+
+        sources, targets, pipes = (list(column) for column in zip(*added)) if added else ([], [], [])
+        self._index = index.patched(removed, sources, targets, pipes)
+        if 'reverse' in index.__dict__:
+            reverse = index.reverse.patched(removed, targets, sources, pipes)
+            reverse.__dict__['reverse'] = self._index
+            self._index.__dict__['reverse'] = reverse
+
+    def _clear_index(self) -> None:
+        """Drop index (and pending edits), to be rebuilt from nodes/pipes on next use."""
+        self._index = None
+        self._pending_removed, self._pending_added = [], []
+
+    def require(self, nodes: Iterable | None, direction: DIRECTION) -> None:
+        """Make sure everything a trace from nodes (None: all nodes) can reach is loaded.
+
+        Called by Trace before tracing. Graphs held in memory have nothing to load
+        (see catchments.LazyGraph).
+        """
+
+    def index_for(self, direction: DIRECTION) -> GraphIndex:
+        """Return index for tracing in direction (reversed index if opposite to graph)."""
+        return self.index if direction == self.direction else self.index.reverse
+
+    @property
+    def in_degree(self) -> np.ndarray:
+        """Number of pipes flowing into each node (aligned to index.node_ids)."""
+        return self.index_for(DIRECTION.U).degree
+
+    @property
+    def out_degree(self) -> np.ndarray:
+        """Number of pipes flowing out of each node (aligned to index.node_ids)."""
+        return self.index_for(DIRECTION.D).degree
+
+    def degree(self, node: str | int) -> tuple[int, int]:
+        """Return (in, out) pipe counts of node."""
+        position = self.index.node_position(node)
+        if position < 0:
+            return 0, 0
+        return int(self.in_degree[position]), int(self.out_degree[position])
+
+    def degree_table(self, node_ids: Iterable | None = None) -> pd.DataFrame:
+        """Return DataFrame of NODE_ID, in_count, out_count and class (e.g. '1-1').
+
+        Rows follow node_ids (e.g. `nodes_gdf['NODE_ID']`) if given, with zero counts
+        for nodes without pipes; otherwise one row per node in the graph.
+        """
+        index = self.index
+        if node_ids is None:
+            node_ids = index.node_ids.to_index()
+            positions = np.arange(index.n_nodes)
+        else:
+            node_ids = pd.Index(node_ids)
+            positions = index.node_positions(node_ids)
+
+        found = positions >= 0
+        in_count = np.where(found, self.in_degree[positions], 0)
+        out_count = np.where(found, self.out_degree[positions], 0)
+        # build each distinct class label once, then gather
+        pair_codes, pairs = pd.factorize((in_count.astype(np.int64) << 32) | out_count)
+        labels = np.array([f'{p >> 32}-{p & 0xFFFFFFFF}' for p in pairs.tolist()], dtype=object)
+        return pd.DataFrame({
+            'NODE_ID': node_ids,
+            'in_count': in_count,
+            'out_count': out_count,
+            'class': labels[pair_codes],
+        })
+
+    def pipe_end_table(
+        self,
+        links: gpd.GeoDataFrame,
+        nodes: gpd.GeoDataFrame,
+        start_id: str = 'START_NODE',
+        end_id: str = 'END_NODE',
+        node_id: str = 'NODE_ID',
+        tolerance: float = 0.0,
+    ) -> pd.DataFrame:
+        """Return node attributes at both ends of each pipe, for checking pipe directions.
+
+        Rows follow links (index kept). Columns are flows_downhill and abs_drop (from
+        START_INVELEV and END_INVELEV); for each end (start_node_*, end_node_*):
+        found, type (NODE_TYPE), depth (NODE_DEPTH), floor (NODE_COVELEV less
+        NODE_DEPTH), match (pipe cover level at that end, START_COVELEV or
+        END_COVELEV, equal to the node's within tolerance) and class (see
+        degree_table); and transposed_nodes, pipes matching neither end but whose
+        cover levels match the nodes at the opposite ends (likely reversed). Ends
+        not in nodes have type and class 'else', and depth and floor 0.
+        """
+        node_ids = pd.Index(nodes[node_id], dtype=object)
+        lookup = pd.DataFrame({
+            'type': nodes['NODE_TYPE'].to_numpy(),
+            'depth': nodes['NODE_DEPTH'].to_numpy(),
+            'cover': nodes['NODE_COVELEV'].to_numpy(),
+            'class': self.degree_table(node_ids)['class'].to_numpy(),
+        }, index=node_ids)
+        lookup = lookup[~lookup.index.duplicated(keep='first')]
+
+        start_level, end_level = (
+            links[column].to_numpy(dtype=float, na_value=np.nan) for column in ('START_INVELEV', 'END_INVELEV')
+        )
+        table = {'flows_downhill': start_level > end_level, 'abs_drop': np.abs(start_level - end_level)}
+        covers, ends = {}, {}
+        for end, id_column in (('start', start_id), ('end', end_id)):
+            # one join per end: node attributes in pipe order
+            end_ids = pd.Index(links[id_column], dtype=object)
+            at_end = lookup.reindex(end_ids)
+            found = end_ids.isin(lookup.index)
+            node_cover = at_end['cover'].to_numpy(dtype=float, na_value=np.nan)
+            depth = at_end['depth'].to_numpy(dtype=float, na_value=np.nan)
+            covers[end] = links[f'{end.upper()}_COVELEV'].to_numpy(dtype=float, na_value=np.nan)
+            ends[end] = (found, node_cover)
+            table |= {
+                f'{end}_node_found': found,
+                f'{end}_node_type': np.where(found, at_end['type'].to_numpy(dtype=object), 'else'),
+                f'{end}_node_depth': np.where(found, depth, 0),
+                f'{end}_node_floor': np.where(found, node_cover - depth, 0),
+                f'{end}_node_match': np.isclose(covers[end], node_cover, rtol=0, atol=tolerance),
+                f'{end}_node_class': np.where(found, at_end['class'].to_numpy(dtype=object), 'else'),
+            }
+
+        (start_found, start_cover), (end_found, end_cover) = ends['start'], ends['end']
+        table['transposed_nodes'] = (
+            start_found & end_found & ~table['start_node_match'] & ~table['end_node_match']
+            & np.isclose(covers['end'], start_cover, rtol=0, atol=tolerance)
+            & np.isclose(covers['start'], end_cover, rtol=0, atol=tolerance)
+        )
+        return pd.DataFrame(table, index=links.index)
+
+    def scc(self) -> pd.Series:
+        """Return strongly connected component label of every node (index NODE_ID).
+
+        Nodes share a label when each can be reached from the other, i.e. they lie on
+        a loop. Iterative and linear time (no recursion limit on large networks).
+        """
+        index = self.index
+        components, _ = strongly_connected_components(index)
+        return pd.Series(components, index=index.node_ids.to_index().rename('NODE_ID'), name='component')
+
+    def find_cycles(self) -> pd.DataFrame:
+        """Return one row per loop (component of 2+ nodes, or a pipe from a node to itself).
+
+        Columns: component, node_count, pipe_count, nodes and pipes (lists of ids
+        inside the component). Largest first. Loops in sewer networks usually point to
+        reversed pipes.
+        """
+        index = self.index
+        components, n_components = strongly_connected_components(index)
+        edge_components = components[index.edge_sources]
+        internal = edge_components == components[index.targets]
+
+        sizes = np.bincount(components, minlength=n_components)
+        pipe_counts = np.bincount(edge_components[internal], minlength=n_components)
+        loops = np.flatnonzero((sizes > 1) | (pipe_counts > 0))
+        loops = loops[np.lexsort((loops, -sizes[loops]))]
+
+        node_order = np.argsort(components, kind='stable')
+        node_starts = np.concatenate([[0], np.cumsum(sizes)])
+        internal_edges = np.flatnonzero(internal)
+        edge_order = internal_edges[np.argsort(edge_components[internal], kind='stable')]
+        edge_starts = np.concatenate([[0], np.cumsum(pipe_counts)])
+
+        return pd.DataFrame({
+            'component': loops,
+            'node_count': sizes[loops],
+            'pipe_count': pipe_counts[loops],
+            'nodes': [
+                index.node_labels(node_order[node_starts[c]:node_starts[c + 1]]) for c in loops.tolist()
+            ],
+            'pipes': [
+                index.pipe_labels(index.edge_pipes[edge_order[edge_starts[c]:edge_starts[c + 1]]])
+                for c in loops.tolist()
+            ],
+        })
+
+    def edge_weights(
+        self,
+        weight: str | Mapping | pd.Series | None = None,
+        index: GraphIndex | None = None,
+        default: float | None = None,
+    ) -> np.ndarray:
+        """Return pipe weights aligned to the edges of index (default: graph index).
+
+        weight is a pipe attribute column (e.g. 'GEOM_LENGTH', see add_pipe_attributes)
+        or a mapping of pipe id to weight; None weighs every pipe 1 (counts pipes).
+        Pipes without a weight get default, or raise ValueError if default is None.
+        """
+        index = index or self.index
+        if weight is None:
+            return np.ones(index.n_edges)
+
+        if isinstance(weight, str):
+            if self.pipe_attrs is None or weight not in self.pipe_attrs.columns:
+                msg = f'Unknown pipe attribute column: {weight!r} (see add_pipe_attributes)'
+                raise KeyError(msg)
+            weight = self.pipe_attrs[weight]
+        weight = weight if isinstance(weight, pd.Series) else pd.Series(weight, dtype=object)
+
+        pipe_weights = np.full(index.n_pipes, np.nan)
+        positions = index.pipe_positions(weight.index)
+        found = positions >= 0
+        pipe_weights[positions[found]] = pd.to_numeric(weight, errors='coerce').to_numpy(dtype=float)[found]
+
+        missing = np.isnan(pipe_weights)
+        if missing.any():
+            if default is None:
+                examples = index.pipe_labels(np.flatnonzero(missing)[:3])
+                msg = f'{int(missing.sum())} pipes have no weight (e.g. {examples}), see default'
+                raise ValueError(msg)
+            pipe_weights[missing] = default
+        return pipe_weights[index.edge_pipes]
+
+    def shortest_path(
+        self,
+        node: str | int,
+        weight: str | Mapping | pd.Series | None = None,
+        default: float | None = None,
+    ) -> PathResult:
+        """Return the path from node to its nearest outfall (node without pipes flowing out).
+
+        weight as for edge_weights (default: fewest pipes). Weights must not be negative.
+        """
+        index = self.index_for(DIRECTION.D)
+        start = index.node_position(node)
+        if start < 0:
+            return PathResult(node, None, [], [], np.inf)
+
+        weights = self.edge_weights(weight, index, default)
+        _, via_edge, end = shortest_paths(index, [start], weights, is_target=index.degree == 0)
+        if end < 0:  # only loops downstream
+            return PathResult(node, None, [], [], np.inf)
+        nodes, edges = edge_path(index, via_edge, end)
+        return self._path_result(index, nodes, edges, float(weights[edges].sum()))
+
+    def longest_flow_path(
+        self,
+        node: str | int,
+        weight: str | Mapping | pd.Series | None = None,
+        default: float | None = None,
+    ) -> PathResult:
+        """Return the longest path from node to an outfall, following flow.
+
+        weight as for edge_weights (default: most pipes). Loops are condensed: a path
+        crosses a loop by its fewest pipes, travel around the loop is not counted.
+        """
+        index = self.index_for(DIRECTION.D)
+        start = index.node_position(node)
+        if start < 0:
+            return PathResult(node, None, [], [], np.inf)
+
+        weights = self.edge_weights(weight, index, default)
+        components, _, exit_edges = longest_paths(index, weights, roots=[start])
+        internal = components[index.edge_sources] == components[index.targets]
+        ones = np.ones(index.n_edges)
+
+        nodes, edges = [start], []
+        while (edge := int(exit_edges[components[nodes[-1]]])) >= 0:
+            source = int(index.edge_sources[edge])
+            if source != nodes[-1]:  # cross the loop to the pipe leaving it
+                is_target = np.zeros(index.n_nodes, dtype=bool)
+                is_target[source] = True
+                _, via_edge, _ = shortest_paths(index, [nodes[-1]], ones, is_target, internal)
+                loop_nodes, loop_edges = edge_path(index, via_edge, source)
+                nodes += loop_nodes[1:]
+                edges += loop_edges
+            edges.append(edge)
+            nodes.append(int(index.targets[edge]))
+        return self._path_result(index, nodes, edges, float(weights[edges].sum()))
+
+    def distance_to_outfall(
+        self,
+        weight: str | Mapping | pd.Series | None = None,
+        how: str = 'shortest',
+        default: float | None = None,
+    ) -> pd.Series:
+        """Return distance from every node to an outfall (index NODE_ID), in one pass.
+
+        how='shortest' gives the distance to the nearest outfall (inf if only loops
+        are downstream), 'longest' the longest flow path (as longest_flow_path).
+        Outfalls have distance 0.
+        """
+        if how == 'shortest':
+            index = self.index_for(DIRECTION.U)
+            distance, _, _ = shortest_paths(
+                index, np.flatnonzero(self.out_degree == 0), self.edge_weights(weight, index, default),
+            )
+        elif how == 'longest':
+            index = self.index_for(DIRECTION.D)
+            components, lengths, _ = longest_paths(index, self.edge_weights(weight, index, default))
+            distance = lengths[components]
         else:
-            edges = zip(links[start_id], links[end_id], range(links.shape[0]))
+            msg = f"how must be 'shortest' or 'longest', not {how!r}"
+            raise ValueError(msg)
+        return pd.Series(distance, index=index.node_ids.to_index().rename('NODE_ID'), name='distance')
+
+    @staticmethod
+    def _path_result(index: GraphIndex, nodes: list, edges: list, length: float) -> PathResult:
+        """Return PathResult for node/edge positions of index, in path order."""
+        return PathResult(
+            index.node_labels(nodes[:1])[0],
+            index.node_labels(nodes[-1:])[0],
+            index.node_labels(nodes),
+            index.pipe_labels(index.edge_pipes[edges]),
+            length,
+        )
 
-        for edge in edges:
-            self.add_edge(*edge)
+    @property
+    def is_compact(self) -> bool:
+        """True if nodes/pipes are views over the index (no dictionaries held)."""
+        return isinstance(self.nodes, AdjacencyView)
 
+    def compact(self) -> Self:
+        """Drop nodes/pipes dictionaries in favour of views over index. Returns graph object.
+
+        Views behave like the dictionaries they replace (read-only). Editing a compact
+        graph (e.g. add_edge) first converts it back to dictionaries.
+        """
+        index = self.index
+        self.nodes = AdjacencyView(index, 'nodes')  # pyright: ignore[reportAttributeAccessIssue]
+        self.pipes = AdjacencyView(index, 'pipes')  # pyright: ignore[reportAttributeAccessIssue]
+        if self.bidirectional:
+            self.reverse_nodes = AdjacencyView(index.reverse, 'nodes')  # pyright: ignore[reportAttributeAccessIssue]
+            self.reverse_pipes = AdjacencyView(index.reverse, 'pipes')  # pyright: ignore[reportAttributeAccessIssue]
         return self
 
+    def _thaw(self) -> None:
+        """Convert compact nodes/pipes views back to (editable) dictionaries."""
+        self.nodes = defaultdict(list, self.nodes.items())
+        self.pipes = defaultdict(list, self.pipes.items())
+        if self.bidirectional:
+            self.reverse_nodes = defaultdict(list, self.reverse_nodes.items())
+            self.reverse_pipes = defaultdict(list, self.reverse_pipes.items())
+
+    def from_gdf(
+        self,
+        links: gpd.GeoDataFrame,
+        start_id: str = 'START_NODE',
+        end_id: str = 'END_NODE',
+        asset_id: str = '',
+        fid_id: str = 'QGIS_FID',
+        compact: bool = False,  # noqa: FBT001, FBT002
+    ) -> Self:
+        """Use a (Geo)DataFrame to add each row as an edge. Returns graph object.
+
+        Rows are factorized and grouped into the index in one pass (no per-row calls).
+        Pipe ids are row numbers unless asset_id is given. QGIS fids are read from
+        fid_id, if the column exists. With compact=True, no dictionaries are built.
+        """
+        starts, ends = links[start_id], links[end_id]
+        pipes = links[asset_id] if asset_id else np.arange(links.shape[0])
+        if self.direction == DIRECTION.U:
+            index = GraphIndex.from_edges(ends, starts, pipes)
+        else:
+            index = GraphIndex.from_edges(starts, ends, pipes)
+
+        if fid_id in links.columns:
+            fids = links[fid_id]
+            has_fid = (fids.notna() & (fids != 0)).to_numpy()
+            self.qgis_fids.update(zip(np.asarray(pipes)[has_fid].tolist(), fids[has_fid].tolist()))
+
+        return self._add_index(index, compact=compact)
+
+    def _add_index(self, index: GraphIndex, compact: bool = False) -> Self:  # noqa: FBT001, FBT002
+        """Add all edges of a bulk-built index. Returns graph object."""
+        self.version += 1
+        if not self.nodes and not self.pipes:
+            self._clear_index()
+            self._index = index
+            if compact:
+                return self.compact()
+            self.nodes, self.pipes = (defaultdict(list, d) for d in index.to_adjacency())
+            if self.bidirectional:
+                self.reverse_nodes, self.reverse_pipes = (
+                    defaultdict(list, d) for d in index.reverse.to_adjacency()
+                )
+            return self
+
+        if self.is_compact:
+            self._thaw()
+        self._clear_index()
+        nodes, pipes = index.to_adjacency()
+        for node, next_nodes in nodes.items():
+            self.nodes[node].extend(next_nodes)
+            self.pipes[node].extend(pipes[node])
+        if self.bidirectional:
+            nodes, pipes = index.reverse.to_adjacency()
+            for node, next_nodes in nodes.items():
+                self.reverse_nodes[node].extend(next_nodes)
+                self.reverse_pipes[node].extend(pipes[node])
+
+        if self.metrics is not None:
+            self.metrics.recompute()
+        return self.compact() if compact else self
+
+    def add_node_attributes(
+        self,
+        nodes: gpd.GeoDataFrame,
+        node_id: str = 'NODE_ID',
+        columns: list[str] | None = None,
+    ) -> Self:
+        """Keep node attribute columns (default: all but geometry). Returns graph object."""
+        self.node_attrs = _attribute_frame(self.node_attrs, nodes, node_id, columns)
+        self.version += 1
+        return self
+
+    def add_pipe_attributes(
+        self,
+        links: gpd.GeoDataFrame,
+        pipe_id: str = 'PIPE_ID',
+        columns: list[str] | None = None,
+    ) -> Self:
+        """Keep pipe attribute columns (default: all but geometry). Returns graph object."""
+        self.pipe_attrs = _attribute_frame(self.pipe_attrs, links, pipe_id, columns)
+        self.version += 1
+        return self
+
+    def add_parcels(
+        self,
+        branches: gpd.GeoDataFrame,
+        pipe_id: str = 'PIPE_ID',
+        parcel_id: str = 'PRCL_GID',
+    ) -> Self:
+        """Index parcels served by each pipe from the branches layer. Returns graph object.
+
+        Branches link each property service to a pipe and a parcel (use
+        parcel_id='SERV_ID' to index services instead). Adds to any parcels indexed
+        before. Pipes need not be in the graph yet.
+        """
+        pipes, parcels = branches[pipe_id], branches[parcel_id]
+        if self.parcels is not None:
+            old_pipes, old_parcels = self.parcels.to_pairs()
+            pipes = pd.concat([pd.Series(old_pipes, dtype=object), pipes], ignore_index=True)
+            parcels = pd.concat([pd.Series(old_parcels, dtype=object), parcels], ignore_index=True)
+        self.parcels = ParcelIndex.from_pairs(pipes, parcels)
+        self.version += 1
+        return self
+
+    def node_mask(self, condition: Condition | str, index: GraphIndex | None = None) -> np.ndarray:
+        """Evaluate condition on node attributes to a mask over index nodes.
+
+        Nodes without attributes do not meet the condition.
+        """
+        return _attribute_mask(self.node_attrs, as_condition(condition), index or self.index, 'node')
+
+    def pipe_mask(self, condition: Condition | str, index: GraphIndex | None = None) -> np.ndarray:
+        """Evaluate condition on pipe attributes to a mask over index pipes.
+
+        Pipes without attributes do not meet the condition.
+        """
+        return _attribute_mask(self.pipe_attrs, as_condition(condition), index or self.index, 'pipe')
+
+    def select_nodes(self, condition: Condition | str) -> list:
+        """Return ids of nodes in the graph meeting condition."""
+        return self.index.node_labels(np.flatnonzero(self.node_mask(condition)))
+
+    def select_pipes(self, condition: Condition | str) -> list:
+        """Return ids of pipes in the graph meeting condition."""
+        return self.index.pipe_labels(np.flatnonzero(self.pipe_mask(condition)))
+
     def from_dicts(self, links: list[dict]) -> Self:
         """Use a list of dictionaries to add rows as an edges. Returns graph object."""
         SUPPORTED_KEYS = ['START_NODE', 'END_NODE', 'PIPE_ID', 'QGIS_FID']
@@ -95,18 +626,104 @@ class Graph:
         qgis_fid: int | None = None,
     ) -> Self:
         """Add field values for a single feature as an edge. Returns graph object."""
-        if self.direction == DIRECTION.U:
-            self.nodes[end_node].append(start_node)
-            self.pipes[end_node].append(pipe_id)
-        elif self.direction == DIRECTION.D:
-            self.nodes[start_node].append(end_node)
-            self.pipes[start_node].append(pipe_id)
+        with self._changing([start_node]):
+            if self.is_compact:
+                self._thaw()
+            self.version += 1
+
+            if self.direction == DIRECTION.U:
+                self.nodes[end_node].append(start_node)
+                self.pipes[end_node].append(pipe_id)
+            elif self.direction == DIRECTION.D:
+                self.nodes[start_node].append(end_node)
+                self.pipes[start_node].append(pipe_id)
+
+            if self.bidirectional and self.direction == DIRECTION.U:
+                self.reverse_nodes[start_node].append(end_node)
+                self.reverse_pipes[start_node].append(pipe_id)
+            elif self.bidirectional and self.direction == DIRECTION.D:
+                self.reverse_nodes[end_node].append(start_node)
+                self.reverse_pipes[end_node].append(pipe_id)
+
+            if self._index is not None:
+                edge = (end_node, start_node) if self.direction == DIRECTION.U else (start_node, end_node)
+                self._pending_added.append((*edge, pipe_id))
+
+            if qgis_fid:
+                self.qgis_fids[pipe_id] = qgis_fid
 
-        if qgis_fid:
-            self.qgis_fids[pipe_id] = qgis_fid
+        return self
 
+    def remove_edge(self, pipe_id: str | int) -> Self:
+        """Remove every edge of pipe_id. Returns graph object."""
+        edges = self.pipe_edges(pipe_id)
+        with self._changing([start for start, _ in edges]):
+            if self.is_compact:
+                self._thaw()
+            self.version += 1
+            self._pending_removed.append(pipe_id)
+
+            adjacency = [(self.nodes, self.pipes, 1 if self.direction == DIRECTION.U else 0)]
+            if self.bidirectional:
+                adjacency.append((self.reverse_nodes, self.reverse_pipes, 0 if self.direction == DIRECTION.U else 1))
+            for nodes, pipes, side in adjacency:
+                for node in {edge[side] for edge in edges}:
+                    kept = [(n, p) for n, p in zip(nodes[node], pipes[node]) if p != pipe_id]
+                    nodes[node], pipes[node] = [n for n, _ in kept], [p for _, p in kept]
+                    if not kept:
+                        del nodes[node], pipes[node]
+
+            self.qgis_fids.pop(pipe_id, None)
         return self
 
+    def reverse_edge(self, pipe_id: str | int) -> Self:
+        """Swap start and end node of every edge of pipe_id. Returns graph object."""
+        edges = self.pipe_edges(pipe_id)
+        qgis_fid = self.qgis_fids.get(pipe_id)
+        with self._changing({node for edge in edges for node in edge}):
+            self.remove_edge(pipe_id)
+            for start_node, end_node in edges:
+                self.add_edge(end_node, start_node, pipe_id, qgis_fid)
+        return self
+
+    @contextlib.contextmanager
+    def _changing(self, start_nodes: Iterable) -> Iterator[None]:
+        """Tell attached metrics that pipes flowing out of start_nodes are changing."""
+        if self.metrics is None or self._notifying:
+            yield
+            return
+
+        self._notifying = True
+        try:
+            self.metrics.before_change(start_nodes)
+            yield
+        finally:
+            self._notifying = False
+        self.metrics.after_change(start_nodes)
+
+    def attach_metrics(self, start_nodes: Iterable | None = None) -> NetworkMetrics:
+        """Attach (and return) network metrics kept up to date as the graph is edited."""
+        from gww_gis_tools.trace_gis.metrics import NetworkMetrics
+
+        self.metrics = NetworkMetrics(self, start_nodes)
+        return self.metrics
+
+    def pipe_edges(self, pipe_id: str | int) -> list[tuple]:
+        """Return (start node, end node) of every edge of pipe_id (in flow direction).
+
+        Raises KeyError if the pipe is not in the graph.
+        """
+        index = self.index
+        position = index.pipe_ids.position(pipe_id)
+        edges = np.flatnonzero(index.edge_pipes == position) if position >= 0 else []
+        if not len(edges):
+            raise KeyError(pipe_id)
+        sources = index.node_labels(index.edge_sources[edges])
+        targets = index.node_labels(index.targets[edges])
+        if self.direction == DIRECTION.U:
+            return list(zip(targets, sources))
+        return list(zip(sources, targets))
+
     def add_qgis_parcel_ids(
         self,
         branches_info: dict[int | str, int],
@@ -122,15 +739,127 @@ class Graph:
         with Path(filename).open('w') as f:
             json.dump(self, f, cls=ExtendedEncoder, sort_keys=True)
 
+    def to_snapshot(self, directory: str) -> None:
+        """Write graph to a binary snapshot directory, read back by from_file (see snapshot.py)."""
+        from gww_gis_tools.trace_gis.snapshot import write_snapshot
+
+        write_snapshot(self, directory)
+
     @classmethod
     def from_file(cls, filename: str) -> Self:
-        """Read graph object from file."""
+        """Read graph object from file, or memory-map a snapshot directory (see to_snapshot)."""
+        from gww_gis_tools.trace_gis.snapshot import is_snapshot, read_snapshot
+
+        if is_snapshot(filename):
+            return read_snapshot(filename)
         with Path(filename).open() as f:
             return json.load(f, cls=ExtendedDecoder)
 
 
+def _attribute_frame(
+    attrs: pd.DataFrame | None,
+    frame: pd.DataFrame,
+    id_column: str,
+    columns: list[str] | None,
+) -> pd.DataFrame:
+    """Return attribute columns of frame indexed by id_column, added to attrs."""
+    if columns is None:
+        columns = [c for c in frame.columns if c not in (id_column, 'geometry')]
+    new = pd.DataFrame(frame[columns]).set_axis(pd.Index(frame[id_column], dtype=object))
+    new = new[~new.index.duplicated(keep='first')]
+    if attrs is None:
+        return new
+    return new.combine_first(attrs)
+
+
+def _attribute_mask(
+    attrs: pd.DataFrame | None,
+    condition: Condition,
+    index: GraphIndex,
+    kind: str,
+) -> np.ndarray:
+    """Evaluate condition over attrs, scattered to a mask over index nodes or pipes."""
+    if attrs is None:
+        msg = f'Graph has no {kind} attributes (see add_{kind}_attributes)'
+        raise ValueError(msg)
+
+    if kind == 'node':
+        mask = np.zeros(index.n_nodes, dtype=bool)
+        positions = index.node_positions(attrs.index)
+    else:
+        mask = np.zeros(index.n_pipes, dtype=bool)
+        positions = index.pipe_positions(attrs.index)
+    found = positions >= 0
+    mask[positions[found]] = condition.evaluate(attrs)[found]
+    return mask
+
+
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'maxsize', 'currsize'])  # noqa: PYI024
+# a node visited by Trace.iter_trace, the pipes followed from it, and whether a path ends there
+TraceStep = namedtuple('TraceStep', ['node', 'pipes', 'end_of_path'])  # noqa: PYI024
+
+
+class EndOfPathNodes(Set):
+    """Frozenset-like end of path node ids of one trace_many result, found when first used.
+
+    Compares equal to a set with the same ids, and supports len, in, iteration and
+    set operators (which return frozensets).
+
+    Args:
+    ----
+    - ends: End of path node positions per component (see reachability_summary).
+    - component: Component of the start node.
+    - index: Graph index the positions are over.
+    """
+
+    __hash__ = Set._hash
+
+    def __init__(self, ends: ReachableEnds, component: int, index: GraphIndex) -> None:
+        """Initialize EndOfPathNodes."""
+        self._source: tuple | None = (ends, component, index)
+        self._ids: frozenset | None = None
+
+    @classmethod
+    def _from_iterable(cls, it: Iterable) -> frozenset:
+        return frozenset(it)
+
+    def _frozenset(self) -> frozenset:
+        """Return the node ids (searched for once, then kept)."""
+        if self._ids is None:
+            ends, component, index = self._source
+            self._ids = frozenset(index.node_labels(list(ends[component])))
+            self._source = None
+        return self._ids
+
+    def __contains__(self, node: object) -> bool:
+        return node in self._frozenset()
+
+    def __iter__(self) -> Iterator:
+        return iter(self._frozenset())
+
+    def __len__(self) -> int:
+        return len(self._frozenset())
+
+    def __repr__(self) -> str:
+        return f'{type(self).__name__}({set(self._frozenset())!r})'
+
+
 class TraceResult:
-    """Dataclass-like objects for accessing results of tracing."""
+    """Dataclass-like objects for accessing results of tracing.
+
+    For traces from several start nodes, node_sources and pipe_sources optionally
+    map each visited node/pipe to the start node that reached it first.
+
+    Compact results (see from_positions and `Trace.trace(compact=True)`) hold
+    sorted position arrays over the graph index instead of sets of ids. The id
+    sets are only built when nodes/pipes/end_of_path_nodes are first accessed.
+    Results support union (|), intersection (&) and difference (-), which stay
+    compact when both results come from the same index.
+
+    Results of traces on a graph with parcels (see Graph.add_parcels) also give
+    the parcels served by the pipes visited (parcels(), parcel_count()). Results
+    of Trace.trace_levels hold a levels table of frontier sizes by depth.
+    """
 
     def __init__(
         self,
@@ -138,109 +867,751 @@ class TraceResult:
         pipes: set,
         nodes: set,
         end_of_path_nodes: set,
+        node_sources: dict | None = None,
+        pipe_sources: dict | None = None,
     ) -> None:
         """Initialize TraceResult."""
         self.trace_summary = trace_summary
-        self.pipes = pipes
-        self.nodes = nodes
-        self.end_of_path_nodes = end_of_path_nodes
+        self._index: GraphIndex | None = None
+        self._pipes = pipes
+        self._nodes = nodes
+        self._end_of_path_nodes = end_of_path_nodes
+        self.node_sources = node_sources
+        self.pipe_sources = pipe_sources
+        self.parcel_index: ParcelIndex | None = None
+        self.levels: pd.DataFrame | None = None
+
+    @classmethod
+    def from_positions(
+        cls,
+        trace_summary: dict,
+        index: GraphIndex,
+        pipes: np.ndarray,
+        nodes: np.ndarray,
+        end_of_path_nodes: np.ndarray,
+        extra_nodes: frozenset = frozenset(),
+    ) -> Self:
+        """Build a compact result from sorted, unique position arrays over index.
+
+        extra_nodes are ids outside the index (e.g. start nodes not in the graph),
+        which are both visited and end of path nodes.
+        """
+        result = cls.__new__(cls)
+        result.trace_summary = trace_summary
+        result.node_sources = result.pipe_sources = None
+        result.parcel_index = result.levels = None
+        result._index = index
+        result._positions = tuple(
+            np.asarray(a, dtype=POSITION_DTYPE) for a in (pipes, nodes, end_of_path_nodes)
+        )
+        result._extra_nodes = frozenset(extra_nodes)
+        result._pipes = result._nodes = result._end_of_path_nodes = None
+        return result
+
+    @property
+    def is_compact(self) -> bool:
+        """True if the result is held as position arrays over a graph index."""
+        return self._index is not None
+
+    @property
+    def pipes(self) -> set:
+        """Pipe ids visited."""
+        if self._pipes is None:
+            self._pipes = set(self._index.pipe_labels(self._positions[0]))
+        return self._pipes
+
+    @pipes.setter
+    def pipes(self, pipes: set) -> None:
+        self._drop_positions()
+        self._pipes = pipes
+
+    @property
+    def nodes(self) -> set:
+        """Node ids visited."""
+        if self._nodes is None:
+            self._nodes = set(self._index.node_labels(self._positions[1])).union(self._extra_nodes)
+        return self._nodes
+
+    @nodes.setter
+    def nodes(self, nodes: set) -> None:
+        self._drop_positions()
+        self._nodes = nodes
+
+    @property
+    def end_of_path_nodes(self) -> set:
+        """Node ids at the end of each path."""
+        if self._end_of_path_nodes is None:
+            self._end_of_path_nodes = set(
+                self._index.node_labels(self._positions[2]),
+            ).union(self._extra_nodes)
+        return self._end_of_path_nodes
+
+    @end_of_path_nodes.setter
+    def end_of_path_nodes(self, end_of_path_nodes: set) -> None:
+        self._drop_positions()
+        self._end_of_path_nodes = end_of_path_nodes
+
+    @property
+    def pipe_count(self) -> int:
+        """Number of pipes visited (without building the id set)."""
+        return len(self._positions[0]) if self.is_compact else len(self.pipes)
+
+    @property
+    def node_count(self) -> int:
+        """Number of nodes visited (without building the id set)."""
+        if self.is_compact:
+            return len(self._positions[1]) + len(self._extra_nodes)
+        return len(self.nodes)
+
+    def parcels(self) -> set:
+        """Return ids of parcels served by the pipes visited."""
+        parcel_index = self._parcel_index()
+        return set(parcel_index.parcel_ids.labels(self._parcel_positions(parcel_index)))
+
+    def parcel_count(self) -> int:
+        """Return number of parcels served by the pipes visited (without building ids)."""
+        return len(self._parcel_positions(self._parcel_index()))
+
+    def _parcel_index(self) -> ParcelIndex:
+        """Return parcel index of the traced graph (ValueError if it has none)."""
+        if self.parcel_index is None:
+            msg = 'Traced graph has no parcels (see Graph.add_parcels)'
+            raise ValueError(msg)
+        return self.parcel_index
+
+    def _parcel_positions(self, parcel_index: ParcelIndex) -> np.ndarray:
+        """Return parcel positions served by the pipes visited."""
+        if self.is_compact:
+            return parcel_index.parcel_positions(self._positions[0], self._index)
+        return parcel_index.parcel_positions(parcel_index.pipe_ids.positions(self.pipes))
+
+    def id_lists(self) -> tuple[list, list, list]:
+        """Return pipe, node and end of path node ids as lists (without building id sets)."""
+        if not self.is_compact:
+            return list(self.pipes), list(self.nodes), list(self.end_of_path_nodes)
+        extra_nodes = list(self._extra_nodes)
+        return (
+            self._index.pipe_labels(self._positions[0]),
+            self._index.node_labels(self._positions[1]) + extra_nodes,
+            self._index.node_labels(self._positions[2]) + extra_nodes,
+        )
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes held by position arrays (compact results only)."""
+        return sum(a.nbytes for a in self._positions) if self.is_compact else 0
+
+    def _drop_positions(self) -> None:
+        """Materialise id sets and stop holding position arrays (on assignment)."""
+        if self.is_compact:
+            self._pipes, self._nodes, self._end_of_path_nodes = (
+                self.pipes, self.nodes, self.end_of_path_nodes,
+            )
+            self._index = None
+
+    def _combine(self, other: TraceResult, array_op: Callable, set_op: Callable) -> TraceResult:
+        """Combine pipes, nodes and end of path nodes of two results with an op."""
+        if not isinstance(other, TraceResult):
+            return NotImplemented
+
+        if (
+            self.is_compact and other.is_compact
+            and self._index.node_ids is other._index.node_ids
+            and self._index.pipe_ids is other._index.pipe_ids
+        ):
+            pipes, nodes, ends = (
+                array_op(a, b) for a, b in zip(self._positions, other._positions)
+            )
+            extra_nodes = set_op(self._extra_nodes, other._extra_nodes)
+            ends = np.intersect1d(ends, nodes, assume_unique=True)
+            result = TraceResult.from_positions({}, self._index, pipes, nodes, ends, extra_nodes)
+        else:
+            nodes = set_op(self.nodes, other.nodes)
+            result = TraceResult(
+                trace_summary={},
+                pipes=set_op(self.pipes, other.pipes),
+                nodes=nodes,
+                end_of_path_nodes=set_op(self.end_of_path_nodes, other.end_of_path_nodes) & nodes,
+            )
+        result.parcel_index = self.parcel_index or other.parcel_index
+        return result
+
+    def __or__(self, other: TraceResult) -> TraceResult:
+        """Union of two results."""
+        return self._combine(other, np.union1d, operator.or_)
+
+    def __and__(self, other: TraceResult) -> TraceResult:
+        """Intersection of two results."""
+        return self._combine(
+            other, lambda a, b: np.intersect1d(a, b, assume_unique=True), operator.and_,
+        )
+
+    def __sub__(self, other: TraceResult) -> TraceResult:
+        """Difference of two results."""
+        return self._combine(
+            other, lambda a, b: np.setdiff1d(a, b, assume_unique=True), operator.sub,
+        )
 
     def __repr__(self) -> str:
         """Return string representation of TraceResult."""
         return 'TraceResult({}, {})'.format(
-            self.trace_summary['direction'],
-            self.trace_summary['start_node'],
+            self.trace_summary.get('direction'),
+            self.trace_summary.get('start_node'),
+        )
+
+
+class PathResult:
+    """A path between two nodes, from start_node to end_node.
+
+    Paths from Graph (shortest_path, longest_flow_path) follow flow, paths from
+    Trace.path follow the trace direction.
+
+    Attributes:
+    ----------
+    - start_node / end_node: Ends of the path (end_node None if no path was found).
+    - nodes / pipes: Node and pipe ids along the path, in order.
+    - length: Sum of pipe weights (or number of pipes) along the path, inf if no
+        path was found.
+    - frontier: If no path was found, the nodes reached where tracing stopped (end
+        of path nodes, stop nodes and nodes with a blocked pipe), nearest first.
+    """
+
+    def __init__(
+        self,
+        start_node: str | int,
+        end_node: str | int | None,
+        nodes: list,
+        pipes: list,
+        length: float,
+        frontier: list | None = None,
+    ) -> None:
+        """Initialise PathResult."""
+        self.start_node = start_node
+        self.end_node = end_node
+        self.nodes = nodes
+        self.pipes = pipes
+        self.length = length
+        self.frontier = frontier or []
+
+    @property
+    def found(self) -> bool:
+        """True if a path was found."""
+        return self.end_node is not None
+
+    def __repr__(self) -> str:
+        """Return string representation of PathResult."""
+        return (
+            f'PathResult({self.start_node!r} -> {self.end_node!r}, '
+            f'pipe_count={len(self.pipes)}, length={self.length})'
         )
 
 
 class Trace:
     """Used to trace a path through a graph.
 
-    Option to provide a function that returns False to stop tracing.
+    Option to provide a function that returns False to stop tracing. Stop
+    conditions are compiled once (per graph index) into node and edge masks.
+    Conditions on graph attributes (see conditions.py and add_node_attributes),
+    e.g. "NODE_REF startswith 'SPS'", are evaluated vectorized, without a Python
+    call per node.
 
     Args:
     ----
     - graph: The graph to be traced.
-    - stop_node: Optional function to determine when to stop tracing.
+    - stop_node: Optional function, node condition or collection of node ids to
+        determine when to stop tracing.
+    - stop_pipes: Optional pipe ids or pipe condition for pipes not to trace along
+        (each blocks only its own edge).
+    - direction: Optional direction to trace in (defaults to the graph's direction).
+    - pipe_filter: Optional pipe condition, only pipes meeting it are traced along
+        (e.g. 'PIPE_DIA >= 300').
+    - cache_size: Number of trace results to keep (least recently used dropped
+        first). Off by default: a cached result is returned as the same object on
+        every hit, so changes made to it show in later identical traces.
 
     Methods:
     -------
-    - trace(first_node): Traces a path through the graph starting from the first node.
+    - trace(first_node): Traces a path through the graph starting from the first node
+        (or from each of an iterable of start nodes, in one traversal).
+    - trace_levels(first_node, max_depth, max_pipes): Traces a whole frontier at a
+        time (breadth-first), optionally stopping after a number of levels or pipes.
+    - iter_trace(first_node): Yields nodes (and pipes followed) as trace visits them.
+    - reaches(first_node, last_node): Whether a trace visits a node, stopping there.
+    - trace_many(nodes) / trace_all(): Summarises traces from many start nodes at once.
+    - path(first_node, last_node): Ordered nodes and pipes from one node to another,
+        or the frontier where tracing stopped if last_node cannot be reached.
+    - cache_info() / cache_clear(): Trace result cache hits, misses and size.
     """
 
-    def __init__(self, graph: Graph, stop_node: Callable | None = None, stop_pipes: list | set = []) -> None:
+    def __init__(
+        self,
+        graph: Graph,
+        stop_node: Callable | Condition | str | list | set | None = None,
+        stop_pipes: list | set | Condition | str = [],  # noqa: B006
+        direction: DIRECTION | None = None,
+        pipe_filter: Condition | str | None = None,
+        cache_size: int = 0,
+    ) -> None:
         """Initialise Trace."""
         self.graph = graph
-        self.stop_node = stop_node or (lambda x: False) # noqa: ARG005
-        self.stop_pipes = set(stop_pipes)
+        self.direction = direction or graph.direction
+        if isinstance(stop_node, (Condition, str)):
+            stop_node = as_condition(stop_node)
+        elif isinstance(stop_node, (list, tuple, set, frozenset)):
+            stop_node = frozenset(stop_node)
+        self.stop_node = stop_node if stop_node is not None else (lambda x: False) # noqa: ARG005
+        if isinstance(stop_pipes, (Condition, str)):
+            self.stop_pipes = as_condition(stop_pipes)
+        else:
+            self.stop_pipes = frozenset(stop_pipes)
+        self.pipe_filter = as_condition(pipe_filter) if pipe_filter is not None else None
+        self._check_stop_node = stop_node is not None
+        self._compiled = None
+        self.cache_size = cache_size
+        self._cache: OrderedDict[tuple, TraceResult] = OrderedDict()
+        self._cache_hits = self._cache_misses = 0
     
     def trace(
         self,
-        first_node: str | int,
+        first_node: str | int | Iterable,
         trace_name: str = '',
-        summary: bool = False  # noqa: FBT001, FBT002
+        summary: bool = False,  # noqa: FBT001, FBT002
+        tag_sources: bool = False,  # noqa: FBT001, FBT002
+        compact: bool = False,  # noqa: FBT001, FBT002
     ) -> TraceResult:
         """
         Main trace method.
 
         This method tranverses graph object (depth-first) and returns a TraceResult
         containing nodes and pipes visited, and end of path nodes.
+
+        first_node may also be an iterable of start nodes: they are traced in order
+        in one traversal sharing the visited set, so overlapping catchments are only
+        walked once. With tag_sources, the result records the start node that
+        reached each node and pipe first. With compact, the result holds position
+        arrays instead of id sets (see TraceResult).
         """
-        nodes = self.graph.nodes
-        pipes = self.graph.pipes
+        start_nodes, first_node = self._start_nodes(first_node, summary)
+        self.graph.require(start_nodes, self.direction)
 
-        last_node = None
-        node_queue = [first_node]
-        pipes_visited = set()
-        nodes_visited = set()
-        end_of_path_nodes = set()
+        if not self.cache_size:
+            return self._trace(start_nodes, first_node, trace_name, summary, tag_sources, compact)
 
-        while node_queue:
-            next_node = node_queue.pop()
+        key = (
+            tuple(start_nodes), trace_name, summary, tag_sources, compact,
+            self.graph.version, self.direction, self._stop_key(),
+        )
+        result = self._cache.get(key)
+        if result is not None:
+            self._cache_hits += 1
+            self._cache.move_to_end(key)
+            return result
+
+        self._cache_misses += 1
+        if self._cache and next(iter(self._cache))[5] != self.graph.version:
+            self._cache.clear() # graph changed: drop stale results
+        result = self._trace(start_nodes, first_node, trace_name, summary, tag_sources, compact)
+        self._cache[key] = result
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return result
+
+    def trace_levels(
+        self,
+        first_node: str | int | Iterable,
+        max_depth: int | None = None,
+        max_pipes: int | None = None,
+        trace_name: str = '',
+        summary: bool = False,  # noqa: FBT001, FBT002
+        compact: bool = False,  # noqa: FBT001, FBT002
+    ) -> TraceResult:
+        """Trace level by level (breadth-first), optionally only part of the way.
+
+        Expands the whole frontier of each level at once over the graph index,
+        giving the same result as trace when not limited. Stops before pipes more
+        than max_depth pipes away from the start node(s), or once max_pipes pipes
+        have been visited (nearest first), so "first 5 pipes upstream" costs only
+        what it visits. Results are not cached.
+
+        The result's levels table (indexed by depth) gives per level: nodes (the
+        frontier size, nodes first reached at that depth), pipes (pipes first
+        visited from that level) and expanded (False for the level where a limit
+        stopped the trace).
+        """
+        start_nodes, first_node = self._start_nodes(first_node, summary)
+        self.graph.require(start_nodes, self.direction)
+        index = self.graph.index_for(self.direction)
+        positions = index.node_positions(start_nodes)
+        is_stop_node, edge_mask, has_blocked_edge = self._masks(index)
+
+        reached, node_bounds, edges, edge_bounds, ends = frontier_levels(
+            index,
+            positions[positions >= 0],
+            is_stop=is_stop_node,
+            edge_mask=edge_mask if has_blocked_edge.any() else None,
+            max_depth=max_depth,
+            max_pipes=max_pipes,
+        )
+        pipes, first_seen = np.unique(index.edge_pipes[edges], return_index=True)
+        missing = [node for node, pos in zip(start_nodes, positions.tolist()) if pos < 0]
+        result = self._result(
+            self._summary(trace_name, first_node) if summary else {},
+            index,
+            pipes,
+            np.sort(reached),
+            ends,
+            missing,
+            compact,
+        )
+
+        n_levels = max(len(node_bounds) - 1, 1)
+        frontier_sizes = np.zeros(n_levels, dtype=np.int64)
+        frontier_sizes[:len(node_bounds) - 1] = np.diff(node_bounds)
+        frontier_sizes[0] += len(missing)
+        level_pipes = np.bincount(
+            np.searchsorted(edge_bounds, first_seen, side='right') - 1, minlength=n_levels,
+        )[:n_levels]
+        result.levels = pd.DataFrame(
+            {
+                'nodes': frontier_sizes,
+                'pipes': level_pipes,
+                'expanded': np.arange(n_levels) < len(edge_bounds) - 1,
+            },
+            index=pd.RangeIndex(n_levels, name='depth'),
+        )
+        return result
 
-            if self.stop_node(next_node):
-                nodes_visited.add(next_node)
-                end_of_path_nodes.add(next_node)
+    def iter_trace(self, first_node: str | int | Iterable) -> Iterator[TraceStep]:
+        """Yield a TraceStep (node, pipes, end_of_path) for each node as trace visits it.
+
+        Visits nodes in the same (depth-first) order as trace, lazily: stop consuming
+        and the rest of the network is never walked. The pipes of all steps are the
+        pipes of trace, the nodes of steps with end_of_path its end of path nodes.
+        Traces the graph as it is when iteration starts.
+        """
+        start_nodes, _ = self._start_nodes(first_node, summary=False)
+        self.graph.require(start_nodes, self.direction)
+        index = self.graph.index_for(self.direction)
+        start_positions = index.node_positions(start_nodes).tolist()
+        _, edge_mask, _ = self._masks(index)  # stop nodes have no allowed edges
+
+        offsets = memoryview(index.offsets)
+        targets = memoryview(index.targets)
+        edge_pipes = memoryview(index.edge_pipes)
+        allowed = memoryview(edge_mask.view(np.uint8))
+        node_ids, pipe_ids = index.node_ids, index.pipe_ids
+        visited = bytearray(index.n_nodes)
+
+        for start_node, first_position in zip(start_nodes, start_positions):
+            if first_position < 0:
+                # node not in graph: a path of one node
+                yield TraceStep(start_node, [], True)
                 continue
 
-            is_stop_pipe = any(
-                sp in pipes_visited
-                for sp in self.stop_pipes
+            node_queue = [first_position]
+            while node_queue:
+                next_node = node_queue.pop()
+                if visited[next_node]:
+                    continue
+                visited[next_node] = True
+
+                lo, hi = offsets[next_node], offsets[next_node + 1]
+                edges = [e for e in range(lo, hi) if allowed[e]]
+                # only unvisited nodes are queued (same order as queueing all)
+                node_queue.extend(targets[e] for e in edges if not visited[targets[e]])
+                yield TraceStep(node_ids[next_node], [pipe_ids[edge_pipes[e]] for e in edges], not edges)
+
+    def reaches(self, first_node: str | int, last_node: str | int) -> bool:
+        """Return True if a trace from first_node visits last_node.
+
+        Stops searching as soon as last_node is reached, instead of tracing the
+        whole network (see also path, for the pipes in between).
+        """
+        if first_node == last_node:
+            return True
+        self.graph.require([first_node], self.direction)
+        index = self.graph.index_for(self.direction)
+        start, end = index.node_position(first_node), index.node_position(last_node)
+        if start < 0 or end < 0:
+            return False
+        _, edge_mask, _ = self._masks(index)
+        via_edge, _ = breadth_first_tree(index, start, edge_mask, end)
+        return bool(via_edge[end] >= 0)
+
+    @staticmethod
+    def _start_nodes(first_node: str | int | Iterable, summary: bool) -> tuple[list, str | int | Iterable]:  # noqa: FBT001
+        """Return start nodes (unique, in order) and first_node as recorded in trace_summary."""
+        if isinstance(first_node, (str, bytes)) or not isinstance(first_node, Iterable):
+            return [first_node], first_node
+        start_nodes = list(dict.fromkeys(first_node))
+        return start_nodes, start_nodes if summary else first_node
+
+    def _trace(
+        self,
+        start_nodes: list,
+        first_node: str | int | Iterable,
+        trace_name: str,
+        summary: bool,  # noqa: FBT001
+        tag_sources: bool,  # noqa: FBT001
+        compact: bool,  # noqa: FBT001
+    ) -> TraceResult:
+        """Trace from start_nodes (see trace), without the result cache."""
+        index = self.graph.index_for(self.direction)
+        start_positions = index.node_positions(start_nodes).tolist()
+        is_stop_node, edge_mask, has_blocked_edge = self._masks(index)
+        check_edges = has_blocked_edge.any()
+
+        # memoryviews give fast scalar access to the index arrays in a Python loop
+        offsets = memoryview(index.offsets)
+        targets = memoryview(index.targets)
+        allowed = memoryview(edge_mask.view(np.uint8))
+        stop_node = memoryview(is_stop_node.view(np.uint8))
+        partly_blocked = memoryview(has_blocked_edge.view(np.uint8))
+
+        visited = bytearray(index.n_nodes)
+        nodes_visited = []
+        edge_starts = []
+        edge_ends = []
+        end_of_path_nodes = set()
+        # number of nodes/edge ranges visited by the time each start node is done
+        node_bounds = []
+        edge_bounds = []
+
+        for first_position in start_positions:
+            node_queue = [first_position] if first_position >= 0 else []
+
+            while node_queue:
+                next_node = node_queue.pop()
+                if visited[next_node]:
+                    continue
+
+                visited[next_node] = True
+                nodes_visited.append(next_node)
+                lo, hi = offsets[next_node], offsets[next_node + 1]
+
+                if lo == hi or stop_node[next_node]:
+                    end_of_path_nodes.add(next_node)
+                    continue
+
+                if check_edges and partly_blocked[next_node]:
+                    next_nodes = [targets[e] for e in range(lo, hi) if allowed[e]]
+                    if not next_nodes:
+                        end_of_path_nodes.add(next_node)
+                        continue
+                    node_queue.extend(next_nodes)
+                else:
+                    node_queue.extend(targets[lo:hi].tolist())
+                edge_starts.append(lo)
+                edge_ends.append(hi)
+
+            node_bounds.append(len(nodes_visited))
+            edge_bounds.append(len(edge_starts))
+
+        edge_starts = np.array(edge_starts, dtype=np.intp)
+        edge_counts = np.array(edge_ends, dtype=np.intp) - edge_starts
+        edges_visited = expand_ranges(edge_starts, edge_counts)
+        edges_allowed = edge_mask[edges_visited] if check_edges else slice(None)
+        pipe_positions = index.edge_pipes[edges_visited[edges_allowed]]
+        unique_pipes, first_seen = np.unique(pipe_positions, return_index=True)
+        # nodes not in graph: a path of one node
+        missing = [node for node, pos in zip(start_nodes, start_positions) if pos < 0]
+        trace_summary = self._summary(trace_name, first_node) if summary else {}
+
+        node_sources = pipe_sources = None
+        if tag_sources:
+            node_source = np.repeat(np.arange(len(start_nodes)), np.diff(node_bounds, prepend=0))
+            range_source = np.repeat(np.arange(len(start_nodes)), np.diff(edge_bounds, prepend=0))
+            pipe_source = np.repeat(range_source, edge_counts)[edges_allowed][first_seen]
+            node_sources = dict(zip(index.node_labels(nodes_visited), [start_nodes[s] for s in node_source.tolist()]))
+            node_sources.update((node, node) for node in missing)
+            pipe_sources = dict(zip(index.pipe_labels(unique_pipes), [start_nodes[s] for s in pipe_source.tolist()]))
+
+        result = self._result(
+            trace_summary,
+            index,
+            unique_pipes,
+            np.sort(np.array(nodes_visited, dtype=POSITION_DTYPE)),
+            np.sort(np.array(list(end_of_path_nodes), dtype=POSITION_DTYPE)),
+            missing,
+            compact,
+        )
+        result.node_sources, result.pipe_sources = node_sources, pipe_sources
+        return result
+
+    def _result(
+        self,
+        trace_summary: dict,
+        index: GraphIndex,
+        pipes: np.ndarray,
+        nodes: np.ndarray,
+        end_of_path_nodes: np.ndarray,
+        missing: list,
+        compact: bool,  # noqa: FBT001
+    ) -> TraceResult:
+        """Return a result from sorted position arrays (and start nodes not in the graph)."""
+        if compact:
+            result = TraceResult.from_positions(
+                trace_summary, index, pipes, nodes, end_of_path_nodes, extra_nodes=frozenset(missing),
             )
-            if is_stop_pipe:
-                if last_node is not None:
-                    end_of_path_nodes.add(last_node)
+        else:
+            result = TraceResult(
+                trace_summary=trace_summary,
+                pipes=set(index.pipe_labels(pipes)),
+                nodes=set(index.node_labels(nodes)).union(missing),
+                end_of_path_nodes=set(index.node_labels(end_of_path_nodes)).union(missing),
+            )
+        result.parcel_index = self.graph.parcels
+        return result
+
+    def _summary(self, trace_name: str, first_node: str | int | Iterable) -> dict:
+        """Return trace_summary of a trace from first_node."""
+        return {
+            'trace_name': trace_name,
+            'g_size': len(self.graph.nodes),
+            'direction': self.direction,
+            'start_node': first_node,
+            'stop_node_predicate': (
+                repr(self.stop_node) if isinstance(self.stop_node, (Condition, frozenset))
+                else str(inspect.getsource(self.stop_node)).strip()
+            ),
+        }
+
+    def trace_many(self, nodes: Iterable) -> pd.DataFrame:
+        """Summarise a trace from each of nodes, in a single pass over the graph.
+
+        Returns a DataFrame indexed by start node, with node_count (`len(tr.nodes)`)
+        and end_of_path_nodes (`tr.end_of_path_nodes`, as frozenset-like
+        EndOfPathNodes) as trace would give for each node.
+
+        Loops (strongly connected components) are condensed and results shared along
+        chains, instead of retracing the network from every start node. End of path
+        nodes are only searched for when a row's set is first used, so trace_all
+        stays linear in memory on large trees.
+        """
+        nodes = list(nodes)
+        self.graph.require(nodes, self.direction)
+        index = self.graph.index_for(self.direction)
+        positions = index.node_positions(nodes)
+        is_stop_node, edge_mask, _ = self._masks(index)
+        components, counts, end_sets = reachability_summary(
+            index,
+            roots=positions[positions >= 0],
+            edge_mask=edge_mask,
+            is_end=is_stop_node,
+        )
+
+        node_counts = []
+        end_of_path_nodes = []
+        labelled: dict[int, EndOfPathNodes] = {}  # chains share one set of ends
+        found = positions >= 0
+        node_components = np.full(len(positions), -1, dtype=np.int64)
+        node_components[found] = components[positions[found]]
+        for node, comp in zip(nodes, node_components.tolist()):
+            if comp < 0:
+                # node not in graph: a path of one node
+                node_counts.append(1)
+                end_of_path_nodes.append(frozenset([node]))
                 continue
 
-            if next_node not in nodes_visited:
-                last_node = next_node
-                nodes_visited.add(next_node)
-                next_nodes = nodes[next_node]
-                next_pipes = pipes[next_node]
+            shared = end_sets.shared[comp]
+            if shared not in labelled:
+                labelled[shared] = EndOfPathNodes(end_sets, shared, index)
+            node_counts.append(int(counts[comp]))
+            end_of_path_nodes.append(labelled[shared])
 
-                if not next_nodes:
-                    end_of_path_nodes.add(next_node)
+        return pd.DataFrame(
+            {'node_count': node_counts, 'end_of_path_nodes': end_of_path_nodes},
+            index=pd.Index(nodes, name='start_node', dtype=object),
+        )
 
-                node_queue.extend(next_nodes)
-                pipes_visited.update(next_pipes)
+    def trace_all(self) -> pd.DataFrame:
+        """Summarise a trace from every node in the graph (see trace_many)."""
+        self.graph.require(None, self.direction)
+        return self.trace_many(self.graph.index_for(self.direction).node_ids)
 
-        if summary:
-            trace_summary = {
-                'trace_name': trace_name,
-                'g_size': len(self.graph.nodes),
-                'direction': self.graph.direction,
-                'start_node': first_node,
-                'stop_node_predicate': str(inspect.getsource(self.stop_node)).strip(),
-            }
+    def path(self, first_node: str | int, last_node: str | int) -> PathResult:
+        """Return the path (fewest pipes) from first_node to last_node, as trace follows.
+
+        Stop nodes, stop pipes and pipe_filter apply as for trace. If last_node is not
+        reached, the result has no end_node and its frontier lists where the trace
+        from first_node stopped.
+        """
+        self.graph.require([first_node], self.direction)
+        index = self.graph.index_for(self.direction)
+        start, end = index.node_position(first_node), index.node_position(last_node)
+        if start < 0:
+            # as trace, a node not in the graph is a path of one node
+            if first_node == last_node:
+                return PathResult(first_node, last_node, [first_node], [], 0.0)
+            return PathResult(first_node, None, [], [], np.inf, [first_node])
+
+        is_stop_node, edge_mask, has_blocked_edge = self._masks(index)
+        via_edge, reached = breadth_first_tree(index, start, edge_mask, end)
+        if end >= 0 and (end == start or via_edge[end] >= 0):
+            nodes, edges = edge_path(index, via_edge, end)
+            return self.graph._path_result(index, nodes, edges, float(len(edges)))  # noqa: SLF001
+
+        allowed_degree = np.bincount(index.edge_sources[edge_mask], minlength=index.n_nodes)
+        stopped = (allowed_degree == 0) | is_stop_node | has_blocked_edge
+        return PathResult(first_node, None, [], [], np.inf, index.node_labels(reached[stopped[reached]]))
+
+    def _masks(self, index: GraphIndex) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Return stop conditions compiled to masks over index (cached per index).
+
+        Returns (stop node mask over nodes, allowed edge mask over edges, mask of
+        nodes with an out-edge blocked by a stop pipe).
+        """
+        key = (self.graph.version, self._stop_key())
+        if self._compiled is not None and self._compiled[0] is index and self._compiled[1] == key:
+            return self._compiled[2]
+
+        if isinstance(self.stop_node, Condition):
+            is_stop_node = self.graph.node_mask(self.stop_node, index)
+        elif isinstance(self.stop_node, frozenset):
+            is_stop_node = np.zeros(index.n_nodes, dtype=bool)
+            stop_node_positions = index.node_positions(self.stop_node)
+            is_stop_node[stop_node_positions[stop_node_positions >= 0]] = True
+        elif self._check_stop_node:
+            is_stop_node = np.fromiter(
+                (bool(self.stop_node(node)) for node in index.node_ids),
+                dtype=bool,
+                count=index.n_nodes,
+            )
         else:
-            trace_summary = {}
+            is_stop_node = np.zeros(index.n_nodes, dtype=bool)
 
-        return TraceResult(
-            trace_summary=trace_summary,
-            pipes=pipes_visited,
-            nodes=nodes_visited,
-            end_of_path_nodes=end_of_path_nodes,
-        )
+        if isinstance(self.stop_pipes, Condition):
+            is_stop_pipe = self.graph.pipe_mask(self.stop_pipes, index)
+        else:
+            is_stop_pipe = np.zeros(index.n_pipes, dtype=bool)
+            stop_pipe_positions = index.pipe_positions(self.stop_pipes)
+            is_stop_pipe[stop_pipe_positions[stop_pipe_positions >= 0]] = True
+        if self.pipe_filter is not None:
+            is_stop_pipe |= ~self.graph.pipe_mask(self.pipe_filter, index)
+
+        blocked = is_stop_pipe[index.edge_pipes]
+        has_blocked_edge = np.zeros(index.n_nodes, dtype=bool)
+        has_blocked_edge[index.edge_sources[blocked]] = True
+        edge_mask = ~blocked & ~is_stop_node[index.edge_sources]
+
+        self._compiled = (index, key, (is_stop_node, edge_mask, has_blocked_edge))
+        return self._compiled[2]
+
+    def _stop_key(self) -> tuple:
+        """Return hashable stop configuration (results depend on it)."""
+        stop_pipes = self.stop_pipes
+        if not isinstance(stop_pipes, (frozenset, Condition)):
+            stop_pipes = frozenset(stop_pipes)
+        return (self.stop_node, stop_pipes, self.pipe_filter)
+
+    def cache_info(self) -> CacheInfo:
+        """Return trace result cache statistics (hits, misses, maxsize, currsize)."""
+        return CacheInfo(self._cache_hits, self._cache_misses, self.cache_size, len(self._cache))
+
+    def cache_clear(self) -> None:
+        """Clear trace result cache and statistics."""
+        self._cache.clear()
+        self._cache_hits = self._cache_misses = 0
 
 
 class ExtendedEncoder(json.JSONEncoder):
@@ -251,7 +1622,7 @@ class ExtendedEncoder(json.JSONEncoder):
     - default(self, obj): Overrides default behavior for serializing objects
         and uses dynamic method lookup to encode the object.
     - encode_TraceResult(self, tr) -> dict[str, list]: Specifically encodes
-        TraceResult objects into a dictionary.
+        TraceResult objects into a dictionary (ids as lists, see also export.py).
 
     """
 
@@ -283,7 +1654,16 @@ class ExtendedEncoder(json.JSONEncoder):
         return {'_type': o.__name__}
 
     def _encode_TraceResult(self, tr: TraceResult) -> dict[str, list]:  # noqa: N802
-        raise NotImplementedError
+        pipes, nodes, end_of_path_nodes = tr.id_lists()
+        return {
+            'trace_summary': tr.trace_summary,
+            '_pipes': pipes,
+            '_nodes': nodes,
+            '_end_of_path_nodes': end_of_path_nodes,
+            # (ids, sources) pairs: JSON object keys would turn integer ids into text
+            '_node_sources': _pairs(tr.node_sources),
+            '_pipe_sources': _pairs(tr.pipe_sources),
+        }
 
     def _encode_DIRECTION(self, d: DIRECTION) -> dict[str, str]:  # noqa: N802
         return {'_direction': d.value}
@@ -291,10 +1671,25 @@ class ExtendedEncoder(json.JSONEncoder):
     def _encode_Graph(self, g: Graph) -> dict[str, dict | list | str]:  # noqa: N802
         return {
             '_direction': self.default(g.direction),
-            '_nodes': self.default(g.nodes),
-            '_pipes': self.default(g.pipes),
-            '_qgis_fids': self.default(g.qgis_fids)
-        }
+            '_nodes': self.default(defaultdict(list, g.nodes.items()) if g.is_compact else g.nodes),
+            '_pipes': self.default(defaultdict(list, g.pipes.items()) if g.is_compact else g.pipes),
+            '_qgis_fids': self.default(dict(g.qgis_fids)),
+        } | ({'_bidirectional': True} if g.bidirectional else {}) | (
+            {'_parcels': self.default(g.parcels)} if g.parcels is not None else {}
+        )
+
+    def _encode_ParcelIndex(self, p: ParcelIndex) -> dict[str, list]:  # noqa: N802
+        pipes, parcels = p.to_pairs()
+        return {'_pipes': pipes, '_parcels': parcels}
+
+
+def _pairs(mapping: dict | None) -> list[list] | None:
+    """Return mapping as [keys, values] (None if None)."""
+    return None if mapping is None else [list(mapping), list(mapping.values())]
+
+
+# types a `type` object may be decoded to (builtins such as list, by name)
+_DECODABLE_TYPES = {name: t for name, t in vars(builtins).items() if isinstance(t, type)}
 
 
 class ExtendedDecoder(json.JSONDecoder):
@@ -321,6 +1716,8 @@ class ExtendedDecoder(json.JSONDecoder):
 
         Uses dynamic method lookup to decode the object.
         """
+        if type(obj) is not dict:
+            return obj # already decoded (a defaultdict would grow a key on lookup)
         try:
             name = obj['__extended_json_type__']
             decoder = getattr(self, f'_decode_{name}')
@@ -330,7 +1727,14 @@ class ExtendedDecoder(json.JSONDecoder):
             return decoder(obj)
 
     def _decode_TraceResult(self, obj: dict) -> TraceResult:  # noqa: N802
-        raise NotImplementedError
+        return TraceResult(
+            trace_summary=obj['trace_summary'],
+            pipes=set(obj['_pipes']),
+            nodes=set(obj['_nodes']),
+            end_of_path_nodes=set(obj['_end_of_path_nodes']),
+            node_sources=dict(zip(*obj['_node_sources'])) if obj['_node_sources'] else None,
+            pipe_sources=dict(zip(*obj['_pipe_sources'])) if obj['_pipe_sources'] else None,
+        )
 
     def _decode_defaultdict(self, obj: dict) -> defaultdict:
         return defaultdict(
@@ -339,22 +1743,28 @@ class ExtendedDecoder(json.JSONDecoder):
         )
 
     def _decode_type(self, obj: dict) -> type:  # noqa: N802
-        possible_types = {
-            type(getattr(builtins,b)).__name__: getattr(builtins,b)
-            for b in dir(builtins)
-            if type(getattr(builtins,b)) is type
-        }
-        possible_types |= {type(g).__name__: g for g in globals() if type(g) is type}
-        return possible_types[obj['_type']]
+        return _DECODABLE_TYPES[obj['_type']]
+
+    def _decode_ParcelIndex(self, obj: dict) -> ParcelIndex:  # noqa: N802
+        return ParcelIndex.from_pairs(obj['_pipes'], obj['_parcels'])
 
     def _decode_DIRECTION(self, obj: dict) -> DIRECTION:  # noqa: N802
         return DIRECTION(obj['_direction'])
 
     def _decode_Graph(self, g_dict: dict[str, list | dict]) -> Graph:  # noqa: N802
         g = Graph(self.object_hook(g_dict['_direction'])) # pyright: ignore[reportArgumentType]
-        g.nodes = self.object_hook(g_dict['_nodes']) # pyright: ignore[reportArgumentType]
-        g.pipes = self.object_hook(g_dict['_pipes']) # pyright: ignore[reportArgumentType]
-        g.qgis_fids = self.object_hook(g_dict['_qgis_fids']) # pyright: ignore[reportArgumentType]
+        # files written before adjacency was stored as defaultdicts hold plain dicts
+        g.nodes = defaultdict(list, self.object_hook(g_dict['_nodes'])) # pyright: ignore[reportArgumentType]
+        g.pipes = defaultdict(list, self.object_hook(g_dict['_pipes'])) # pyright: ignore[reportArgumentType]
+        g.qgis_fids = self.object_hook(g_dict.get('_qgis_fids', {})) # pyright: ignore[reportArgumentType]
+        if '_parcels' in g_dict:
+            g.parcels = self.object_hook(g_dict['_parcels']) # pyright: ignore[reportAttributeAccessIssue]
+        if g_dict.get('_bidirectional'):
+            # reverse adjacency is not stored, rebuild it from the index
+            g.bidirectional = True
+            g.reverse_nodes, g.reverse_pipes = (
+                defaultdict(list, d) for d in g.index.reverse.to_adjacency()
+            )
         return g
 
 
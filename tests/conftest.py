@@ -67,3 +67,14 @@ def sample_data_path():
         return f'./tests/test_data/trace/{test_mode}/', 'r'
 
     return './tests/test_data/trace/simple/'
+
+
+@pytest.fixture()
+def sample_edges():
+    # flow: A -> B -> C -> E, D -> C
+    return [
+        {'START_NODE': 'A', 'END_NODE': 'B', 'PIPE_ID': 'p1'},
+        {'START_NODE': 'B', 'END_NODE': 'C', 'PIPE_ID': 'p2'},
+        {'START_NODE': 'D', 'END_NODE': 'C', 'PIPE_ID': 'p3'},
+        {'START_NODE': 'C', 'END_NODE': 'E', 'PIPE_ID': 'p4'},
+    ]
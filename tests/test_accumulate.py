@@ -0,0 +1,82 @@
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+from gww_gis_tools.trace_gis import trace_sewer
+from gww_gis_tools.trace_gis.accumulate import accumulate
+
+
+@pytest.fixture()
+def g(sample_edges):
+    # B splits to C and F, rejoining at E
+    g = trace_sewer.Graph(trace_sewer.DIRECTION.U).from_dicts(sample_edges)
+    return g.add_edge('B', 'F', 'p5').add_edge('F', 'E', 'p6')
+
+
+def as_dict(g, result):
+    return dict(zip(g.index.node_labels(range(g.index.n_nodes)), result.tolist()))
+
+
+def test_accumulate_nodes(g):
+    ones = {node: 1 for node in 'ABCDEF'}
+    counts = as_dict(g, accumulate(g, ones))
+    assert counts == {'A': 1, 'B': 2, 'C': 4, 'D': 1, 'E': 6, 'F': 3}
+    for node, count in counts.items():
+        assert count == len(trace_sewer.Trace(g).trace(node).nodes)
+
+    levels = as_dict(g, accumulate(g, {'A': 5, 'D': 7, 'E': 1}, how='max'))
+    assert levels['C'] == 7
+    assert levels['B'] == 5
+    assert np.isnan(accumulate(g, {'A': 5}, how='min', direction=trace_sewer.DIRECTION.D)[g.index.node_position('D')])
+
+
+def test_accumulate_pipes(g):
+    g.add_pipe_attributes(pd.DataFrame({'PIPE_ID': ['p1', 'p2', 'p3', 'p4', 'p5', 'p6'], 'GEOM_LENGTH': [1, 2, 4, 8, 16, 32]}))
+    lengths = as_dict(g, accumulate(g, 'GEOM_LENGTH', on='pipe'))
+    assert lengths == {'A': 0, 'B': 1, 'C': 7, 'D': 0, 'E': 63, 'F': 17}
+
+    # loops are condensed: every node on the loop gets the same result
+    g.add_edge('E', 'B', 'p7')
+    counts = as_dict(g, accumulate(g, np.ones(g.index.n_pipes), on='pipe'))
+    assert counts['B'] == counts['C'] == counts['E'] == counts['F'] == 7
+    with pytest.raises(ValueError):
+        accumulate(g, 'GEOM_LENGTH', how='mean', on='pipe')
+
+
+def test_accumulate_rejoining_paths():
+    # a grid: every node drains right and down, so paths split and rejoin everywhere
+    size = 6
+    edges = [
+        {'START_NODE': f'{row}-{col}', 'END_NODE': f'{row + d_row}-{col + d_col}', 'PIPE_ID': f'{row}-{col}-{d_row}'}
+        for row in range(size) for col in range(size)
+        for d_row, d_col in ((0, 1), (1, 0)) if row + d_row < size and col + d_col < size
+    ]
+    g = trace_sewer.Graph(trace_sewer.DIRECTION.U).from_dicts(edges)
+    counts = as_dict(g, accumulate(g, np.ones(g.index.n_nodes)))
+    lengths = as_dict(g, accumulate(g, np.ones(g.index.n_pipes), on='pipe'))
+    for node in counts:
+        tr = trace_sewer.Trace(g).trace(node)
+        row, col = map(int, node.split('-'))
+        assert counts[node] == len(tr.nodes) == (row + 1) * (col + 1)
+        assert lengths[node] == len(tr.pipes)
+
+
+def test_accumulate_scales_on_trees():
+    # a main line of 10k manholes with a lateral into each: 20k nodes, depth 10k
+    n = 10_000
+    main = [f'm{i}' for i in range(n)]
+    links = pd.DataFrame({
+        'START_NODE': main[1:] + [f'l{i}' for i in range(n)],
+        'END_NODE': main[:-1] + main,
+    })
+    g = trace_sewer.Graph(trace_sewer.DIRECTION.U).from_gdf(links, compact=True)
+
+    for direction in trace_sewer.DIRECTION:
+        start = time.perf_counter()
+        counts = as_dict(g, accumulate(g, np.ones(g.index.n_nodes), direction=direction))
+        assert time.perf_counter() - start < 5  # a search below every node takes minutes
+        if direction == trace_sewer.DIRECTION.U:
+            assert (counts['m0'], counts[f'm{n - 1}'], counts['l0']) == (2 * n, 2, 1)
+        else:
+            assert (counts['m0'], counts[f'm{n - 1}'], counts['l0']) == (1, n, 2)
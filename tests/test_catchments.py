@@ -0,0 +1,49 @@
+import pytest
+from gww_gis_tools.trace_gis import trace_sewer
+from gww_gis_tools.trace_gis.catchments import LazyGraph, cross_links, partition, write_catchments
+
+
+@pytest.fixture()
+def g(sample_edges):
+    # second catchment F -> G, with C overflowing to G
+    g = trace_sewer.Graph(trace_sewer.DIRECTION.U).from_dicts(sample_edges)
+    return g.add_edge('F', 'G', 'p5', 105).add_edge('C', 'G', 'p6')
+
+
+def test_partition(g):
+    catchments = partition(g)
+    assert catchments.to_dict() == {'A': 'E', 'B': 'E', 'C': 'E', 'D': 'E', 'E': 'E', 'F': 'G', 'G': 'G'}
+    links = cross_links(g)
+    assert links[['PIPE_ID', 'START_CATCHMENT', 'END_CATCHMENT']].values.tolist() == [['p6', 'E', 'G']]
+
+
+def test_lazy_graph(g, tmp_path):
+    summary = write_catchments(g, tmp_path)
+    assert summary[['outfall', 'node_count', 'pipe_count']].values.tolist() == [['E', 5, 4], ['G', 2, 1]]
+
+    g_lazy = LazyGraph(tmp_path)
+    assert not g_lazy.loaded
+    tr = trace_sewer.Trace(g_lazy).trace('E')
+    assert g_lazy.loaded == {0}
+    assert tr.nodes == {'A', 'B', 'C', 'D', 'E'}
+
+    # upstream of G enters catchment E through the overflow
+    tr = trace_sewer.Trace(g_lazy).trace('G')
+    assert g_lazy.loaded == {0, 1}
+    assert tr.nodes == trace_sewer.Trace(g).trace('G').nodes
+    assert g_lazy.qgis_fids == {'p5': 105}
+    assert dict(g_lazy.to_graph().nodes) == dict(g.nodes)
+    with pytest.raises(NotImplementedError):
+        g_lazy.add_edge('X', 'Y', 'p7')
+
+    # one direction only, with degree lookups over the loaded catchments
+    assert not g_lazy.bidirectional
+    assert not g_lazy.reverse_nodes
+    with pytest.raises(AttributeError):
+        g_lazy.bidirectional = True
+    assert g_lazy.degree('C') == g.degree('C')
+    assert g_lazy.degree_table(['C', 'G'])['class'].tolist() == g.degree_table(['C', 'G'])['class'].tolist()
+
+    g_down = LazyGraph(tmp_path, trace_sewer.DIRECTION.D)
+    trace_sewer.Trace(g_down).trace('F')
+    assert g_down.loaded == {1}
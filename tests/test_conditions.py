@@ -0,0 +1,38 @@
+import pandas as pd
+import pytest
+from gww_gis_tools.trace_gis.conditions import Condition
+
+
+@pytest.fixture()
+def attrs():
+    return pd.DataFrame({
+        'NODE_REF': ['SPS1', 'MH2', None, 'ERS4'],
+        'PIPE_DIA': [300, None, 150, 450],
+    })
+
+
+@pytest.mark.parametrize(('expression', 'expected'), [
+    ("NODE_REF startswith 'SPS'", [True, False, False, False]),
+    ('PIPE_DIA >= 300', [True, False, False, True]),
+    ("NODE_REF in ['MH2', 'ERS4']", [False, True, False, True]),
+    ("NODE_REF not in ['MH2']", [True, False, False, True]),
+    ('PIPE_DIA isna', [False, True, False, False]),
+])
+def test_parse_evaluate(attrs, expression, expected):
+    assert Condition.parse(expression).evaluate(attrs).tolist() == expected
+
+
+def test_combine(attrs):
+    condition = Condition.parse("NODE_REF startswith 'SPS'") | Condition('NODE_REF', '==', 'ERS4')
+    assert condition.evaluate(attrs).tolist() == [True, False, False, True]
+    assert (~condition & Condition.parse('PIPE_DIA < 200')).evaluate(attrs).tolist() == [
+        False, False, True, False,
+    ]
+    assert condition.columns == {'NODE_REF'}
+
+
+def test_invalid(attrs):
+    with pytest.raises(ValueError, match='Cannot parse'):
+        Condition.parse('NODE_REF startswith')
+    with pytest.raises(KeyError):
+        Condition.parse('MISSING == 1').evaluate(attrs)
@@ -0,0 +1,58 @@
+import multiprocessing
+
+import pandas as pd
+import pytest
+from gww_gis_tools.trace_gis import trace_sewer
+from gww_gis_tools.trace_gis.executor import TraceExecutor, TraceJob
+
+
+def test_trace_executor(sample_edges, tmp_path):
+    g = trace_sewer.Graph(trace_sewer.DIRECTION.U).from_dicts(sample_edges)
+    g.add_pipe_attributes(pd.DataFrame({'PIPE_ID': ['p1', 'p2', 'p3', 'p4'], 'PIPE_DIA': [150, 225, 150, 300]}))
+    jobs = [
+        TraceJob('E'),
+        TraceJob('E', stop_node={'C'}),
+        TraceJob('E', stop_pipes=['p3']),
+        TraceJob('E', pipe_filter='PIPE_DIA >= 200'),
+        TraceJob('A', direction=trace_sewer.DIRECTION.D),
+        TraceJob(['B', 'D', 'missing'], tag_sources=True),
+        'C',
+    ]
+    expected = [
+        trace_sewer.Trace(g, job.stop_node, job.stop_pipes, job.direction, job.pipe_filter).trace(
+            job.first_node, tag_sources=job.tag_sources,
+        )
+        for job in (job if isinstance(job, TraceJob) else TraceJob(job) for job in jobs)
+    ]
+
+    with TraceExecutor(g, max_workers=2, mp_context=multiprocessing.get_context('spawn')) as executor:
+        results = list(executor.map(jobs, chunksize=3))
+        completed = dict(executor.as_completed(['A', 'E']))
+
+    for tr, expected_tr in zip(results, expected):
+        assert tr.is_compact
+        assert (tr.nodes, tr.pipes, tr.end_of_path_nodes) == (
+            expected_tr.nodes, expected_tr.pipes, expected_tr.end_of_path_nodes,
+        )
+        assert tr.node_sources == expected_tr.node_sources
+    assert completed[TraceJob('E')].node_count == 5
+    assert completed[TraceJob('A')].nodes == {'A'}
+
+    # an existing snapshot is shared as is
+    g.to_snapshot(tmp_path / 'g.graph')
+    with TraceExecutor(trace_sewer.Graph.from_file(tmp_path / 'g.graph'), 1, tmp_path / 'g.graph') as executor:
+        assert next(executor.map(['E'])).pipes == {'p1', 'p2', 'p3', 'p4'}
+
+
+def test_trace_executor_stale_snapshot(sample_edges, tmp_path):
+    g = trace_sewer.Graph(trace_sewer.DIRECTION.U).from_dicts(sample_edges)
+    g.to_snapshot(tmp_path / 'g.graph')
+    g.add_edge('E', 'F', 'p5')
+    with pytest.raises(ValueError, match='does not match'):
+        TraceExecutor(g, 1, tmp_path / 'g.graph')
+    # same size, different ids
+    g_other = trace_sewer.Graph(trace_sewer.DIRECTION.U).from_dicts(
+        [{**edge, 'PIPE_ID': edge['PIPE_ID'].upper()} for edge in sample_edges],
+    )
+    with pytest.raises(ValueError, match='does not match'):
+        TraceExecutor(g_other, 1, tmp_path / 'g.graph')
@@ -0,0 +1,53 @@
+import pandas as pd
+import pytest
+from gww_gis_tools.trace_gis import trace_sewer
+from gww_gis_tools.trace_gis.export import join_traces, read_traces, subset, trace_table, write_traces
+
+
+@pytest.fixture
+def results(sample_edges):
+    g = trace_sewer.Graph(trace_sewer.DIRECTION.U).from_dicts(sample_edges)
+    tracer = trace_sewer.Trace(g)
+    return {
+        'C': tracer.trace('C', compact=True),
+        'E': tracer.trace('E'),
+        'BD': tracer.trace(['B', 'D', 'missing'], tag_sources=True, compact=True),
+    }
+
+
+def test_trace_table(results):
+    table = trace_table(results)
+    assert list(table.columns) == ['trace', 'kind', 'id', 'source', 'end_of_path']
+    for name, tr in results.items():
+        rows = table[table['trace'] == name]
+        assert set(rows['id'][rows['kind'] == 'pipe']) == tr.pipes
+        assert set(rows['id'][rows['kind'] == 'node']) == tr.nodes
+        assert set(rows['id'][rows['end_of_path']]) == tr.end_of_path_nodes
+    tagged = table[table['trace'] == 'BD'].set_index('id')['source'].to_dict()
+    assert tagged == {'p1': 'B', 'A': 'B', 'B': 'B', 'D': 'D', 'missing': 'missing'}
+    assert table['source'][table['trace'] == 'C'].isna().all()
+    assert len(trace_table([])) == 0
+
+
+def test_read_write_traces(results, tmp_path):
+    write_traces(results, tmp_path / 'traces.csv')
+    read = read_traces(tmp_path / 'traces.csv')
+    assert list(read) == ['E', 'C', 'BD']
+    for name, tr in results.items():
+        assert (read[name].pipes, read[name].nodes) == (tr.pipes, tr.nodes)
+        assert read[name].end_of_path_nodes == tr.end_of_path_nodes
+        assert read[name].pipe_sources == tr.pipe_sources
+    with pytest.raises(ValueError):
+        write_traces(results, tmp_path / 'traces.txt')
+
+
+def test_subset_join(results):
+    pipes_gdf = pd.DataFrame({'PIPE_ID': ['p1', 'p2', 'p3', 'p4'], 'PIPE_DIA': [150, 225, 150, 300]})
+    assert subset(pipes_gdf, results['C'])['PIPE_ID'].tolist() == ['p1', 'p2', 'p3']
+    nodes_gdf = pd.DataFrame({'NODE_ID': list('ABCDE')})
+    assert subset(nodes_gdf, results['C'], kind='node')['NODE_ID'].tolist() == ['A', 'B', 'C', 'D']
+
+    joined = join_traces(pipes_gdf, results)
+    assert len(joined) == 3 + 4 + 1
+    assert joined[joined['trace'] == 'BD'].set_index('PIPE_ID')['source'].to_dict() == {'p1': 'B'}
+    assert joined.columns.tolist() == ['PIPE_ID', 'PIPE_DIA', 'trace', 'source', 'end_of_path']
@@ -0,0 +1,68 @@
+import pandas as pd
+from gww_gis_tools.trace_gis import trace_sewer
+from gww_gis_tools.trace_gis.extended_json import read_graph_json
+
+
+def assert_same_graph(g, g_ref):
+    assert g.direction == g_ref.direction
+    assert g.bidirectional == g_ref.bidirectional
+    assert dict(g.nodes) == {k: v for k, v in g_ref.nodes.items() if v}
+    assert dict(g.pipes) == {k: v for k, v in g_ref.pipes.items() if v}
+    assert dict(g.qgis_fids) == dict(g_ref.qgis_fids)
+
+
+def test_read_graph_json(sample_edges, tmp_path):
+    g = trace_sewer.Graph(trace_sewer.DIRECTION.U, bidirectional=True).from_dicts(sample_edges)
+    g.add_edge('E', 'F', 'p5', 105)
+    g.add_parcels(pd.DataFrame({'PIPE_ID': ['p1', 'p3'], 'PRCL_GID': [10, 30]}))
+    g.to_file(tmp_path / 'g.json')
+
+    g_json = read_graph_json(tmp_path / 'g.json')
+    assert g_json.is_compact
+    assert_same_graph(g_json, trace_sewer.Graph.from_file(tmp_path / 'g.json'))
+    assert dict(g_json.reverse_nodes) == dict(g.reverse_nodes)
+    assert g_json.qgis_fids == {'p5': 105}
+    assert trace_sewer.Trace(g_json).trace('F').parcels() == {10, 30}
+    assert not read_graph_json(tmp_path / 'g.json', compact=False).is_compact
+
+
+def test_read_graph_json_fallbacks(tmp_path):
+    # integer ids, and escaped text
+    g = trace_sewer.Graph(trace_sewer.DIRECTION.D).from_gdf(
+        pd.DataFrame({'START_NODE': [0, 1, 5], 'END_NODE': [1, 2, 2], 'QGIS_FID': [7, 8, 0]}),
+    )
+    for _ in range(2):
+        g.to_file(tmp_path / 'g.json')
+        assert_same_graph(read_graph_json(tmp_path / 'g.json'), trace_sewer.Graph.from_file(tmp_path / 'g.json'))
+        g.add_edge(2, 'say "X"', 'p\\1')
+
+
+def test_read_graph_json_old_format():
+    filename = './tests/test_data/trace/local/test_graph_file.json'
+    g_ref = trace_sewer.Graph.from_file(filename)
+    g = read_graph_json(filename)
+    assert_same_graph(g, g_ref)
+    assert g.qgis_fids == {}
+
+
+def test_read_graph_json_empty_lists(sample_edges, tmp_path, monkeypatch):
+    g = trace_sewer.Graph(trace_sewer.DIRECTION.U).from_dicts(sample_edges)
+    g.nodes['X'], g.pipes['X']  # an isolated node, listed with no pipes
+    g.to_file(tmp_path / 'g.json')
+    g_ref = trace_sewer.Graph.from_file(tmp_path / 'g.json')
+    assert g_ref.nodes['X'] == []
+
+    g_dicts = read_graph_json(tmp_path / 'g.json', compact=False)
+    assert dict(g_dicts.nodes) == dict(g_ref.nodes)
+    assert dict(g_dicts.pipes) == dict(g_ref.pipes)
+    g_json = read_graph_json(tmp_path / 'g.json')
+    assert g_json.index.node_ids.labels(slice(None)) == g_ref.index.node_ids.labels(slice(None))
+    assert trace_sewer.Trace(g_json).trace('X').nodes == {'X'}
+
+    # one id much longer than the rest: read without padding every id to it
+    monkeypatch.setattr('gww_gis_tools.trace_gis.extended_json._PADDING_ALLOWANCE', 0)
+    g.add_edge('E', 'F' * 1000, 'p5')
+    g.to_file(tmp_path / 'g.json')
+    assert dict(read_graph_json(tmp_path / 'g.json', compact=False).nodes) == dict(
+        trace_sewer.Graph.from_file(tmp_path / 'g.json').nodes,
+    )
@@ -0,0 +1,56 @@
+import time
+
+import pandas as pd
+import pytest
+from gww_gis_tools.trace_gis import trace_sewer
+from gww_gis_tools.trace_gis.metrics import NetworkMetrics
+from gww_gis_tools.trace_gis.overlay import GraphOverlay
+
+
+@pytest.fixture(params=['graph', 'overlay'])
+def g(request, sample_edges):
+    g = trace_sewer.Graph(trace_sewer.DIRECTION.U).from_dicts(sample_edges)
+    return g if request.param == 'graph' else GraphOverlay(g)
+
+
+def test_metrics(g):
+    metrics = g.attach_metrics()
+    assert metrics.as_dict() == {
+        'start_nodes': 4,
+        'outfall_encounters': 4,
+        'unique_outfalls': 1,
+        'average_path_length': (3 + 2 + 1 + 2) / 4,
+    }
+
+
+def test_metrics_incremental(g):
+    metrics = g.attach_metrics()
+    g.reverse_edge('p1')
+    assert metrics.retraced == 2  # only A and B are upstream of p1
+    assert metrics.outfalls() == {'E': 3, 'A': 2}  # A is now an outfall of A and B
+    assert metrics.as_dict() == NetworkMetrics(g, metrics.start_nodes).as_dict()
+
+    g.remove_edge('p2').add_edge('B', 'F', 'p5')
+    assert metrics.unique_outfalls == 3  # A, E and F
+    assert metrics.as_dict() == NetworkMetrics(g, metrics.start_nodes).as_dict()
+
+
+def test_metrics_incremental_on_large_tree():
+    # a main line of 10k manholes (pipe m{i+1} -> m{i} is p{i}) with a lateral into each
+    n = 10_000
+    main = [f'm{i}' for i in range(n)]
+    links = pd.DataFrame({
+        'START_NODE': main[1:] + [f'l{i}' for i in range(n)],
+        'END_NODE': main[:-1] + main,
+        'PIPE_ID': [f'p{i}' for i in range(2 * n - 1)],
+    })
+    g = trace_sewer.Graph(trace_sewer.DIRECTION.U).from_gdf(links, asset_id='PIPE_ID', compact=True)
+    metrics = g.attach_metrics()
+    assert metrics.retraced == 2 * n - 1
+
+    start = time.perf_counter()
+    g.reverse_edge(f'p{n - 10}')  # m{n-9} -> m{n-10}, near the top of the main line
+    assert time.perf_counter() - start < 5
+    # m{n-9}..m{n-1} and their laterals reached it before, m{n-10} and l{n-10} after
+    assert metrics.retraced == 20
+    assert metrics.as_dict() == NetworkMetrics(g, metrics.start_nodes).as_dict()
@@ -0,0 +1,88 @@
+import pytest
+from gww_gis_tools.trace_gis import trace_sewer
+from gww_gis_tools.trace_gis.overlay import GraphOverlay
+
+
+@pytest.fixture(params=[trace_sewer.DIRECTION.U, trace_sewer.DIRECTION.D])
+def g(request, sample_edges):
+    return trace_sewer.Graph(request.param).from_dicts(sample_edges)
+
+
+def test_overlay_leaves_base(g):
+    before = dict(g.nodes), g.version
+    overlay = GraphOverlay(g).add_edge('E', 'F', 'p5').remove_edge('p3').reverse_edge('p1')
+    assert (dict(g.nodes), g.version) == before
+    assert overlay.version > g.version
+    assert set(overlay.corrections().action) == {'add', 'remove', 'reverse'}
+
+
+def test_overlay_matches_graph(g, sample_edges):
+    overlay = GraphOverlay(g).add_edge('E', 'F', 'p5').remove_edge('p3').reverse_edge('p1')
+    corrected = trace_sewer.Graph(g.direction).from_dicts(sample_edges)
+    corrected.add_edge('E', 'F', 'p5').remove_edge('p3').reverse_edge('p1')
+
+    for node in ['A', 'B', 'C', 'D', 'E', 'F']:
+        tr = trace_sewer.Trace(overlay).trace(node)
+        expected = trace_sewer.Trace(corrected).trace(node)
+        assert (tr.nodes, tr.pipes, tr.end_of_path_nodes) == (
+            expected.nodes, expected.pipes, expected.end_of_path_nodes,
+        )
+    assert dict(overlay.to_graph().nodes) == {k: v for k, v in corrected.nodes.items() if v}
+
+
+def test_overlay_trace_cache(g):
+    overlay = GraphOverlay(g)
+    trace = trace_sewer.Trace(overlay, direction=trace_sewer.DIRECTION.D, cache_size=8)
+    assert trace.trace('A').nodes == {'A', 'B', 'C', 'E'}
+    overlay.remove_edge('p2')
+    assert trace.trace('A').nodes == {'A', 'B'}
+    overlay.reverse_edge('p1').reverse_edge('p1')
+    assert trace.trace('A').nodes == {'A', 'B'}
+    g.add_edge('B', 'F', 'p5')
+    assert trace.trace('A').nodes == {'A', 'B', 'F'}
+
+
+def test_overlay_unknown_pipe(g):
+    with pytest.raises(KeyError):
+        GraphOverlay(g).reverse_edge('missing')
+    with pytest.raises(KeyError):
+        GraphOverlay(g).remove_edge('p1').remove_edge('p1')
+
+
+def test_overlay_bidirectional(g, sample_edges):
+    base = trace_sewer.Graph(g.direction, bidirectional=True).from_dicts(sample_edges)
+    overlay = GraphOverlay(base).add_edge('E', 'F', 'p5').reverse_edge('p1')
+    corrected = trace_sewer.Graph(g.direction, bidirectional=True).from_dicts(sample_edges)
+    corrected.add_edge('E', 'F', 'p5').reverse_edge('p1')
+
+    assert overlay.bidirectional
+    for adjacency, expected in ((overlay.reverse_nodes, corrected.reverse_nodes), (overlay.reverse_pipes, corrected.reverse_pipes)):
+        assert {k: set(v) for k, v in adjacency.items()} == {k: set(v) for k, v in expected.items() if v}
+    g_new = overlay.to_graph()
+    assert g_new.bidirectional
+    assert dict(g_new.reverse_nodes) == dict(overlay.reverse_nodes)
+    assert not GraphOverlay(g).reverse_nodes
+
+
+def test_overlay_replace_then_remove(g):
+    # p2 (B-C) replaced by an added pipe, then removed: the base pipe stays gone
+    overlay = GraphOverlay(g).add_edge('B', 'E', 'p2').remove_edge('p2')
+    assert 'p2' in overlay.removed
+    assert trace_sewer.Trace(overlay, direction=trace_sewer.DIRECTION.D).trace('A').nodes == {'A', 'B'}
+    assert 'p2' not in {pipe for pipes in overlay.to_graph().pipes.values() for pipe in pipes}
+
+    overlay = GraphOverlay(g).add_edge('E', 'F', 'p5').remove_edge('p5')
+    assert not overlay.removed
+
+
+def test_overlay_parcel_fids(g):
+    g.add_qgis_parcel_ids({'p1': 10})
+    overlay = GraphOverlay(g).add_qgis_parcel_ids({'p1': 11, 'p2': 20})
+    assert dict(g.qgis_parcel_fids) == {'p1': [10]}
+    assert overlay.qgis_parcel_fids['p1'] == [10, 11]
+    assert overlay.qgis_parcel_fids['p2'] == [20]
+
+    g_copy = overlay.to_graph()
+    g_copy.add_qgis_parcel_ids({'p1': 12})
+    assert overlay.qgis_parcel_fids['p1'] == [10, 11]
+    assert g.qgis_parcel_fids['p1'] == [10]
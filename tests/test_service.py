@@ -0,0 +1,84 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from gww_gis_tools.trace_gis import trace_sewer
+from gww_gis_tools.trace_gis.service import TraceClient, TraceService
+
+
+@pytest.fixture
+def service_graph(sample_edges, tmp_path):
+    g = trace_sewer.Graph(trace_sewer.DIRECTION.U).from_dicts(sample_edges)
+    g.to_snapshot(tmp_path / 'g.graph')
+    return g, tmp_path / 'g.graph'
+
+
+def serve(service, **kwargs):
+    """Run service in a thread, returning its address and a function to stop it."""
+    started = threading.Event()
+    address = {}
+
+    async def run():
+        server = await service.start(**kwargs)
+        address['port'] = server.sockets[0].getsockname()[1] if 'port' in kwargs else None
+        address['stop'] = asyncio.get_running_loop().create_future()
+        started.set()
+        async with server:
+            await address['stop']
+
+    thread = threading.Thread(target=asyncio.run, args=(run(),))
+    thread.start()
+    started.wait(10)
+    loop = address['stop'].get_loop()
+
+    def stop():
+        loop.call_soon_threadsafe(address['stop'].set_result, None)
+        thread.join(10)
+
+    return address['port'], stop
+
+
+def test_trace_service(service_graph):
+    g, path = service_graph
+    service = TraceService(path)
+    port, stop = serve(service, port=0)
+    try:
+        with TraceClient(f'http://127.0.0.1:{port}') as client:
+            assert client.health()['nodes'] == g.index.n_nodes
+            tr = client.trace('E')
+            assert (tr.pipes, tr.nodes) == ({'p1', 'p2', 'p3', 'p4'}, {'A', 'B', 'C', 'D', 'E'})
+            tr_ref = trace_sewer.Trace(g, stop_node={'C'}).trace(['B', 'D'], tag_sources=True)
+            tr = client.trace(['B', 'D'], stop_node={'C'}, tag_sources=True)
+            assert (tr.nodes, tr.end_of_path_nodes) == (tr_ref.nodes, tr_ref.end_of_path_nodes)
+            assert tr.node_sources == tr_ref.node_sources
+            assert client.trace('E', direction=trace_sewer.DIRECTION.D).nodes == {'E'}
+
+            assert client.reaches('E', 'A')
+            assert not client.reaches('E', 'A', stop_pipes=['p1', 'p2'])
+            catchment = client.catchment('C')
+            assert catchment['nodes'] == client.catchment(catchment['outfall'])['nodes']
+
+            with pytest.raises(ValueError, match='Cannot parse condition'):
+                client.trace('E', stop_node='NOT A CONDITION (')
+            with pytest.raises(ValueError, match='missing'):
+                client.catchment('missing')
+    finally:
+        stop()
+
+
+def test_trace_service_reload(service_graph, tmp_path):
+    g, path = service_graph
+    service = TraceService(path, reload_interval=0.01)
+    port, stop = serve(service, unix_socket=tmp_path / 'trace.sock')
+    try:
+        with TraceClient(unix_socket=tmp_path / 'trace.sock') as client:
+            assert client.trace('E').node_count == 5
+            g.add_edge('E', 'F', 'p5')
+            g.to_snapshot(path)
+            deadline = time.monotonic() + 10
+            while client.health()['version'] == 1 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            assert client.trace('F').node_count == 6
+    finally:
+        stop()
@@ -0,0 +1,37 @@
+import numpy as np
+import pandas as pd
+from gww_gis_tools.trace_gis import trace_sewer
+from gww_gis_tools.trace_gis.overlay import GraphOverlay
+
+
+def test_snapshot(sample_edges, tmp_path):
+    g = trace_sewer.Graph(trace_sewer.DIRECTION.U, bidirectional=True).from_dicts(sample_edges)
+    g.add_edge('E', 'F', 'p5', 105)
+    g.add_parcels(pd.DataFrame({'PIPE_ID': ['p1', 'p3'], 'PRCL_GID': [10, 30]}))
+    g.to_snapshot(tmp_path / 'g.graph')
+
+    g_snap = trace_sewer.Graph.from_file(tmp_path / 'g.graph')
+    assert isinstance(g_snap.index.targets, np.memmap)
+    assert g_snap.is_compact and g_snap.bidirectional
+    assert g_snap.direction == trace_sewer.DIRECTION.U
+    assert dict(g_snap.nodes) == dict(g.nodes)
+    assert dict(g_snap.reverse_nodes) == dict(g.reverse_nodes)
+    assert g_snap.qgis_fids == {'p5': 105}
+    assert trace_sewer.Trace(g_snap).trace('F').parcels() == {10, 30}
+
+    # read-only arrays: edits go to dictionaries or overlays
+    tr = trace_sewer.Trace(GraphOverlay(g_snap).remove_edge('p4')).trace('F')
+    assert tr.nodes == {'E', 'F'}
+    g_snap.add_edge('F', 'G', 'p6')
+    assert trace_sewer.Trace(g_snap).trace('G').node_count == 7
+
+
+def test_snapshot_mixed_ids(tmp_path):
+    g = trace_sewer.Graph(trace_sewer.DIRECTION.D).from_gdf(
+        pd.DataFrame({'START_NODE': [0, 1], 'END_NODE': [1, 2]}), compact=True,
+    )
+    g = GraphOverlay(g).add_edge(2, 'X', 'dummy1').to_graph()
+    g.to_snapshot(tmp_path / 'g.graph')
+    g_snap = trace_sewer.Graph.from_file(tmp_path / 'g.graph')
+    assert dict(g_snap.nodes) == dict(g.nodes)
+    assert trace_sewer.Trace(g_snap).trace(0).nodes == {0, 1, 2, 'X'}
@@ -0,0 +1,324 @@
+import json
+import time
+
+import pandas as pd
+import pytest
+from gww_gis_tools.trace_gis import trace_sewer
+
+
+@pytest.fixture()
+def g_up(sample_edges):
+    return trace_sewer.Graph(trace_sewer.DIRECTION.U).from_dicts(sample_edges)
+
+
+@pytest.fixture()
+def g_down(sample_edges):
+    return trace_sewer.Graph(trace_sewer.DIRECTION.D).from_dicts(sample_edges)
+
+
+def test_trace_upstream(g_up):
+    tr = trace_sewer.Trace(g_up).trace('E')
+    assert tr.nodes == {'A', 'B', 'C', 'D', 'E'}
+    assert tr.pipes == {'p1', 'p2', 'p3', 'p4'}
+    assert tr.end_of_path_nodes == {'A', 'D'}
+
+
+def test_trace_downstream(g_down):
+    tr = trace_sewer.Trace(g_down).trace('A')
+    assert tr.nodes == {'A', 'B', 'C', 'E'}
+    assert tr.pipes == {'p1', 'p2', 'p4'}
+    assert tr.end_of_path_nodes == {'E'}
+
+
+def test_trace_stop_node(g_up):
+    tr = trace_sewer.Trace(g_up, stop_node=lambda x: x == 'B').trace('E')
+    assert tr.nodes == {'B', 'C', 'D', 'E'}
+    assert tr.end_of_path_nodes == {'B', 'D'}
+
+
+def test_trace_missing_node(g_up):
+    tr = trace_sewer.Trace(g_up).trace('missing')
+    assert tr.nodes == {'missing'}
+    assert tr.end_of_path_nodes == {'missing'}
+    assert not tr.pipes
+
+
+def test_trace_compact(g_up):
+    tr = trace_sewer.Trace(g_up).trace('E')
+    tr_compact = trace_sewer.Trace(g_up.compact()).trace('E')
+    assert tr.nodes == tr_compact.nodes
+    assert tr.pipes == tr_compact.pipes
+    assert tr.end_of_path_nodes == tr_compact.end_of_path_nodes
+
+
+def test_trace_opposite_direction(g_up, g_down):
+    tr = trace_sewer.Trace(g_up, direction=trace_sewer.DIRECTION.D).trace('A')
+    tr_down = trace_sewer.Trace(g_down).trace('A')
+    assert tr.nodes == tr_down.nodes
+    assert tr.pipes == tr_down.pipes
+    assert tr.end_of_path_nodes == tr_down.end_of_path_nodes
+
+
+def test_trace_many(g_up, g_down):
+    summary = trace_sewer.Trace(g_up).trace_all()
+    assert set(summary.index) == {'A', 'B', 'C', 'D', 'E'}
+    for node in summary.index:
+        tr = trace_sewer.Trace(g_up).trace(node)
+        assert summary.loc[node, 'node_count'] == len(tr.nodes)
+        assert summary.loc[node, 'end_of_path_nodes'] == tr.end_of_path_nodes
+
+    summary = trace_sewer.Trace(g_down).trace_many(['A', 'D', 'missing'])
+    assert summary.loc['A', 'node_count'] == 4
+    assert summary.loc['A', 'end_of_path_nodes'] == frozenset({'E'})
+    assert summary.loc['missing', 'node_count'] == 1
+    assert summary.loc['missing', 'end_of_path_nodes'] == frozenset({'missing'})
+
+
+def test_trace_many_empty_graph():
+    summary = trace_sewer.Trace(trace_sewer.Graph(trace_sewer.DIRECTION.D)).trace_many(['X', 'Y'])
+    assert summary['node_count'].tolist() == [1, 1]
+    assert summary.loc['X', 'end_of_path_nodes'] == frozenset({'X'})
+    assert trace_sewer.Trace(trace_sewer.Graph(trace_sewer.DIRECTION.D)).trace_many([]).empty
+
+
+def test_trace_all_scales_on_trees():
+    # a main line of 10k manholes with a lateral into each: 20k nodes, depth 10k
+    n = 10_000
+    main = [f'm{i}' for i in range(n)]
+    links = pd.DataFrame({
+        'START_NODE': main[1:] + [f'l{i}' for i in range(n)],
+        'END_NODE': main[:-1] + main,
+    })
+    g = trace_sewer.Graph(trace_sewer.DIRECTION.D).from_gdf(links, compact=True)
+
+    start = time.perf_counter()
+    summary = trace_sewer.Trace(g).trace_all()
+    assert time.perf_counter() - start < 5  # a search below every node takes minutes
+    assert summary.loc['m0', 'node_count'] == 1
+    assert summary.loc[f'm{n - 1}', 'node_count'] == n
+    assert summary.loc[f'l{n - 1}', 'node_count'] == n + 1
+    assert summary.loc['l5', 'end_of_path_nodes'] == frozenset({'m0'})
+
+    # upstream, every main line node splits: end sets are only built when used
+    g = trace_sewer.Graph(trace_sewer.DIRECTION.U).from_gdf(links, compact=True)
+    start = time.perf_counter()
+    summary = trace_sewer.Trace(g).trace_all()
+    assert time.perf_counter() - start < 5
+    assert summary.loc['m0', 'node_count'] == 2 * n
+    ends = summary.loc[f'm{n - 2}', 'end_of_path_nodes']
+    assert isinstance(ends, trace_sewer.EndOfPathNodes)
+    assert ends == {f'l{n - 2}', f'l{n - 1}'}
+    assert ends | {'x'} == frozenset({f'l{n - 2}', f'l{n - 1}', 'x'})
+    assert hash(ends) == hash(frozenset(ends))
+    assert len(summary.loc['m0', 'end_of_path_nodes']) == n
+
+
+def test_trace_many_loop(g_down):
+    g_down.add_edge('E', 'A', 'p5')
+    summary = trace_sewer.Trace(g_down).trace_many(['A', 'D'])
+    assert summary.loc['A', 'node_count'] == 4
+    assert summary.loc['D', 'node_count'] == 5
+    assert summary.loc['D', 'end_of_path_nodes'] == frozenset()
+
+
+def test_trace_multiple_sources(g_down):
+    tr = trace_sewer.Trace(g_down).trace(['A', 'D', 'missing'], tag_sources=True)
+    assert tr.nodes == {'A', 'B', 'C', 'D', 'E', 'missing'}
+    assert tr.pipes == {'p1', 'p2', 'p3', 'p4'}
+    assert tr.end_of_path_nodes == {'E', 'missing'}
+    assert tr.node_sources == {
+        'A': 'A', 'B': 'A', 'C': 'A', 'E': 'A', 'D': 'D', 'missing': 'missing',
+    }
+    assert tr.pipe_sources == {'p1': 'A', 'p2': 'A', 'p4': 'A', 'p3': 'D'}
+    assert trace_sewer.Trace(g_down).trace(['A']).node_sources is None
+
+
+def test_trace_stop_pipes(g_up):
+    trace = trace_sewer.Trace(g_up, stop_pipes=['p3'])
+    tr = trace.trace('E')
+    assert tr.nodes == {'A', 'B', 'C', 'E'}
+    assert tr.pipes == {'p1', 'p2', 'p4'}
+    assert tr.end_of_path_nodes == {'A'}
+
+    summary = trace.trace_many(['E'])
+    assert summary.loc['E', 'node_count'] == len(tr.nodes)
+    assert summary.loc['E', 'end_of_path_nodes'] == tr.end_of_path_nodes
+
+    tr = trace.trace('D')
+    assert tr.nodes == {'D'}
+    assert tr.end_of_path_nodes == {'D'}
+
+
+def test_trace_conditions(g_up):
+    g_up.add_node_attributes(pd.DataFrame({
+        'NODE_ID': ['A', 'B', 'C', 'D', 'E'],
+        'NODE_REF': ['MH1', 'SPS2', 'MH3', 'MH4', 'MH5'],
+    }))
+    g_up.add_pipe_attributes(pd.DataFrame({
+        'PIPE_ID': ['p1', 'p2', 'p3', 'p4'],
+        'PIPE_DIA': [150, 300, 225, 375],
+    }))
+    assert g_up.select_nodes("NODE_REF startswith 'SPS'") == ['B']
+
+    tr = trace_sewer.Trace(g_up, stop_node="NODE_REF startswith 'SPS'").trace('E')
+    assert tr.nodes == {'B', 'C', 'D', 'E'}
+    assert tr.end_of_path_nodes == {'B', 'D'}
+
+    tr = trace_sewer.Trace(g_up, pipe_filter='PIPE_DIA >= 300').trace('E')
+    assert tr.nodes == {'B', 'C', 'E'}
+    assert tr.pipes == {'p2', 'p4'}
+
+    tr = trace_sewer.Trace(g_up, stop_pipes='PIPE_DIA == 225').trace('E')
+    assert 'D' not in tr.nodes
+
+
+def test_trace_compact_result(g_down):
+    trace = trace_sewer.Trace(g_down)
+    tr_a = trace.trace('A', compact=True)
+    tr_d = trace.trace(['D', 'missing'], compact=True)
+    assert tr_a.is_compact
+    assert tr_a.node_count == 4
+    assert tr_a.nodes == trace.trace('A').nodes
+    assert tr_d.end_of_path_nodes == {'E', 'missing'}
+
+    union = tr_a | tr_d
+    assert union.is_compact
+    assert union.nodes == {'A', 'B', 'C', 'D', 'E', 'missing'}
+    assert (tr_a & tr_d).nodes == {'C', 'E'}
+    assert (tr_a & tr_d).pipes == {'p4'}
+    assert (tr_d - tr_a).nodes == {'D', 'missing'}
+    assert (tr_d - tr_a).end_of_path_nodes == {'missing'}
+
+    mixed = tr_a & trace.trace('D')
+    assert not mixed.is_compact
+    assert mixed.nodes == {'C', 'E'}
+
+
+def test_trace_cache(g_down):
+    trace = trace_sewer.Trace(g_down, cache_size=2)
+    tr = trace.trace('A')
+    assert trace.trace('A') is tr
+    assert trace.cache_info() == trace_sewer.CacheInfo(hits=1, misses=1, maxsize=2, currsize=1)
+
+    trace.trace('B')
+    trace.trace('D')
+    assert trace.cache_info().currsize == 2
+    assert trace.trace('A') is not tr  # least recently used, dropped
+
+    version = g_down.version
+    g_down.add_edge('E', 'F', 'p5')
+    assert g_down.version > version
+    tr = trace.trace('A')
+    assert 'F' in tr.nodes
+    assert trace.cache_info().currsize == 1
+
+    assert trace_sewer.Trace(g_down, cache_size=0).trace('A') is not tr
+
+    # off by default: every trace returns its own result
+    trace = trace_sewer.Trace(g_down)
+    tr = trace.trace('A')
+    tr.nodes.add('X')
+    assert trace.trace('A') is not tr
+    assert 'X' not in trace.trace('A').nodes
+    assert trace.cache_info().maxsize == 0
+
+
+def test_path(g_up):
+    path = trace_sewer.Trace(g_up).path('E', 'A')
+    assert path.found
+    assert path.nodes == ['E', 'C', 'B', 'A']
+    assert path.pipes == ['p4', 'p2', 'p1']
+    assert trace_sewer.Trace(g_up).path('E', 'E').nodes == ['E']
+
+    missing = trace_sewer.Trace(g_up, stop_pipes=['p2']).path('E', 'A')
+    assert not missing.found
+    assert missing.frontier == ['C', 'D']
+    assert trace_sewer.Trace(g_up).path('A', 'E').frontier == ['A']
+
+    # a node not in the graph: trace visits it alone, so it is a path to itself
+    path = trace_sewer.Trace(g_up).path('missing', 'missing')
+    assert (path.found, path.nodes, path.pipes, path.length) == (True, ['missing'], [], 0)
+    assert trace_sewer.Trace(g_up).trace('missing').nodes == set(path.nodes)
+    assert not trace_sewer.Trace(g_up).path('missing', 'A').found
+
+
+def test_parcels(g_up):
+    branches = pd.DataFrame({
+        'SERV_ID': [1, 2, 3, 4, 5],
+        'PIPE_ID': ['p1', 'p1', 'p3', 'p4', 'x'],
+        'PRCL_GID': [10, 11, 30, 11, 99],
+    })
+    g_up.add_parcels(branches)
+    assert g_up.parcels.pipe_counts().to_dict() == {'p1': 2, 'p3': 1, 'p4': 1, 'x': 1}
+
+    tr = trace_sewer.Trace(g_up).trace('C')
+    assert tr.parcels() == {10, 11, 30}
+    assert trace_sewer.Trace(g_up).trace('C', compact=True).parcel_count() == 3
+    assert (tr - trace_sewer.Trace(g_up).trace('B')).parcels() == {30}
+    assert trace_sewer.Trace(g_up).trace('A').parcel_count() == 0
+
+    g_up.add_parcels(branches.assign(PIPE_ID='p2'), parcel_id='SERV_ID')
+    assert trace_sewer.Trace(g_up).trace('C').parcels() == {10, 11, 30, 1, 2, 3, 4, 5}
+
+    encoded = json.dumps(g_up.parcels, cls=trace_sewer.ExtendedEncoder)
+    decoded = json.loads(encoded, cls=trace_sewer.ExtendedDecoder)
+    assert decoded.to_pairs() == g_up.parcels.to_pairs()
+    with pytest.raises(ValueError):
+        trace_sewer.Trace(trace_sewer.Graph(trace_sewer.DIRECTION.U).add_edge('A', 'B', 'p1')).trace('B').parcels()
+
+
+def test_trace_result_json(g_down):
+    tracer = trace_sewer.Trace(g_down)
+    for tr in (tracer.trace(['A', 'D', 'missing'], tag_sources=True, compact=True), tracer.trace('B', summary=True)):
+        decoded = json.loads(json.dumps(tr, cls=trace_sewer.ExtendedEncoder), cls=trace_sewer.ExtendedDecoder)
+        assert (decoded.pipes, decoded.nodes, decoded.end_of_path_nodes) == (tr.pipes, tr.nodes, tr.end_of_path_nodes)
+        assert (decoded.node_sources, decoded.pipe_sources) == (tr.node_sources, tr.pipe_sources)
+        assert decoded.trace_summary == tr.trace_summary
+
+
+def test_trace_levels(g_up):
+    tracer = trace_sewer.Trace(g_up)
+    tr = tracer.trace_levels('E')
+    assert (tr.nodes, tr.pipes, tr.end_of_path_nodes) == ({'A', 'B', 'C', 'D', 'E'}, {'p1', 'p2', 'p3', 'p4'}, {'A', 'D'})
+    assert tr.levels['nodes'].tolist() == [1, 1, 2, 1]
+    assert tr.levels['pipes'].tolist() == [1, 2, 1, 0]
+    assert tr.levels['expanded'].all()
+
+    tr = tracer.trace_levels('E', max_depth=2, compact=True)
+    assert tr.nodes == {'B', 'C', 'D', 'E'}
+    assert tr.pipes == {'p2', 'p3', 'p4'}
+    assert tr.end_of_path_nodes == {'D'}
+    assert tr.levels['expanded'].tolist() == [True, True, False]
+
+    tr = tracer.trace_levels('E', max_pipes=2)
+    assert (tr.pipes, tr.nodes) == ({'p4', 'p2'}, {'E', 'C', 'B'})
+    tr = tracer.trace_levels(['missing'])
+    assert (tr.nodes, tr.levels['nodes'].tolist()) == ({'missing'}, [1])
+
+    tracer = trace_sewer.Trace(g_up, stop_node=lambda x: x == 'C')
+    assert tracer.trace_levels('E').nodes == tracer.trace('E').nodes == {'C', 'E'}
+
+
+def test_iter_trace(g_up):
+    tracer = trace_sewer.Trace(g_up, stop_pipes=['p3'])
+    steps = list(tracer.iter_trace(['E', 'missing']))
+    tr = tracer.trace(['E', 'missing'])
+    assert [step.node for step in steps][:2] == ['E', 'C']
+    assert {step.node for step in steps} == tr.nodes
+    assert {pipe for step in steps for pipe in step.pipes} == tr.pipes
+    assert {step.node for step in steps if step.end_of_path} == tr.end_of_path_nodes
+    assert steps[0] == trace_sewer.TraceStep('E', ['p4'], False)
+
+    # stop consuming: the rest is not walked
+    first = next(step for step in tracer.iter_trace('E') if step.end_of_path)
+    assert first.node == 'A'
+
+
+def test_reaches(g_up, g_down):
+    assert trace_sewer.Trace(g_up).reaches('E', 'A')
+    assert not trace_sewer.Trace(g_up).reaches('A', 'E')
+    assert trace_sewer.Trace(g_down).reaches('A', 'E')
+    assert not trace_sewer.Trace(g_down, stop_node=lambda x: x == 'C').reaches('A', 'E')
+    assert not trace_sewer.Trace(g_down, stop_pipes=['p2']).reaches('A', 'E')
+    assert trace_sewer.Trace(g_down).reaches('missing', 'missing')
+    assert not trace_sewer.Trace(g_down).reaches('A', 'missing')
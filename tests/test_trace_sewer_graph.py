@@ -83,3 +83,165 @@ def from_file(sample_pipe_dicts, sample_data_path):
     assert g.direction == g_unserialised.direction
     assert g.nodes == g_unserialised.nodes
     assert g.pipes == g_unserialised.pipes
+
+
+def test_index(sample_edges):
+    g_u = trace_sewer.Graph(trace_sewer.DIRECTION.U).from_dicts(sample_edges)
+    index = g_u.index
+    assert index.n_nodes == 5
+    assert index.n_edges == 4
+    c = index.node_position('C')
+    assert index.node_labels(index.targets[index.offsets[c]:index.offsets[c + 1]]) == ['B', 'D']
+    assert index.node_position('missing') == -1
+
+    # edits invalidate the index
+    g_u.add_edge('E', 'F', 'p5')
+    assert g_u.index.n_nodes == 6
+
+
+def test_compact(sample_edges):
+    g_u = trace_sewer.Graph(trace_sewer.DIRECTION.U).from_dicts(sample_edges)
+    expected_nodes, expected_pipes = dict(g_u.nodes), dict(g_u.pipes)
+
+    g_u = g_u.compact()
+    assert g_u.is_compact
+    assert dict(g_u.nodes) == expected_nodes
+    assert dict(g_u.pipes) == expected_pipes
+    assert g_u.nodes['A'] == []
+    assert g_u.nodes.get('A') is None
+    assert 'C' in g_u.nodes
+
+    g_u.add_edge('E', 'F', 'p5')
+    assert not g_u.is_compact
+    assert g_u.nodes['F'] == ['E']
+
+
+def test_index_mixed_ids():
+    # from_gdf without asset_id uses row numbers as pipe ids, corrections add text ids
+    g_d = trace_sewer.Graph(trace_sewer.DIRECTION.D)
+    g_d.add_edge(0, 1, 0).add_edge(1, 2, 1).add_edge(2, 'X', 'dummy1')
+    index = g_d.index
+    assert index.node_position(2) >= 0
+    assert index.node_position('2') == -1
+    assert sorted(index.pipe_labels(range(index.n_pipes)), key=str) == [0, 1, 'dummy1']
+    assert trace_sewer.Trace(g_d).trace(0).nodes == {0, 1, 2, 'X'}
+
+
+def test_from_gdf_bulk(sample_pipe_df: pd.DataFrame):
+    links = sample_pipe_df.assign(qgis_fid=range(1, len(sample_pipe_df.index) + 1))
+    for direction in trace_sewer.DIRECTION:
+        g_ref = trace_sewer.Graph(direction)
+        for row in links.itertuples():
+            g_ref.add_edge(row.start_node, row.end_node, row.pipe_id, row.qgis_fid)
+
+        kwargs = {'start_id': 'start_node', 'end_id': 'end_node', 'asset_id': 'pipe_id', 'fid_id': 'qgis_fid'}
+        g = trace_sewer.Graph(direction).from_gdf(links, **kwargs)
+        assert dict(g.nodes) == dict(g_ref.nodes)
+        assert dict(g.pipes) == dict(g_ref.pipes)
+        assert g.qgis_fids == g_ref.qgis_fids
+
+        g_compact = trace_sewer.Graph(direction).from_gdf(links, compact=True, **kwargs)
+        assert g_compact.is_compact
+        assert dict(g_compact.nodes) == dict(g_ref.nodes)
+
+
+def test_from_gdf_extends(sample_edges):
+    links = pd.DataFrame(sample_edges)
+    g_u = trace_sewer.Graph(trace_sewer.DIRECTION.U)
+    g_u = g_u.from_gdf(links.iloc[:2], asset_id='PIPE_ID').from_gdf(links.iloc[2:], asset_id='PIPE_ID')
+    g_ref = trace_sewer.Graph(trace_sewer.DIRECTION.U).from_dicts(sample_edges)
+    assert dict(g_u.nodes) == dict(g_ref.nodes)
+    assert dict(g_u.pipes) == dict(g_ref.pipes)
+
+
+def test_bidirectional(sample_edges):
+    g_d = trace_sewer.Graph(trace_sewer.DIRECTION.D).from_dicts(sample_edges)
+    g_b = trace_sewer.Graph(trace_sewer.DIRECTION.U, bidirectional=True).from_dicts(sample_edges)
+    assert dict(g_b.reverse_nodes) == dict(g_d.nodes)
+    assert dict(g_b.reverse_pipes) == dict(g_d.pipes)
+
+    g_b_bulk = trace_sewer.Graph(trace_sewer.DIRECTION.U, bidirectional=True)
+    g_b_bulk = g_b_bulk.from_gdf(pd.DataFrame(sample_edges), asset_id='PIPE_ID', compact=True)
+    assert dict(g_b_bulk.reverse_nodes) == dict(g_d.nodes)
+
+
+def test_degree(sample_edges):
+    g_u = trace_sewer.Graph(trace_sewer.DIRECTION.U).from_dicts(sample_edges)
+    assert g_u.degree('C') == (2, 1)
+    assert g_u.degree('E') == (1, 0)
+    assert g_u.degree('missing') == (0, 0)
+
+    table = g_u.degree_table(['A', 'C', 'E', 'missing'])
+    assert table['NODE_ID'].tolist() == ['A', 'C', 'E', 'missing']
+    assert table['class'].tolist() == ['0-1', '2-1', '1-0', '0-0']
+    assert len(g_u.degree_table().index) == 5
+
+
+def test_pipe_end_table(sample_edges):
+    pipes = pd.DataFrame(sample_edges).assign(
+        START_INVELEV=[8, 6, None, 5],
+        END_INVELEV=[7, 7, 6, 4],
+        START_COVELEV=[10, 8, 12.05, 8],
+        END_COVELEV=[9, 9, 8, 7],
+    ).set_index(pd.Index([10, 20, 30, 40]))
+    nodes = pd.DataFrame({
+        'NODE_ID': ['A', 'B', 'C', 'D', 'A'],
+        'NODE_TYPE': ['MH', 'MH', 'JUNCTION', 'MH', 'OTHER'],
+        'NODE_DEPTH': [2.0, 2.0, 3.0, 1.0, 9.0],
+        'NODE_COVELEV': [10, 9, 8, 12, 0],
+    })
+    g = trace_sewer.Graph(trace_sewer.DIRECTION.U).from_gdf(pipes, asset_id='PIPE_ID')
+
+    table = g.pipe_end_table(pipes, nodes)
+    assert table.index.tolist() == [10, 20, 30, 40]
+    assert table['flows_downhill'].tolist() == [True, False, False, True]
+    assert table['abs_drop'].tolist()[:2] == [1, 1]
+    assert table['start_node_type'].tolist() == ['MH', 'MH', 'MH', 'JUNCTION']
+    assert table['start_node_floor'].tolist() == [8, 7, 11, 5]
+    assert table['start_node_class'].tolist() == ['0-1', '1-1', '0-1', '2-1']
+    assert table['start_node_match'].tolist() == [True, False, False, True]
+    assert table['end_node_match'].tolist() == [True, False, True, False]
+    assert table['transposed_nodes'].tolist() == [False, True, False, False]
+    # E is not in nodes
+    assert table.loc[40, ['end_node_found', 'end_node_type', 'end_node_depth', 'end_node_class']].tolist() == [
+        False, 'else', 0, 'else',
+    ]
+    assert g.pipe_end_table(pipes, nodes, tolerance=0.1)['start_node_match'][30]
+
+
+def test_find_cycles(sample_edges):
+    g = trace_sewer.Graph(trace_sewer.DIRECTION.U).from_dicts(sample_edges)
+    assert g.find_cycles().empty
+    assert g.scc().nunique() == 5
+
+    g.add_edge('E', 'B', 'p5').add_edge('D', 'D', 'p6')
+    cycles = g.find_cycles()
+    assert cycles['node_count'].tolist() == [3, 1]
+    assert sorted(cycles['nodes'][0]) == ['B', 'C', 'E']
+    assert sorted(cycles['pipes'][0]) == ['p2', 'p4', 'p5']
+    assert cycles['pipes'][1] == ['p6']
+
+    scc = g.scc()
+    assert scc['B'] == scc['C'] == scc['E'] != scc['A']
+
+
+def test_flow_paths(sample_edges):
+    g = trace_sewer.Graph(trace_sewer.DIRECTION.U).from_dicts(sample_edges).add_edge('A', 'E', 'p5')
+    g.add_pipe_attributes(pd.DataFrame({'PIPE_ID': ['p1', 'p2', 'p3', 'p4', 'p5'], 'GEOM_LENGTH': [10, 5, 1, 2, 30]}))
+    path = g.shortest_path('A', 'GEOM_LENGTH')
+    assert (path.nodes, path.pipes, path.length) == (['A', 'B', 'C', 'E'], ['p1', 'p2', 'p4'], 17)
+    assert g.shortest_path('A').pipes == ['p5']
+    assert g.longest_flow_path('A', 'GEOM_LENGTH').pipes == ['p5']
+    assert g.longest_flow_path('A').pipes == ['p1', 'p2', 'p4']
+    assert not g.shortest_path('missing').found
+
+    shortest = g.distance_to_outfall('GEOM_LENGTH')
+    assert shortest.to_dict() == {'A': 17, 'B': 7, 'C': 2, 'D': 3, 'E': 0}
+    assert g.distance_to_outfall('GEOM_LENGTH', how='longest')['A'] == 30
+    with pytest.raises(ValueError):
+        g.distance_to_outfall({'p1': 1})
+
+    # loops are crossed, not travelled around
+    g.add_edge('C', 'B', 'p6')
+    assert g.longest_flow_path('A').pipes == ['p1', 'p2', 'p4']
+    assert g.longest_flow_path('C', default=1).nodes == ['C', 'E']